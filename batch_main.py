@@ -0,0 +1,118 @@
+import argparse
+import glob
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List
+
+from core.timing import format_timings
+
+
+# A config file looks like:
+#
+# {
+#     "worlds": [
+#         {"name": "salocaia", "players": ["threshprince", "Igazsag"]},
+#         {"name": "other", "zips": ["Forge_other.zip"], "players": ["someone"]},
+#         {"name": "third", "archive": "Forge*.zip", "players": []}
+#     ]
+# }
+#
+# Worlds with "zips" are read from NeDB exports (main.py). Worlds with an
+# "archive" (a path or glob) are read from whatever `core.sources.open_source`
+# finds there: an export in either format, without unzipping it, a world
+# directory or a snapshot. Everything else is read from the unzipped LevelDB
+# world directory (leveldb_main.py).
+def load_config(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        config = json.load(f)
+    worlds = config["worlds"]
+    for world in worlds:
+        if "name" not in world:
+            raise ValueError(f"World without a name in {path}: {world}")
+        world.setdefault("players", [])
+        if "archive" in world:
+            matches = sorted(glob.glob(world["archive"]))
+            if len(matches) == 0:
+                raise ValueError(f"No archive matches {world['archive']}")
+            world["archive"] = matches[-1]
+    return worlds
+
+
+def run_world(world: Dict[str, Any], compress: bool) -> Dict[str, Any]:
+    # Imported here so each pool worker only pays for the reader it needs,
+    # and only once no matter how many worlds it ends up processing
+    start = time.perf_counter()
+    result = {"world": world["name"]}
+    try:
+        if "archive" in world:
+            from core import pipeline
+            from core.sources import open_source
+
+            timings = pipeline.run(
+                open_source(world["archive"], world["name"]),
+                world["name"],
+                world["players"],
+                compress,
+            )
+        elif "zips" in world:
+            import main
+
+            timings = main.run(
+                world["zips"], world["name"], world["players"], compress
+            )
+        else:
+            import leveldb_main
+
+            timings = leveldb_main.run(world["name"], world["players"], compress)
+        result["timings"] = timings
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_batch(
+    worlds: List[Dict[str, Any]], jobs: int | None = None, compress: bool = False
+) -> Dict[str, Any]:
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_world, world, compress) for world in worlds]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if "error" in result:
+                print(f"{result['world']}: failed: {result['error']}")
+            else:
+                print(f"{result['world']}:\n{format_timings(result['timings'])}")
+
+    order = [world["name"] for world in worlds]
+    results.sort(key=lambda r: order.index(r["world"]))
+    return {
+        "seconds": time.perf_counter() - start,
+        "worlds": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate stats for many worlds")
+    parser.add_argument("config", help="JSON file listing the worlds to process")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes")
+    parser.add_argument("--compress", action="store_true")
+    parser.add_argument(
+        "--summary",
+        default="./batch_summary.json",
+        help="where to write the combined timing summary",
+    )
+    args = parser.parse_args()
+
+    summary = run_batch(load_config(args.config), args.jobs, args.compress)
+    with open(args.summary, "w") as f:
+        print(args.summary)
+        json.dump(summary, f, indent=4)
+
+    print(f"{len(summary['worlds'])} worlds in {summary['seconds']:.3f}s")
+    if any("error" in result for result in summary["worlds"]):
+        sys.exit(1)
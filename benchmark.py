@@ -0,0 +1,270 @@
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import synthetic
+from core.timing import format_timings
+
+# Runs a made-up world (see synthetic.py) through the whole pipeline a few
+# times and compares each stage's timings with a committed baseline:
+#
+#   benchmark.py            exit 1 if a stage got slower than the baseline
+#   benchmark.py --save     record the current timings as the new baseline
+#
+# Everything happens in a temporary directory, without the network. Runs
+# are compared by their median and spread by the median absolute deviation
+# (MAD), which one slow outlier does not move.
+#
+# The baseline only means something on the machine it was recorded on. With
+# --normalize, timings are first scaled by how long a fixed calibration
+# workload took on either machine, which roughly allows for a different
+# machine, at the price of the calibration's own noise. After a change of
+# machine or Python, better record a new baseline.
+
+BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json"
+)
+BASELINE_VERSION = 1
+SEED = 1
+MESSAGES = 20000
+REPEATS = 7
+# How much slower than the baseline a stage may get
+THRESHOLD = 0.25
+# Stages quicker than this in the baseline are all noise and never fail
+MIN_SECONDS = 0.02
+# A slowdown must also exceed this many MADs, of either run
+NOISE_MADS = 3
+
+
+def calibrate() -> float:
+    # A fixed workload shaped like the pipeline's: JSON parsing, small dicts
+    data = json.dumps(
+        [
+            {"_id": i, "results": [{"result": i % 20, "active": True}]}
+            for i in range(20000)
+        ]
+    )
+    best = float("inf")
+    for _ in range(5):
+        # The quickest try is the one least disturbed by anything else
+        start = time.perf_counter()
+        totals: Dict[int, int] = {}
+        for d in json.loads(data):
+            key = d["_id"] % 7
+            totals[key] = totals.get(key, 0) + d["results"][0]["result"]
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_once(archive: str, directory: str) -> Dict[str, float]:
+    # The pipeline writes under the working directory; start from nothing so
+    # that every run does the same work
+    from core import pipeline
+    from core.sources import NedbZipSource
+
+    cwd = os.getcwd()
+    os.makedirs(f"{directory}/public")
+    os.chdir(directory)
+    # Or the previous run's garbage is collected during some stage of this one
+    gc.collect()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            timings = pipeline.run(
+                NedbZipSource([archive]), "benchmark", synthetic.PLAYERS
+            )
+    finally:
+        os.chdir(cwd)
+    timings["total"] = sum(timings.values())
+    return timings
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    median = statistics.median(samples)
+    mad = statistics.median([abs(sample - median) for sample in samples])
+    return {"median": round(median, 6), "mad": round(mad, 6)}
+
+
+def measure(seed: int, messages: int, repeats: int) -> Dict[str, Any]:
+    """
+    Timings of `repeats` runs of the world `seed`, after one warm-up run,
+    as a baseline file holds them.
+    """
+    samples: Dict[str, List[float]] = {}
+    calibration = []
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as directory:
+        archive = f"{directory}/world.zip"
+        synthetic.write_nedb_zip(archive, *synthetic.world(seed, messages))
+        run_once(archive, f"{directory}/warmup")
+        for i in range(repeats):
+            calibration.append(calibrate())
+            timings = run_once(archive, f"{directory}/run{i}")
+            print(f"run {i + 1}/{repeats}: {timings['total']:.3f}s", file=sys.stderr)
+            for (stage, seconds) in timings.items():
+                samples.setdefault(stage, []).append(seconds)
+
+    return {
+        "version": BASELINE_VERSION,
+        "world": {"seed": seed, "messages": messages},
+        "repeats": repeats,
+        "python": platform.python_version(),
+        "calibration": summarize(calibration),
+        "stages": {stage: summarize(s) for (stage, s) in samples.items()},
+    }
+
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float,
+    normalize: bool = False,
+) -> List[Dict[str, Any]]:
+    # One row per stage of either run, with current timings scaled to the
+    # baseline's machine if `normalize`
+    scale = 1.0
+    if normalize:
+        scale = baseline["calibration"]["median"] / current["calibration"]["median"]
+    rows = []
+    for stage in list(baseline["stages"]) + [
+        s for s in current["stages"] if s not in baseline["stages"]
+    ]:
+        row: Dict[str, Any] = {"stage": stage, "status": "ok"}
+        old = baseline["stages"].get(stage)
+        new = current["stages"].get(stage)
+        if old is not None:
+            row["baseline"] = old["median"]
+        if new is not None:
+            row["current"] = new["median"] * scale
+            row["mad"] = new["mad"] * scale
+        if old is None:
+            row["status"] = "new"
+        elif new is None:
+            row["status"] = "missing"
+        else:
+            row["change"] = row["current"] / old["median"] - 1 if old["median"] else 0
+            noise = NOISE_MADS * max(old["mad"], row["mad"])
+            if (
+                old["median"] >= MIN_SECONDS
+                and row["change"] > threshold
+                and row["current"] - old["median"] > noise
+            ):
+                row["status"] = "REGRESSED"
+            elif old["median"] >= MIN_SECONDS and row["change"] < -threshold:
+                row["status"] = "faster"
+        rows.append(row)
+    return rows
+
+
+def format_rows(rows: List[Dict[str, Any]]) -> str:
+    def seconds(value: float | None) -> str:
+        return "" if value is None else f"{value:.3f}s"
+
+    table = [["stage", "baseline", "current", "change", "MAD", ""]] + [
+        [
+            row["stage"],
+            seconds(row.get("baseline")),
+            seconds(row.get("current")),
+            f"{row['change']:+.1%}" if "change" in row else "",
+            seconds(row.get("mad")),
+            row["status"],
+        ]
+        for row in rows
+    ]
+    widths = [max(len(line[i]) for line in table) for i in range(len(table[0]))]
+    return "\n".join(
+        "  ".join(
+            cell.ljust(width) if i == 0 else cell.rjust(width)
+            for (i, (cell, width)) in enumerate(zip(line, widths))
+        ).rstrip()
+        for line in table
+    )
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        baseline = json.load(f)
+    if baseline.get("version") != BASELINE_VERSION:
+        raise ValueError(f"{path} is not a version {BASELINE_VERSION} baseline")
+    return baseline
+
+
+def save_baseline(path: str, baseline: Dict[str, Any]):
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(baseline, f, indent=4)
+        f.write("\n")
+    os.replace(f"{path}.tmp", path)
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pipeline against a stored baseline"
+    )
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="write a new baseline")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--messages", type=int, default=MESSAGES)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="allowed slowdown per stage, as a fraction (default %(default)s)",
+    )
+    parser.add_argument(
+        "--normalize",
+        action="store_true",
+        help="scale timings by a calibration workload, for another machine",
+    )
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if not args.save:
+        try:
+            baseline = load_baseline(args.baseline)
+        except (FileNotFoundError, ValueError) as e:
+            print(e)
+            return 2
+        world = {"seed": args.seed, "messages": args.messages}
+        if baseline["world"] != world:
+            print(
+                f"{args.baseline} is for the world {baseline['world']}, not {world};"
+                " run with --save to record a new baseline"
+            )
+            return 2
+
+    current = measure(args.seed, args.messages, args.repeats)
+    if baseline is None:
+        save_baseline(args.baseline, current)
+        medians = {s: t["median"] for (s, t) in current["stages"].items()}
+        del medians["total"]
+        print(format_timings(medians))
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if baseline["python"] != current["python"]:
+        print(
+            f"Note: the baseline was recorded with Python {baseline['python']},"
+            f" this is {current['python']}"
+        )
+    rows = compare(baseline, current, args.threshold, args.normalize)
+    print(format_rows(rows))
+    regressed = [row["stage"] for row in rows if row["status"] == "REGRESSED"]
+    if regressed:
+        print(
+            f"{len(regressed)} stages more than {args.threshold:.0%} slower than"
+            f" the baseline: {', '.join(regressed)}"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,170 @@
+import argparse
+import json
+import sys
+from typing import Any, Dict, List
+
+# One entry point for the common jobs:
+#
+#   cli.py build WORLD LOCATION [PLAYER ...]   run the whole pipeline
+#       [--memory-profile FILE]                 ... and profile its memory
+#   cli.py report WORLD [--user U] [...]       numbers from the last build
+#   cli.py query LOCATION [--player P] [...]   ad-hoc stats from the chat log
+#
+# Each subcommand imports what it needs when it runs, so `report` only pays
+# for reading one small JSON file when the build saved the answer already.
+
+
+# Option -> help, as accepted by `query.query_from_params`
+QUERY_OPTIONS = {
+    "player": 'comma separated players, "All" or "All Players"',
+    "start": "ISO date or time, inclusive",
+    "end": "ISO date or time, exclusive",
+    "session": "comma separated session indexes",
+    "category": "comma separated roll types, e.g. attack,skill:ste",
+    "die": "comma separated die faces, e.g. d20",
+    "alias": "comma separated speaker aliases",
+    "markers": '"include" to keep April Fools messages',
+}
+
+
+def build(args: argparse.Namespace) -> int:
+    from core import pipeline
+    from core.sources import open_source
+    from core.memory import MemoryProfile
+    from core.timing import format_timings
+
+    memory = None if args.memory_profile is None else MemoryProfile()
+    try:
+        source = open_source(args.location, args.world_name)
+        timings = pipeline.run(
+            source, args.world_name, args.players, args.compress, memory
+        )
+    except (FileNotFoundError, ValueError) as e:
+        print(e)
+        return 1
+    print(format_timings(timings))
+    if memory is not None:
+        memory.write(args.memory_profile, args.world_name)
+        print(f"Memory profile written to {args.memory_profile}")
+    return 0
+
+
+def report(args: argparse.Namespace) -> int:
+    user = "All" if args.user is None else args.user
+    if args.start is None and args.end is None and args.session is None:
+        if not args.this_month:
+            # Fast path: the all-time numbers saved by the last build
+            from core.rollups import load_report
+
+            rows = load_report(args.world_name, args.directory)
+            if user in rows:
+                print(json.dumps(rows[user], indent=4))
+                return 0
+
+    from datetime import date
+
+    from core.rollups import load_rollups, this_month_vs_all_time
+
+    rollups = load_rollups(args.world_name, args.directory)
+    if rollups.message_count == 0:
+        print(f"No rollups for {args.world_name} in {args.directory}")
+        return 1
+    user = None if user == "All" else user
+    start = None if args.start is None else date.fromisoformat(args.start)
+    end = None if args.end is None else date.fromisoformat(args.end)
+    if args.session is not None:
+        data: Dict[str, Any] = rollups.session_report(args.session, user)
+    elif args.this_month:
+        data = this_month_vs_all_time(rollups, user)
+    else:
+        data = rollups.report(user, start, end)
+    print(json.dumps(data, indent=4))
+    return 0
+
+
+def query(args: argparse.Namespace) -> int:
+    import core.stats
+    from core.sources import load_messages, open_source
+    from core.query import query_from_params
+
+    params = {
+        name: value
+        for (name, value) in vars(args).items()
+        if name in QUERY_OPTIONS and value is not None
+    }
+    try:
+        query = query_from_params(params)
+        source = open_source(args.location, args.world_name)
+        # The cheap predicates already skip records while loading
+        messages = load_messages(source, query)
+    except (FileNotFoundError, ValueError) as e:
+        print(e)
+        return 1
+    messages = query.apply(messages, core.stats)
+    data = core.stats.generate_data(messages)
+    print(
+        json.dumps(
+            {"query": params, "message_count": len(messages), "data": data},
+            indent=4,
+        )
+    )
+    return 0
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Foundry chat log statistics")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="generate a world's stats")
+    build_parser.add_argument("world_name")
+    build_parser.add_argument(
+        "location", help="a world export, world directory or snapshot"
+    )
+    build_parser.add_argument("players", nargs="*")
+    build_parser.add_argument("--compress", action="store_true")
+    build_parser.add_argument(
+        "--memory-profile",
+        metavar="FILE",
+        help="trace allocations and write a per-stage report to FILE (slow)",
+    )
+    build_parser.set_defaults(run=build)
+
+    report_parser = commands.add_parser(
+        "report", help="report from the last build, without reading the chat log"
+    )
+    report_parser.add_argument("world_name")
+    report_parser.add_argument("--directory", default="./rollups")
+    report_parser.add_argument(
+        "--user", help='a player, "All Players", or everyone if omitted'
+    )
+    report_parser.add_argument("--start", help="ISO date")
+    report_parser.add_argument("--end", help="ISO date, exclusive")
+    report_parser.add_argument(
+        "--session", type=int, help="session index, -1 for the latest"
+    )
+    report_parser.add_argument(
+        "--this-month", action="store_true", help="this month vs all time"
+    )
+    report_parser.set_defaults(run=report)
+
+    query_parser = commands.add_parser(
+        "query", help="stats for any subset of a world's chat log"
+    )
+    query_parser.add_argument(
+        "location", help="a world export, world directory or snapshot"
+    )
+    query_parser.add_argument("--world-name", help="the world in a LevelDB export")
+    for (name, help) in QUERY_OPTIONS.items():
+        query_parser.add_argument(f"--{name}", help=help)
+    query_parser.set_defaults(run=query)
+
+    return parser
+
+
+def main(argv: List[str]) -> int:
+    args = parser().parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
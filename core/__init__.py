@@ -0,0 +1,7 @@
+# The parts of the stats pipeline shared by every input format: the chat
+# models (`core.models`), the statistics (`core.stats`, over the counters,
+# sketches and tables in `core.aggregates`), the readers for each kind of
+# world (`core.sources`), the outputs (`core.output`, `core.rollups`,
+# `core.search`) and the full run (`core.pipeline`). core never imports the
+# top-level scripts; main.py, leveldb_main.py and the rest are entry points
+# over it.
@@ -0,0 +1,74 @@
+from typing import Any, Dict, Iterable, List
+
+from core.characters import CharacterTable
+from core.counters import StatsAccumulator
+from core.items import ItemTable
+from core.sketches import Distributions, distribution_rows
+
+
+class Aggregates(object):
+    """
+    Everything published about a set of messages that is accumulated one
+    message at a time: the counters of each character, the distributions of
+    each user, and the item table. A single pass over the messages fills all
+    of them; each user's counters are merged from their characters'.
+    """
+
+    def __init__(self):
+        self.characters = CharacterTable()
+        self.distributions: Dict[str, Distributions] = {}
+        self.items = ItemTable()
+        self._by_user: Dict[str, StatsAccumulator] | None = None
+
+    @staticmethod
+    def from_messages(messages: Iterable[Any]) -> "Aggregates":
+        aggregates = Aggregates()
+        for message in messages:
+            aggregates.add(message)
+        return aggregates
+
+    @property
+    def by_user(self) -> Dict[str, StatsAccumulator]:
+        if self._by_user is None:
+            self._by_user = self.characters.by_user()
+        return self._by_user
+
+    def add(self, message: Any):
+        if message.user not in self.distributions:
+            self.distributions[message.user] = Distributions()
+        self.characters.add(message)
+        self.distributions[message.user].add(message)
+        self.items.add(message)
+        self._by_user = None
+
+    def merge(self, other: "Aggregates") -> "Aggregates":
+        self.characters.merge(other.characters)
+        for (user, distributions) in other.distributions.items():
+            if user not in self.distributions:
+                self.distributions[user] = Distributions()
+            self.distributions[user].merge(distributions)
+        self.items.merge(other.items)
+        self._by_user = None
+        return self
+
+    def tables(
+        self, players: List[str], prev: "Aggregates"
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        The tables published next to the stats chunks, see `write_stats`.
+        Distributions are given for all messages and for `prev`, the last
+        session.
+        """
+        distributions = distribution_rows(self.distributions, players)
+        prev_distributions = distribution_rows(prev.distributions, players)
+        return {
+            "distributions": {
+                "rows": [
+                    {"all": all.to_json(), "prev": last.to_json()}
+                    for (all, last) in zip(distributions, prev_distributions)
+                ]
+            },
+            "fairness": {"rows": [d.fairness() for d in distributions]},
+            "items": self.items.to_json(players),
+            "characters": self.characters.to_json(players),
+        }
@@ -0,0 +1,96 @@
+from typing import Any, Dict, List, Tuple
+
+from core.counters import StatsAccumulator
+
+# Who a message was spoken as: (user, alias, actor id, token id). The same
+# user may speak as any number of characters, e.g. every NPC the Gamemaster
+# voices, and the same alias may belong to several actors or tokens.
+Character = Tuple[str, str | None, str | None, str | None]
+
+FIELDS = [
+    "character",
+    "message_count",
+    "d20_roll_count",
+    "nat_20_count",
+    "nat_1_count",
+    "average_raw_d20_roll",
+    "average_final_d20_roll",
+    "average_d20_after_modifiers",
+    "attack_roll_count",
+    "average_attack_after_modifiers",
+]
+
+
+def character(message: Any) -> Character:
+    return (message.user, message.alias, message.actor, message.token)
+
+
+class CharacterTable(object):
+    """
+    A `StatsAccumulator` per character, see `Character`.
+
+    Characters are interned like the items of `items.ItemTable`: each
+    distinct key is stored once in `keys` and its accumulator is found by
+    index, so a message costs one dict lookup however many characters a
+    world has. Per-user totals are merged from the characters' accumulators
+    (`by_user`), never from the messages again.
+    """
+
+    def __init__(self):
+        self.keys: List[Character] = []
+        self.index: Dict[Character, int] = {}
+        self.accumulators: List[StatsAccumulator] = []
+
+    def intern(self, key: Character) -> int:
+        if key not in self.index:
+            self.index[key] = len(self.keys)
+            self.keys.append(key)
+            self.accumulators.append(StatsAccumulator())
+        return self.index[key]
+
+    def add(self, message: Any):
+        self.accumulators[self.intern(character(message))].add(message)
+
+    def merge(self, other: "CharacterTable") -> "CharacterTable":
+        for (key, accumulator) in zip(other.keys, other.accumulators):
+            self.accumulators[self.intern(key)].merge(accumulator)
+        return self
+
+    def by_user(self) -> Dict[str, StatsAccumulator]:
+        by_user: Dict[str, StatsAccumulator] = {}
+        for (key, accumulator) in zip(self.keys, self.accumulators):
+            user = key[0]
+            if user not in by_user:
+                by_user[user] = StatsAccumulator()
+            by_user[user].merge(accumulator)
+        return by_user
+
+    def entry(self, i: int) -> List[Any]:
+        accumulator = self.accumulators[i]
+        data = accumulator.to_dict()
+        data["message_count"] = accumulator.counters["message_count"]
+        return [i] + [data[field] for field in FIELDS[1:]]
+
+    def to_json(self, players: List[str]) -> Dict[str, Any]:
+        """
+        The characters table, with the same rows as `counters.player_rows`.
+        "entries" holds one entry per character, most messages first, each
+        referring to its character by index in "characters", a [user, alias,
+        actor, token] list. A character is in several rows (All, All Players
+        and its user's), so rows only list the indices of their entries.
+        """
+        users = {key[0] for key in self.keys}
+        rows = [users, users - {"Gamemaster"}] + [
+            {user} for user in ["Gamemaster"] + players
+        ]
+        entries = [self.entry(i) for i in range(len(self.keys))]
+        entries.sort(key=lambda entry: (-entry[1], entry[0]))
+        owners = [self.keys[entry[0]][0] for entry in entries]
+        return {
+            "characters": [list(key) for key in self.keys],
+            "fields": FIELDS,
+            "entries": entries,
+            "rows": [
+                [i for (i, user) in enumerate(owners) if user in row] for row in rows
+            ],
+        }
@@ -0,0 +1,308 @@
+from typing import Any, Dict, Iterable, List, Union
+
+# Raw counts and sums behind every field of `generate_data`. Unlike the
+# ratios and averages it returns, these add up: the counters of two message
+# lists summed key by key are the counters of the combined list.
+
+SKILLS = [
+    "acr",
+    "ani",
+    "arc",
+    "ath",
+    "dec",
+    "his",
+    "ins",
+    "itm",
+    "inv",
+    "med",
+    "nat",
+    "prc",
+    "prf",
+    "per",
+    "rel",
+    "slt",
+    "ste",
+    "sur",
+]
+ABILITIES = ["str", "dex", "con", "wis", "int", "cha"]
+SAVES = ["str", "dex", "con", "wis", "int", "cha", "death"]
+RAW_DICE = [347, 100, 20, 12, 10, 8, 6, 4]
+ROLL_KINDS = ["attack", "initiative", "save", "skill", "ability"]
+D20_EVENTS = [
+    "advantage",
+    "disadvantage",
+    "nat_20",
+    "nat_1",
+    "stolen_nat_20",
+    "super_nat_20",
+    "disadvantage_nat_20",
+    "dropped_nat_1",
+    "super_nat_1",
+    "advantage_nat_1",
+]
+
+COUNTERS = (
+    ["message_count", "d20_roll_count", "d20_total_sum"]
+    + ["d20_first_sum", "d20_first_n"]
+    + [f"{event}_count" for event in D20_EVENTS]
+    + [
+        f"{kind}_{counter}"
+        for kind in ROLL_KINDS
+        for counter in ["count", "total_sum", "first_sum", "first_n"]
+    ]
+    + [f"{id}_save_{c}" for id in SAVES for c in ["count", "total_sum"]]
+    + [f"{id}_ability_{c}" for id in ABILITIES for c in ["count", "total_sum"]]
+    + [f"{id}_skill_{c}" for id in SKILLS for c in ["count", "total_sum"]]
+    + [f"d{x}_raw_{c}" for x in RAW_DICE for c in ["count", "sum"]]
+)
+
+
+KIND_KEYS = {
+    kind: tuple(f"{kind}_{c}" for c in ["count", "total_sum", "first_sum", "first_n"])
+    for kind in ROLL_KINDS
+}
+SUBTYPE_KEYS = {
+    kind: {id: (f"{id}_{kind}_count", f"{id}_{kind}_total_sum") for id in ids}
+    for (kind, ids) in [("save", SAVES), ("ability", ABILITIES), ("skill", SKILLS)]
+}
+RAW_KEYS = {x: (f"d{x}_raw_count", f"d{x}_raw_sum") for x in RAW_DICE}
+
+
+class StatsAccumulator(object):
+    """
+    The counters behind `generate_data` for some set of messages.
+
+    Accumulators of disjoint message sets `merge` into the accumulator of
+    their union and `remove` exactly undoes `add`, so the same totals can be
+    built in one pass, in parallel chunks (accumulators pickle), per period or
+    incrementally, and `to_dict` renders what `generate_data` would return
+    for those messages.
+    """
+
+    __slots__ = ["counters"]
+
+    def __init__(self, counters: Dict[str, Any] | None = None):
+        if counters is None:
+            self.counters = {name: 0 for name in COUNTERS}
+        else:
+            self.counters = dict(counters)
+
+    @staticmethod
+    def from_messages(messages: Iterable[Any]) -> "StatsAccumulator":
+        accumulator = StatsAccumulator()
+        for message in messages:
+            accumulator.add(message)
+        return accumulator
+
+    @staticmethod
+    def merged(accumulators: Iterable["StatsAccumulator"]) -> "StatsAccumulator":
+        total = StatsAccumulator()
+        for accumulator in accumulators:
+            total.merge(accumulator)
+        return total
+
+    def add(self, message: Any):
+        self.count(message, 1)
+
+    def remove(self, message: Any):
+        self.count(message, -1)
+
+    def count(self, message: Any, sign: int):
+        c = self.counters
+        c["message_count"] += sign
+
+        dice = message.get_dice()
+        d20s = [die for die in dice if die.is_dx(20)]
+        kinds = [
+            kind
+            for (kind, matched) in [
+                ("attack", message.is_attack()),
+                ("initiative", message.is_initiative_roll()),
+                ("save", message.is_saving_throw()),
+                ("skill", message.is_skill_check()),
+                ("ability", message.is_ability_check()),
+            ]
+            if matched
+        ]
+
+        # generate_data only ever sums the totals of d20 and typed rolls
+        total = 0
+        first = 0
+        if len(d20s) > 0 or len(kinds) > 0:
+            total = sign * sum([roll.total for roll in message.rolls])
+            first = sign * sum([die.active_results[0] for die in d20s])
+        n = sign * len(d20s)
+
+        if len(d20s) > 0:
+            c["d20_roll_count"] += sign
+            c["d20_total_sum"] += total
+            c["d20_first_sum"] += first
+            c["d20_first_n"] += n
+
+        for die in d20s:
+            c["advantage_count"] += sign * die.advantage
+            c["disadvantage_count"] += sign * die.disadvantage
+            c["nat_20_count"] += sign * die.is_nat_20()
+            c["nat_1_count"] += sign * die.is_nat_1()
+            c["stolen_nat_20_count"] += sign * die.is_stolen_nat_20()
+            c["super_nat_20_count"] += sign * die.is_super_nat_20()
+            c["disadvantage_nat_20_count"] += sign * die.is_disadvantage_nat_20()
+            c["dropped_nat_1_count"] += sign * die.is_dropped_nat_1()
+            c["super_nat_1_count"] += sign * die.is_super_nat_1()
+            c["advantage_nat_1_count"] += sign * die.is_advantage_nat_1()
+
+        for kind in kinds:
+            (count_key, total_key, first_key, n_key) = KIND_KEYS[kind]
+            c[count_key] += sign
+            c[total_key] += total
+            c[first_key] += first
+            c[n_key] += n
+
+            subtype = None
+            if kind == "save":
+                subtype = message.save_type()
+            elif kind == "ability":
+                subtype = message.ability_type()
+            elif kind == "skill":
+                subtype = message.skill_type()
+            if kind in SUBTYPE_KEYS and subtype in SUBTYPE_KEYS[kind]:
+                (count_key, total_key) = SUBTYPE_KEYS[kind][subtype]
+                c[count_key] += sign
+                c[total_key] += total
+
+        for die in dice:
+            if die.faces in RAW_KEYS:
+                (count_key, sum_key) = RAW_KEYS[die.faces]
+                c[count_key] += sign * (
+                    len(die.active_results) + len(die.inactive_results)
+                )
+                c[sum_key] += sign * (
+                    sum(die.active_results) + sum(die.inactive_results)
+                )
+
+    def merge(self, other: "StatsAccumulator") -> "StatsAccumulator":
+        c = self.counters
+        for (name, value) in other.counters.items():
+            c[name] += value
+        return self
+
+    def copy(self) -> "StatsAccumulator":
+        return StatsAccumulator(self.counters)
+
+    def __add__(self, other: "StatsAccumulator") -> "StatsAccumulator":
+        return self.copy().merge(other)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, StatsAccumulator) and self.counters == other.counters
+
+    def __repr__(self):
+        return f"StatsAccumulator(message_count={self.counters['message_count']})"
+
+    def is_empty(self) -> bool:
+        return self.counters["message_count"] == 0
+
+    def to_dict(self) -> Dict[str, Union[float, str]]:
+        """
+        The `generate_data` dict for the messages behind this accumulator,
+        key for key, including which zero guards return `0` and which `0.0`.
+        """
+        c = self.counters
+        roll_count = c["d20_roll_count"]
+
+        def ratio(count):
+            return 0 if roll_count == 0 else count / roll_count
+
+        def average(total, n):
+            return 0 if n == 0 else total / n
+
+        data = {
+            "d20_roll_count": roll_count,
+            "advantage_count": c["advantage_count"],
+            "disadvantage_count": c["disadvantage_count"],
+            "advantage_ratio": ratio(c["advantage_count"]),
+            "disadvantage_ratio": ratio(c["disadvantage_count"]),
+            "skill_check_count": c["skill_count"],
+            "skill_check_ratio": ratio(c["skill_count"]),
+            "ability_check_count": c["ability_count"],
+            "ability_check_ratio": ratio(c["ability_count"]),
+            "saving_throw_count": c["save_count"],
+            "saving_throw_ratio": ratio(c["save_count"]),
+            "attack_roll_count": c["attack_count"],
+            "attack_roll_ratio": ratio(c["attack_count"]),
+            "initiative_roll_count": c["initiative_count"],
+            "initiative_roll_ratio": 0.0
+            if c["initiative_count"] == 0
+            else c["initiative_count"] / roll_count,
+            "nat_20_count": c["nat_20_count"],
+            "nat_20_ratio": ratio(c["nat_20_count"]),
+            "nat_1_count": c["nat_1_count"],
+            "nat_1_ratio": ratio(c["nat_1_count"]),
+        }
+        for event in D20_EVENTS[4:]:
+            data[f"{event}_count"] = c[f"{event}_count"]
+
+        data["average_raw_d20_roll"] = average(c["d20_raw_sum"], c["d20_raw_count"])
+        data["average_final_d20_roll"] = average(c["d20_first_sum"], c["d20_first_n"])
+        data["average_d20_after_modifiers"] = average(c["d20_total_sum"], roll_count)
+        for kind in ROLL_KINDS:
+            data[f"average_{kind}_before_modifiers"] = average(
+                c[f"{kind}_first_sum"], c[f"{kind}_first_n"]
+            )
+        for kind in ROLL_KINDS:
+            data[f"average_{kind}_after_modifiers"] = average(
+                c[f"{kind}_total_sum"], c[f"{kind}_count"]
+            )
+
+        for (kind, keys) in SUBTYPE_KEYS.items():
+            for (id, (count_key, total_key)) in keys.items():
+                count = c[count_key]
+                data[f"{id}_{kind}_average"] = (
+                    0.0 if count == 0 else c[total_key] / count
+                )
+                data[count_key] = count
+
+        for (x, (count_key, sum_key)) in RAW_KEYS.items():
+            data[count_key] = c[count_key]
+            data[f"d{x}_raw_average"] = average(c[sum_key], c[count_key])
+
+        return data
+
+    def to_row(self) -> List[Any]:
+        return [self.counters[name] for name in COUNTERS]
+
+    @staticmethod
+    def from_row(row: List[Any], names: List[str] = COUNTERS) -> "StatsAccumulator":
+        return StatsAccumulator(dict(zip(names, row)))
+
+
+def accumulate_by_user(messages: Iterable[Any]) -> Dict[str, StatsAccumulator]:
+    by_user: Dict[str, StatsAccumulator] = {}
+    for message in messages:
+        if message.user not in by_user:
+            by_user[message.user] = StatsAccumulator()
+        by_user[message.user].add(message)
+    return by_user
+
+
+def player_rows(
+    by_user: Dict[str, StatsAccumulator], players: List[str]
+) -> List[Dict[str, Union[float, str]]]:
+    """
+    The rows `build_d20_data` makes with `generate_data`: "All", "All
+    Players" (everyone but the Gamemaster), the Gamemaster, then `players`.
+    """
+    everyone = StatsAccumulator.merged(by_user.values())
+    all_players = StatsAccumulator.merged(
+        a for (user, a) in by_user.items() if user != "Gamemaster"
+    )
+    rows = [("All", everyone), ("All Players", all_players)] + [
+        (user, by_user.get(user, StatsAccumulator()))
+        for user in ["Gamemaster"] + players
+    ]
+
+    data = []
+    for (user, accumulator) in rows:
+        row = accumulator.to_dict()
+        row["player"] = user
+        data.append(row)
+    return data
@@ -0,0 +1,175 @@
+import math
+from typing import Any, Dict, List, Tuple
+
+# Goodness-of-fit and streak statistics for die results. Everything here
+# works from the exact per-face counts in `sketches.Histogram` and from
+# `RunStats`, both filled in the aggregation pass, so a report costs
+# O(faces) per die type no matter how long the history is.
+
+
+def gamma_q(a: float, x: float) -> float:
+    """The regularized upper incomplete gamma function Q(a, x)."""
+    if x <= 0:
+        return 1.0
+    log_prefix = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        # Series for P(a, x)
+        term = total = 1 / a
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1 - total * math.exp(log_prefix))
+
+    # Continued fraction for Q(a, x), by the modified Lentz method
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return min(1.0, h * math.exp(log_prefix))
+
+
+def kolmogorov_q(statistic: float) -> float:
+    """P(K > statistic) for the Kolmogorov distribution."""
+    if statistic < 0.2:
+        return 1.0
+    total = 0.0
+    for k in range(1, 101):
+        term = 2 * (-1) ** (k - 1) * math.exp(-2 * k * k * statistic * statistic)
+        total += term
+        if abs(term) < 1e-12:
+            break
+    return min(1.0, max(0.0, total))
+
+
+def chi_square(counts: List[int]) -> Tuple[float, int, float]:
+    # Against a fair die: every face equally likely
+    n = sum(counts)
+    expected = n / len(counts)
+    statistic = sum((c - expected) ** 2 for c in counts) / expected
+    dof = len(counts) - 1
+    return statistic, dof, gamma_q(dof / 2, statistic / 2)
+
+
+def ks_uniform(counts: List[int]) -> Tuple[float, float]:
+    # Largest gap between the empirical and the fair CDF, with the
+    # asymptotic p-value; for a discrete die that p-value is conservative
+    n = sum(counts)
+    faces = len(counts)
+    statistic = 0.0
+    cumulative = 0
+    for (face, count) in enumerate(counts, start=1):
+        cumulative += count
+        statistic = max(statistic, abs(cumulative / n - face / faces))
+    root = math.sqrt(n)
+    return statistic, kolmogorov_q((root + 0.12 + 0.11 / root) * statistic)
+
+
+class RunStats(object):
+    """
+    Streaks of low (at most half the faces) and high results, in the order
+    they were rolled: counts of each, the number of runs and the longest
+    run of each. Merging appends the other sequence to this one.
+    """
+
+    __slots__ = ["low", "high", "runs", "first", "prefix", "last", "suffix", "longest"]
+
+    def __init__(self):
+        self.low = 0
+        self.high = 0
+        self.runs = 0
+        self.first: bool | None = None  # whether the first result was high
+        self.prefix = 0  # length of the first run
+        self.last: bool | None = None
+        self.suffix = 0  # length of the current run
+        self.longest = [0, 0]  # [low, high]
+
+    def add(self, high: bool):
+        if high:
+            self.high += 1
+        else:
+            self.low += 1
+        if high == self.last:
+            self.suffix += 1
+        else:
+            self.runs += 1
+            self.last = high
+            self.suffix = 1
+        if self.runs == 1:
+            self.first = high
+            self.prefix = self.suffix
+        self.longest[high] = max(self.longest[high], self.suffix)
+
+    def merge(self, other: "RunStats") -> "RunStats":
+        if other.runs == 0:
+            return self
+        if self.runs == 0:
+            for name in self.__slots__:
+                value = getattr(other, name)
+                setattr(self, name, list(value) if name == "longest" else value)
+            return self
+
+        joined = self.last == other.first
+        if joined:
+            self.longest[self.last] = max(
+                self.longest[self.last], self.suffix + other.prefix
+            )
+            if self.runs == 1:
+                self.prefix += other.prefix
+        self.longest = [max(a, b) for (a, b) in zip(self.longest, other.longest)]
+        if other.runs == 1 and joined:
+            self.suffix += other.suffix
+        else:
+            self.suffix = other.suffix
+        self.last = other.last
+        self.runs += other.runs - joined
+        self.low += other.low
+        self.high += other.high
+        return self
+
+    def runs_test(self) -> Tuple[float | None, float | None]:
+        # Wald-Wolfowitz: too few runs means streaky dice, too many means
+        # suspiciously alternating ones. Returns (z, two-sided p).
+        n = self.low + self.high
+        if self.low == 0 or self.high == 0 or n < 2:
+            return None, None
+        product = 2 * self.low * self.high
+        expected = product / n + 1
+        variance = product * (product - n) / (n * n * (n - 1))
+        if variance <= 0:
+            return None, None
+        z = (self.runs - expected) / math.sqrt(variance)
+        return z, math.erfc(abs(z) / math.sqrt(2))
+
+
+def fairness(counts: List[int], runs: RunStats | None) -> Dict[str, Any]:
+    n = sum(counts)
+    report: Dict[str, Any] = {"count": n}
+    if n == 0:
+        return report
+    (report["chi_square"], report["dof"], report["chi_square_p"]) = chi_square(
+        counts
+    )
+    (report["ks"], report["ks_p"]) = ks_uniform(counts)
+    if runs is not None:
+        (z, p) = runs.runs_test()
+        report["runs"] = runs.runs
+        report["runs_z"] = z
+        report["runs_p"] = p
+        report["longest_low_streak"] = runs.longest[0]
+        report["longest_high_streak"] = runs.longest[1]
+    return report
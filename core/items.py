@@ -0,0 +1,126 @@
+from typing import Any, Dict, List
+
+# Per item and user: attack rolls, the sum of their totals and of their
+# first d20s (with the number of d20s), damage rolls and their total
+ATTACK_COUNT = 0
+ATTACK_TOTAL_SUM = 1
+ATTACK_FIRST_SUM = 2
+ATTACK_FIRST_N = 3
+DAMAGE_COUNT = 4
+DAMAGE_TOTAL_SUM = 5
+COUNTER_COUNT = 6
+
+FIELDS = [
+    "item",
+    "attack_count",
+    "average_attack_after_modifiers",
+    "average_attack_before_modifiers",
+    "damage_count",
+    "damage_total",
+    "average_damage",
+]
+
+
+class ItemTable(object):
+    """
+    Attack and damage counters per item, per user, for the item leaderboards.
+
+    Item ids are interned: each distinct `attack_item`/`damage_item` is
+    stored once in `ids` and every counter row is keyed by its index, so
+    thousands of items cost a short list of ints each.
+    """
+
+    def __init__(self):
+        self.ids: List[str | None] = []
+        self.index: Dict[str | None, int] = {}
+        self.counts: Dict[str, Dict[int, List[int]]] = {}
+
+    def intern(self, item: str | None) -> int:
+        if item not in self.index:
+            self.index[item] = len(self.ids)
+            self.ids.append(item)
+        return self.index[item]
+
+    def row(self, user: str, item: int) -> List[int]:
+        if user not in self.counts:
+            self.counts[user] = {}
+        items = self.counts[user]
+        if item not in items:
+            items[item] = [0] * COUNTER_COUNT
+        return items[item]
+
+    def add(self, message: Any):
+        if message.is_attack():
+            item = message.attack_item
+        elif message.is_damage():
+            item = message.damage_item
+        else:
+            return
+
+        totals = [roll.total for roll in message.rolls]
+        if None in totals:
+            return
+        row = self.row(message.user, self.intern(item))
+
+        if message.is_attack():
+            d20s = [die for die in message.get_dice() if die.is_dx(20)]
+            row[ATTACK_COUNT] += 1
+            row[ATTACK_TOTAL_SUM] += sum(totals)
+            row[ATTACK_FIRST_SUM] += sum([die.active_results[0] for die in d20s])
+            row[ATTACK_FIRST_N] += len(d20s)
+        else:
+            row[DAMAGE_COUNT] += 1
+            row[DAMAGE_TOTAL_SUM] += sum(totals)
+
+    def merge(self, other: "ItemTable") -> "ItemTable":
+        # The other table's ids are interned again, in this table's numbering
+        for (user, items) in other.counts.items():
+            for (item, counts) in items.items():
+                row = self.row(user, self.intern(other.ids[item]))
+                for i in range(COUNTER_COUNT):
+                    row[i] += counts[i]
+        return self
+
+    def leaderboard(self, users: List[str]) -> List[List[Any]]:
+        # One entry per item used by any of `users`, by damage dealt
+        merged: Dict[int, List[int]] = {}
+        for user in users:
+            for (item, counts) in self.counts.get(user, {}).items():
+                if item not in merged:
+                    merged[item] = [0] * COUNTER_COUNT
+                for i in range(COUNTER_COUNT):
+                    merged[item][i] += counts[i]
+
+        def average(total, n):
+            return 0 if n == 0 else total / n
+
+        board = [
+            [
+                item,
+                c[ATTACK_COUNT],
+                average(c[ATTACK_TOTAL_SUM], c[ATTACK_COUNT]),
+                average(c[ATTACK_FIRST_SUM], c[ATTACK_FIRST_N]),
+                c[DAMAGE_COUNT],
+                c[DAMAGE_TOTAL_SUM],
+                average(c[DAMAGE_TOTAL_SUM], c[DAMAGE_COUNT]),
+            ]
+            for (item, c) in merged.items()
+        ]
+        board.sort(key=lambda entry: (-entry[5], -entry[1], entry[0]))
+        return board
+
+    def to_json(self, players: List[str]) -> Dict[str, Any]:
+        """
+        The items table, with the same rows as `counters.player_rows`.
+        Entries refer to items by their index in "items".
+        """
+        users = list(self.counts)
+        rows = [
+            users,
+            [user for user in users if user != "Gamemaster"],
+        ] + [[user] for user in ["Gamemaster"] + players]
+        return {
+            "items": self.ids,
+            "fields": FIELDS,
+            "rows": [self.leaderboard(row) for row in rows],
+        }
@@ -0,0 +1,187 @@
+import contextlib
+import gc
+import os
+import platform
+import sys
+import tracemalloc
+from typing import Dict, Iterator, List, Tuple
+
+# Opt-in memory profiling of a pipeline run: see `MemoryProfile`, and
+# `cli.py build --memory-profile FILE`.
+
+TOP_SITES = 20
+TOP_TYPES = 20
+# Frames kept per allocation: enough to get from `json.loads` back to the
+# code calling it. Every frame kept slows tracing down further.
+FRAMES = 4
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Allocations by the profiler itself, and by the import machinery
+IGNORED = {
+    tracemalloc.__file__,
+    __file__,
+    contextlib.__file__,
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+    "<unknown>",
+}
+
+# (name, bytes, blocks) and (type, objects, bytes)
+Site = Tuple[str, int, int]
+TypeCount = Tuple[str, int, int]
+
+
+class Stage(object):
+    def __init__(
+        self,
+        name: str,
+        current: int,
+        peak: int,
+        sites: List[Site],
+        types: List[TypeCount],
+    ):
+        self.name = name
+        self.current = current
+        self.peak = peak
+        self.sites = sites
+        self.types = types
+
+
+class MemoryProfile(object):
+    """
+    Memory use by the stages of a run. Allocations are traced during each
+    stage only, so the profiler's own work between stages is neither
+    slowed down by tracing nor counted. For each stage it records:
+
+    - current: bytes allocated during the stage and still held at its end
+    - peak: the most bytes held at once from those allocated in the stage
+    - site: the allocation sites of the current bytes, most first
+    - type: every live object by type at the end of the stage, whenever it
+      was allocated, with their shallow sizes, most bytes first
+
+    `report` renders the stages as plain text, one fact per line, in a fixed
+    order and with paths relative to the repository, so two reports (e.g.
+    before and after changing how messages are stored) diff cleanly. Tracing
+    makes a stage several times slower, so its timings mean little.
+    """
+
+    def __init__(self, top: int = TOP_SITES, frames: int = FRAMES):
+        self.top = top
+        self.frames = frames
+        self.stages: List[Stage] = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if tracemalloc.is_tracing():
+            # Traced by someone else, whose traces stopping would lose
+            yield
+            return
+        tracemalloc.start(self.frames)
+        try:
+            yield
+        finally:
+            (current, peak) = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            sites = [
+                (site, size, count)
+                for (site, (size, count)) in held_by_site(snapshot).items()
+            ]
+            # A snapshot is a tuple or two per allocation, not to be counted
+            del snapshot
+            sites.sort(key=lambda site: (-site[1], site[0]))
+            types = live_types()[:TOP_TYPES]
+            self.stages.append(Stage(name, current, peak, sites[: self.top], types))
+
+    def report(self, title: str) -> str:
+        lines = [
+            f"# memory profile: {title}",
+            f"# python {platform.python_version()}",
+        ]
+        for stage in self.stages:
+            lines.append("")
+            lines.append(f"[{stage.name}]")
+            lines.append(f"current {stage.current}")
+            lines.append(f"peak {stage.peak}")
+            for (name, size, count) in stage.sites:
+                lines.append(f"site {name} {size} B {count} blocks")
+            for (name, count, size) in stage.types:
+                lines.append(f"type {name} {count} objects {size} B")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, title: str):
+        with open(path, "w") as f:
+            f.write(self.report(title))
+
+
+def held_by_site(snapshot: tracemalloc.Snapshot) -> Dict[str, Tuple[int, int]]:
+    """
+    Bytes and blocks held, by allocation site. A site is the innermost line
+    of this repository on the way to the allocation, within the frames
+    kept, followed by the line that allocated if that is elsewhere, e.g. in
+    the json module.
+    """
+    held: Dict[str, Tuple[int, int]] = {}
+    for stat in snapshot.statistics("traceback"):
+        frames = list(stat.traceback)
+        if frames[-1].filename in IGNORED:
+            continue
+        site = site_name(frames[-1])
+        if not in_repository(frames[-1]):
+            for frame in reversed(frames):
+                if in_repository(frame):
+                    site = f"{site_name(frame)} > {site}"
+                    break
+        (size, count) = held.get(site, (0, 0))
+        held[site] = (size + stat.size, count + stat.count)
+    return held
+
+
+def in_repository(frame: tracemalloc.Frame) -> bool:
+    return frame.filename.startswith(ROOT + os.sep)
+
+
+def site_name(frame: tracemalloc.Frame) -> str:
+    # Repository paths relative to it, others by their last two parts
+    path = frame.filename
+    if in_repository(frame):
+        path = os.path.relpath(path, ROOT)
+    else:
+        path = "/".join(path.split(os.sep)[-2:])
+    return f"{path}:{frame.lineno}"
+
+
+def type_name(t: type) -> str:
+    if t.__module__ == "builtins":
+        return t.__qualname__
+    return f"{t.__module__}.{t.__qualname__}"
+
+
+def live_types() -> List[TypeCount]:
+    """
+    Live objects by type, most bytes first. The garbage collector only
+    tracks containers, and not even all of those (a dict of plain values,
+    like a die's results, is untracked), so objects one reference away from
+    a tracked one are counted too.
+    """
+    tracked = gc.get_objects()
+    found: List[object] = []
+    seen = {id(o) for o in tracked}
+    seen.update([id(tracked), id(found), id(seen)])
+    for o in tracked:
+        for referent in gc.get_referents(o):
+            if id(referent) not in seen:
+                seen.add(id(referent))
+                found.append(referent)
+
+    totals: Dict[type, List[int]] = {}
+    for objects in (tracked, found):
+        for o in objects:
+            total = totals.get(type(o))
+            if total is None:
+                total = totals[type(o)] = [0, 0]
+            total[0] += 1
+            total[1] += sys.getsizeof(o)
+    types = [(type_name(t), count, size) for (t, (count, size)) in totals.items()]
+    types.sort(key=lambda t: (-t[2], t[0]))
+    return types
@@ -0,0 +1,254 @@
+from copy import deepcopy
+from datetime import datetime
+from typing import Dict, List
+
+class Die(object):
+    def __init__(
+        self,
+        options=None,
+        evaluated=None,
+        number=None,
+        faces=None,
+        modifiers=None,
+        results=None,
+    ):
+        self.options = options
+        self.evaluated = evaluated
+        self.number = number
+        self.faces = faces
+        self.modifiers = modifiers
+        self.results = results
+        self.inactive_results = []
+        self.active_results = []
+        self.advantage = False
+        self.disadvantage = False
+
+        for r in results:
+            if r["active"]:
+                self.active_results.append(r["result"])
+            else:
+                self.inactive_results.append(r["result"])
+
+        assert(self.number == (len(self.active_results) + len(self.inactive_results)))
+
+        if "advantage" in self.options and self.options["advantage"]:
+            self.advantage = True
+        if "disadvantage" in self.options and self.options["disadvantage"]:
+            self.disadvantage = True
+
+    def is_dx(self, x: int) -> bool:
+        return self.faces == x
+
+    def get_all_dice_results(self):
+        results: List[Dict] = self.results
+        return list(map(lambda res: res["result"], results))
+
+    def is_nat_20(self) -> bool:
+        return self.active_results[0] == 20
+
+    def is_nat_1(self) -> bool:
+        return self.active_results[0] == 1
+
+    def is_stolen_nat_20(self) -> bool:
+        return (
+            self.disadvantage
+            and self.active_results[0] != 20
+            and self.inactive_results[0] == 20
+        )
+
+    def is_super_nat_20(self) -> bool:
+        return (
+            self.advantage
+            and self.active_results[0] == 20
+            and self.inactive_results[0] == 20
+        )
+
+    def is_disadvantage_nat_20(self) -> bool:
+        return (
+            self.disadvantage
+            and self.active_results[0] == 20
+            and self.inactive_results[0] == 20
+        )
+
+    def is_dropped_nat_1(self) -> bool:
+        return (
+            self.advantage
+            and self.active_results[0] != 1
+            and self.inactive_results[0] == 1
+        )
+
+    def is_super_nat_1(self) -> bool:
+        return (
+            self.disadvantage
+            and self.active_results[0] == 1
+            and self.inactive_results[0] == 1
+        )
+
+    def is_advantage_nat_1(self) -> bool:
+        return (
+            self.advantage
+            and self.active_results[0] == 1
+            and self.inactive_results[0] == 1
+        )
+
+    def __str__(self):
+        return f"{self.number}d{self.faces}"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class Roll(object):
+    def __init__(
+        self,
+        formula=None,
+        roll_type=None,
+        options=None,
+        dice=None,
+        terms=None,
+        total=None,
+        evaluated=None,
+        **kwargs,
+    ):
+        _dice = dice  # Ignore `dice` - it is extremely rare that it's used
+
+        self.formula = formula
+        self.roll_type = roll_type
+        self.total = total
+        self.dice = []
+        self.terms = deepcopy(terms)
+
+        for t in terms:
+            if t["class"] == "Die":
+                del t["class"]
+                self.dice.append(Die(**t))
+
+    def __str__(self):
+        return f"{{{self.roll_type}: [{self.formula}] [{[d for d in self.dice]}] = [{self.total}]}}"
+
+
+class Message(object):
+    def __init__(
+        self,
+        user=None,
+        data=[],
+        timestamp=None,
+        content=None,
+        alias=None,
+        flags=None,
+        raw=None,
+        actor=None,
+        token=None,
+    ):
+        self.user = user
+        self.alias = alias
+        # The speaker's actor and token ids, if it spoke as one
+        self.actor = actor
+        self.token = token
+        if not data is None:
+            self.rolls = [Roll(**d) for d in data]
+        else:
+            self.rolls = []
+        # Milliseconds since the epoch, as Foundry stores it; see `time`
+        self.timestamp = timestamp
+        self.content = content
+        self.raw = raw
+
+        self.saving_throw = None
+        self.skill_check = None
+        self.ability_check = None
+        self.attack = False
+        self.damage = False
+        self.hitDie = False
+        self.deathSave = False
+        self.attack_item = None
+        self.damage_item = None
+        self.initiative = False
+        if "dnd5e" in flags:
+            dnd_flags = flags["dnd5e"]
+            if "roll" in dnd_flags:
+                type = dnd_flags["roll"]["type"]
+                if type == "ability":
+                    self.ability_check = dnd_flags["roll"]["abilityId"]
+                elif type == "attack":
+                    self.attack = True
+                    if "itemId" in dnd_flags["roll"]:
+                        self.attack_item = dnd_flags["roll"]["itemId"]
+                    elif "item" in dnd_flags["roll"]:
+                        self.attack_item = dnd_flags["roll"]["item"]
+                    else:
+                        self.attack_item = dnd_flags["item"]["id"]
+                elif type == "damage":
+                    self.damage = True
+                    if "itemId" in dnd_flags["roll"]:
+                        self.damage_item = dnd_flags["roll"]["itemId"]
+                    elif "item" in dnd_flags["roll"]:
+                        self.damage_item = dnd_flags["roll"]["item"]
+                    elif "item" in dnd_flags:
+                        self.damage_item = dnd_flags["item"]["id"]
+                elif type == "death":
+                    self.saving_throw = "death"
+                    self.deathSave = True
+                elif type == "hitDie":
+                    self.hitDie = True
+                elif type == "save":
+                    if "abilityId" in dnd_flags["roll"]:
+                        self.saving_throw = dnd_flags["roll"]["abilityId"]
+                    else:
+                        self.saving_throw = dnd_flags["roll"]["ability"]
+                elif type == "skill":
+                    self.skill_check = dnd_flags["roll"]["skillId"]
+        elif "core" in flags:
+            if "initiativeRoll" in flags["core"] and flags["core"]["initiativeRoll"]:
+                self.initiative = True
+
+    def get_dice(self) -> List[Die]:
+        dice = []
+        for roll in self.rolls:
+            dice += roll.dice
+        return dice
+
+    def has_d20(self) -> bool:
+        dice = self.get_dice()
+        for die in dice:
+            if die.is_dx(20):
+                return True
+        return False
+
+    def is_saving_throw(self) -> bool:
+        return not self.saving_throw is None
+
+    def save_type(self) -> str | None:
+        return self.saving_throw
+
+    def is_skill_check(self) -> bool:
+        return not self.skill_check is None
+
+    def skill_type(self) -> str | None:
+        return self.skill_check
+
+    def is_ability_check(self) -> bool:
+        return not self.ability_check is None
+
+    def is_initiative_roll(self) -> bool:
+        return self.initiative
+
+    def ability_type(self) -> str | None:
+        return self.ability_check
+
+    def is_attack(self) -> bool:
+        return self.attack
+
+    def is_damage(self) -> bool:
+        return self.damage
+
+    def is_hit_die(self) -> bool:
+        return self.hitDie
+
+    @property
+    def time(self) -> datetime:
+        # Local time, for display only
+        return datetime.fromtimestamp(self.timestamp / 1000)
+
+    def __str__(self):
+        return f"{self.time} {self.user} {self.content} {self.rolls}"
@@ -0,0 +1,331 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, List, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FORMAT_VERSION = 2
+
+# Fields are split into chunks that line up with the sections of
+# public/indexv2.html, so the site only downloads the chunks behind the tables
+# it is showing. The first pattern matching a field (ignoring a trailing
+# `_prev`) wins; the last chunk catches everything else.
+CHUNKS = [
+    ("averages", re.compile(r"^average_")),
+    ("dice", re.compile(r"^d\d+_raw_")),
+    ("crits", re.compile(r"nat_(20|1)_")),
+    ("saves", re.compile(r"_save_(count|average)$")),
+    ("abilities", re.compile(r"_ability_(count|average)$")),
+    ("skills", re.compile(r"_skill_(count|average)$")),
+    ("rolls", re.compile(r"")),
+]
+
+FIELD_METADATA = {
+    "d20_raw_count": {
+        "pretty": "D20s Rolled",
+        "explanation": "Raw number of d20s rolled, including those dropped"
+    },
+    "d20_roll_count": {
+        "pretty": "D20 Rolls",
+        "explanation": "The number of rolls that include a d20"
+    },
+    "d20_raw_average": {
+        "pretty": "Average Raw D20",
+        "explanation": "Average value of d20s rolled, including those dropped"
+    },
+    "d100_raw_count": {
+        "pretty": "D100s Rolled",
+    },
+    "d12_raw_count": {
+        "pretty": "D12s Rolled",
+    },
+    "d10_raw_count": {
+        "pretty": "D10s Rolled",
+    },
+    "d10_raw_average": {
+        "pretty": "Average Raw D10",
+        "explanation": "Average value of d10s rolled, including those dropped"
+    },
+    "d8_raw_count": {
+        "pretty": "D8s Rolled",
+    },
+    "d8_raw_average": {
+        "pretty": "Average Raw D8",
+        "explanation": "Average value of d8s rolled, including those dropped"
+    },
+    "d6_raw_count": {
+        "pretty": "D6s Rolled",
+    },
+    "d6_raw_average": {
+        "pretty": "Average Raw D6",
+        "explanation": "Average value of d6s rolled, including those dropped"
+    },
+    "d4_raw_count": {
+        "pretty": "D4s Rolled",
+    },
+    "d4_raw_average": {
+        "pretty": "Average Raw D4",
+        "explanation": "Average value of d4s rolled, including those dropped"
+    },
+    "d347_raw_count": {
+        "pretty": "D347s Rolled",
+    },
+    "attack_roll_ratio": {
+        "pretty": "% Attacks",
+        "is_percent": True,
+    },
+    "saving_throw_ratio": {
+        "pretty": "% Saves",
+        "is_percent": True,
+    },
+    "ability_check_ratio": {
+        "pretty": "% Ability Checks",
+        "is_percent": True,
+    },
+    "skill_check_ratio": {
+        "pretty": "% Skill Checks",
+        "is_percent": True,
+    },
+    "initiative_roll_ratio": {
+        "pretty": "% Init Rolls",
+        "is_percent": True,
+    },
+    "attack_roll_count": {
+        "pretty": "# Attacks",
+    },
+    "saving_throw_count": {
+        "pretty": "# Saves",
+    },
+    "ability_check_count": {
+        "pretty": "# Ability Checks",
+    },
+    "skill_check_count": {
+        "pretty": "# Skill Checks",
+    },
+    "initiative_roll_count": {
+        "pretty": "# Init Rolls",
+    },
+    "nat_20_count": {
+        "pretty": "# Nat 20s",
+        "explanation": "After advantage or disadvantage, was the number on the die a 20?"
+    },
+    "nat_20_ratio": {
+        "pretty": "% Nat 20s",
+        "explanation": "After advantage or disadvantage, was the number on the die a 20?",
+        "is_percent": True,
+    },
+    "stolen_nat_20_count": {
+        "pretty": "Stolen Nat 20s",
+        "explanation": "Number of times that a natural 20 was lost to disadvantage",
+    },
+    "super_nat_20_count": {
+        "pretty": "Super Nat 20s",
+        "explanation": "Number of times that with advantage, both dice were 20s",
+    },
+    "disadvantage_nat_20_count": {
+        "pretty": "Disadvantage Nat 20s",
+        "explanation": "Number of times that with even with disadvantage, the result was a 20",
+    },
+    "nat_1_count": {
+        "pretty": "# Nat 1s",
+        "explanation": "After advantage or disadvantage, was the number on the die a 1?"
+    },
+    "nat_1_ratio": {
+        "pretty": "% Nat 1s",
+        "explanation": "After advantage or disadvantage, was the number on the die a 1?",
+        "is_percent": True,
+    },
+    "dropped_nat_1_count": {
+        "pretty": "Dropped Nat 1s",
+        "explanation": "Number of times that a natural 1 was avoided because of advantage",
+    },
+    "super_nat_1_count": {
+        "pretty": "Super Nat 1s",
+        "explanation": "Number of times that with disadvantage, both dice were 1s",
+    },
+    "advantage_nat_1_count": {
+        "pretty": "Advantage Nat 1s",
+        "explanation": "Number of times that with even with advantage, the result was a 1 (oof)",
+    },
+}
+
+
+def dump_json(data: Any) -> str:
+    return json.dumps(data, separators=(",", ":"))
+
+
+def read_bytes(path: str) -> bytes | None:
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def write_bytes(path: str, data: bytes, force: bool = False) -> bool:
+    # Skip identical rewrites so unchanged files keep their mtime/ETag and
+    # browsers can keep serving them from cache.
+    if not force and read_bytes(path) == data:
+        return False
+    with open(path, "wb") as f:
+        print(path)
+        f.write(data)
+    return True
+
+
+def remove_file(path: str):
+    if os.path.exists(path):
+        print(f"removed {path}")
+        os.remove(path)
+
+
+def write_file(path: str, contents: str, compress: bool = False) -> Dict[str, Any]:
+    data = contents.encode()
+    changed = write_bytes(path, data)
+    entry = {
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "bytes": len(data),
+    }
+
+    # A host serving precompressed files directly would keep serving a stale
+    # sibling, so any this run does not write are removed
+    if not compress:
+        remove_file(f"{path}.gz")
+    if not compress or brotli is None:
+        remove_file(f"{path}.br")
+
+    if compress:
+        # mtime=0 keeps the gzip header, and therefore the file, byte-for-byte
+        # reproducible between runs
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        write_bytes(f"{path}.gz", compressed, force=changed)
+        entry["gzip_bytes"] = len(compressed)
+
+        if brotli is not None:
+            compressed = brotli.compress(data, quality=11)
+            write_bytes(f"{path}.br", compressed, force=changed)
+            entry["br_bytes"] = len(compressed)
+
+    return entry
+
+
+def field_chunk(field: str) -> str:
+    base = field.removesuffix("_prev")
+    for (name, pattern) in CHUNKS:
+        if pattern.search(base):
+            return name
+    raise ValueError(f"No chunk for field {field}")
+
+
+def chunk_stats(
+    world_name: str, players: List[str], d20_data: List[Dict[str, Any]]
+) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    # Every row shares the same keys, so each chunk stores its field names
+    # once and one positional value row per player, in the order of the
+    # index's "rows". public/stats.js rebuilds the per-player dicts.
+    fields = []
+    for row in d20_data:
+        for key in row.keys():
+            if key not in fields and key != "player":
+                fields.append(key)
+
+    chunk_fields = {name: [] for (name, _) in CHUNKS}
+    for field in fields:
+        chunk_fields[field_chunk(field)].append(field)
+    chunk_fields = {name: f for (name, f) in chunk_fields.items() if len(f) > 0}
+
+    index = {
+        "version": FORMAT_VERSION,
+        "world": world_name,
+        "players": players,
+        "rows": [row["player"] for row in d20_data],
+        "chunks": chunk_fields,
+    }
+    chunks = {
+        name: {
+            "version": FORMAT_VERSION,
+            "fields": f,
+            "rows": [[row.get(field) for field in f] for row in d20_data],
+        }
+        for (name, f) in chunk_fields.items()
+    }
+    return index, chunks
+
+
+def write_field_metadata(
+    directory: str = "./public", compress: bool = False
+) -> Dict[str, Any]:
+    return write_file(
+        f"{directory}/field_metadata.json", dump_json(FIELD_METADATA), compress
+    )
+
+
+def manifest_path(world_name: str, directory: str = "./public") -> str:
+    return f"{directory}/{world_name}_manifest.json"
+
+
+def read_manifest(world_name: str, directory: str = "./public") -> Dict[str, Any]:
+    # The files of the world's last run, {} if there was none
+    data = read_bytes(manifest_path(world_name, directory))
+    if data is None:
+        return {}
+    return json.loads(data).get("files", {})
+
+
+def write_manifest(
+    world_name: str, files: Dict[str, Dict[str, Any]], directory: str = "./public"
+) -> str:
+    """
+    Writes the manifest and removes the files of the world's last run that
+    are not in it, e.g. a table no longer published, and their compressed
+    siblings.
+    """
+    # The manifest is the only file the site fetches without a version in the
+    # URL; everything else is requested as `{name}?v={hash}`.
+    old = read_manifest(world_name, directory)
+    path = manifest_path(world_name, directory)
+    write_file(path, dump_json({"version": FORMAT_VERSION, "files": files}))
+    for name in old:
+        # field_metadata.json is shared by every world
+        if name not in files and name != "field_metadata.json":
+            for suffix in ["", ".gz", ".br"]:
+                remove_file(f"{directory}/{name}{suffix}")
+    return path
+
+
+def write_stats(
+    world_name: str,
+    players: List[str],
+    d20_data: List[Dict[str, Any]],
+    tables: Dict[str, Dict[str, Any]] | None = None,
+    directory: str = "./public",
+    compress: bool = False,
+) -> str:
+    files = {}
+    files["field_metadata.json"] = write_field_metadata(directory, compress)
+
+    index, chunks = chunk_stats(world_name, players, d20_data)
+
+    # Larger, nested per-row data is published as separate tables, listed in
+    # the index and only fetched by pages that show them. Each table has one
+    # entry in "rows" per row of the index.
+    index["tables"] = {}
+    for (table, contents) in (tables or {}).items():
+        name = f"{world_name}_{table}.json"
+        contents = {"version": FORMAT_VERSION} | contents
+        files[name] = write_file(f"{directory}/{name}", dump_json(contents), compress)
+        index["tables"][table] = name
+
+    for (chunk, contents) in chunks.items():
+        name = f"{world_name}_chunk_{chunk}.json"
+        files[name] = write_file(f"{directory}/{name}", dump_json(contents), compress)
+
+    name = f"{world_name}_index.json"
+    files[name] = write_file(f"{directory}/{name}", dump_json(index), compress)
+
+    return write_manifest(world_name, files, directory)
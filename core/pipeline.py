@@ -0,0 +1,50 @@
+from contextlib import nullcontext
+from typing import Dict, List
+
+from core.memory import MemoryProfile
+from core.output import write_stats
+from core.rollups import save_report, update_rollups
+from core.search import update_search_index
+from core.sources import Source, load_messages
+from core.stats import apply_april_fools_filter, build_d20_data
+from core.timing import timed
+
+
+def run(
+    source: Source,
+    world_name: str,
+    players: List[str],
+    compress: bool = False,
+    memory: MemoryProfile | None = None,
+) -> Dict[str, float]:
+    """
+    Loads `source` and writes everything generated from it: the search
+    index, rollups, report and published stats. With `memory`, the traced
+    heap is snapshotted after each stage, see `MemoryProfile`.
+    """
+    timings: Dict[str, float] = {}
+
+    def stage(name: str):
+        return nullcontext() if memory is None else memory.stage(name)
+
+    with timed(timings, "load_zip_files"), stage("load"):
+        messages = load_messages(source)
+
+    with timed(timings, "search_index"), stage("search_index"):
+        # Everything is searchable, April Fools included
+        update_search_index(world_name, messages)
+
+    with timed(timings, "april_fools_filter"), stage("april_fools_filter"):
+        messages = apply_april_fools_filter(messages)
+
+    with stage("build_d20_data"):
+        (d20_data, tables) = build_d20_data(messages, players, timings)
+
+    with timed(timings, "rollups"), stage("rollups"):
+        update_rollups(world_name, messages)
+        save_report(world_name, d20_data)
+
+    with timed(timings, "write_stats"), stage("write_stats"):
+        write_stats(world_name, players, d20_data, tables, compress=compress)
+
+    return timings
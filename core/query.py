@@ -0,0 +1,241 @@
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Set, Tuple
+
+APRIL_FOOLS_MARKERS = ["# April Fools Marker", "#End April Fools"]
+
+# Roll types as named in queries, mapped to the dnd5e `flags.dnd5e.roll.type`
+# values that produce them and to the matching `Message` check. A roll type
+# may be narrowed to one skill or ability, e.g. "skill:ste" or "save:dex".
+ROLL_TYPES: Dict[str, Tuple[Set[str], Callable[[Any], bool]]] = {
+    "attack": ({"attack"}, lambda m: m.is_attack()),
+    "damage": ({"damage"}, lambda m: m.is_damage()),
+    "save": ({"save", "death"}, lambda m: m.is_saving_throw()),
+    "death": ({"death"}, lambda m: m.save_type() == "death"),
+    "skill": ({"skill"}, lambda m: m.is_skill_check()),
+    "ability": ({"ability"}, lambda m: m.is_ability_check()),
+    "initiative": ({"initiative"}, lambda m: m.is_initiative_roll()),
+    "hitDie": ({"hitDie"}, lambda m: m.is_hit_die()),
+}
+SUBTYPES: Dict[str, Callable[[Any], str | None]] = {
+    "skill": lambda m: m.skill_type(),
+    "save": lambda m: m.save_type(),
+    "ability": lambda m: m.ability_type(),
+}
+
+
+def raw_roll_type(flags: Dict[str, Any]) -> Tuple[str | None, str | None]:
+    # Mirrors the flag handling in Message.__init__
+    if "dnd5e" in flags:
+        if "roll" not in flags["dnd5e"]:
+            return None, None
+        roll = flags["dnd5e"]["roll"]
+        if roll["type"] == "death":
+            return "death", "death"
+        subtype = roll.get("skillId", roll.get("abilityId", roll.get("ability")))
+        return roll["type"], subtype
+    if "core" in flags and flags["core"].get("initiativeRoll"):
+        return "initiative", None
+    return None, None
+
+
+def is_marker(content: str | None) -> bool:
+    return content is not None and any(m in content for m in APRIL_FOOLS_MARKERS)
+
+
+class Query(object):
+    """
+    A filter over chat messages, applied in two stages.
+
+    `matches_raw` runs in the loaders on the decoded JSON record, before any
+    rolls are parsed, and checks the cheap predicates: users, aliases, the
+    time window and roll types. `apply` runs on loaded `Message`s and checks
+    everything, including die faces, sessions and the April Fools markers.
+
+    Markers and sessions are defined over the whole timeline, so records
+    containing a marker always pass `matches_raw`, and nothing is pushed down
+    to the loaders when `sessions` is set.
+    """
+
+    def __init__(
+        self,
+        users: Iterable[str] | None = None,
+        exclude_users: Iterable[str] | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        sessions: Iterable[int] | None = None,
+        roll_types: Iterable[str] | None = None,
+        die_faces: Iterable[int] | None = None,
+        aliases: Iterable[str] | None = None,
+        exclude_markers: bool = True,
+    ):
+        self.users = None if users is None else frozenset(users)
+        self.exclude_users = (
+            None if exclude_users is None else frozenset(exclude_users)
+        )
+        self.start = start
+        self.end = end
+        self.sessions = None if sessions is None else tuple(sorted(set(sessions)))
+        self.roll_types = None if roll_types is None else frozenset(roll_types)
+        self.die_faces = None if die_faces is None else frozenset(die_faces)
+        self.aliases = None if aliases is None else frozenset(aliases)
+        self.exclude_markers = exclude_markers
+
+        if self.roll_types is not None:
+            for roll_type in self.roll_types:
+                (name, _, subtype) = roll_type.partition(":")
+                if name not in ROLL_TYPES:
+                    raise ValueError(
+                        f"Unknown roll type {name}, "
+                        f"expected one of {', '.join(ROLL_TYPES)}"
+                    )
+                if subtype and name not in SUBTYPES:
+                    raise ValueError(f"Roll type {name} has no subtypes")
+
+        # Message timestamps are in milliseconds
+        self.start_ms = None if start is None else int(start.timestamp() * 1000)
+        self.end_ms = None if end is None else int(end.timestamp() * 1000)
+
+    def key(self) -> Tuple:
+        return (
+            self.users,
+            self.exclude_users,
+            self.start,
+            self.end,
+            self.sessions,
+            self.roll_types,
+            self.die_faces,
+            self.aliases,
+            self.exclude_markers,
+        )
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Query) and self.key() == other.key()
+
+    def __hash__(self) -> int:
+        return hash(self.key())
+
+    def __repr__(self):
+        fields = [
+            f"{name}={value!r}"
+            for (name, value) in vars(self).items()
+            if value is not None and not name.endswith("_ms")
+        ]
+        return f"Query({', '.join(fields)})"
+
+    def matches_user(self, user: str) -> bool:
+        if self.users is not None and user not in self.users:
+            return False
+        if self.exclude_users is not None and user in self.exclude_users:
+            return False
+        return True
+
+    def matches_roll_type(self, roll_type: str | None, subtype: str | None) -> bool:
+        for wanted in self.roll_types:
+            (name, _, wanted_subtype) = wanted.partition(":")
+            if roll_type in ROLL_TYPES[name][0]:
+                if not wanted_subtype or wanted_subtype == subtype:
+                    return True
+        return False
+
+    def matches_raw(self, raw: Dict[str, Any], user: str) -> bool:
+        if self.sessions is not None:
+            return True
+        if self.exclude_markers and is_marker(raw.get("content")):
+            return True
+
+        if not self.matches_user(user):
+            return False
+        if self.aliases is not None:
+            if raw.get("speaker", {}).get("alias") not in self.aliases:
+                return False
+        if self.start_ms is not None and raw["timestamp"] < self.start_ms:
+            return False
+        if self.end_ms is not None and raw["timestamp"] >= self.end_ms:
+            return False
+        if self.roll_types is not None:
+            if not self.matches_roll_type(*raw_roll_type(raw.get("flags", {}))):
+                return False
+        return True
+
+    def matches_message(self, message: Any) -> bool:
+        if not self.matches_user(message.user):
+            return False
+        if self.aliases is not None and message.alias not in self.aliases:
+            return False
+        if self.start_ms is not None and message.timestamp < self.start_ms:
+            return False
+        if self.end_ms is not None and message.timestamp >= self.end_ms:
+            return False
+        if self.roll_types is not None:
+            matched = False
+            for wanted in self.roll_types:
+                (name, _, subtype) = wanted.partition(":")
+                if ROLL_TYPES[name][1](message):
+                    if not subtype or SUBTYPES[name](message) == subtype:
+                        matched = True
+                        break
+            if not matched:
+                return False
+        if self.die_faces is not None:
+            if not any(die.faces in self.die_faces for die in message.get_dice()):
+                return False
+        return True
+
+    def apply(self, messages: List[Any], engine) -> List[Any]:
+        """
+        `engine` provides the marker filter and session grouping, normally
+        `core.stats`.
+        """
+        if self.exclude_markers:
+            messages = engine.apply_april_fools_filter(messages)
+
+        if self.sessions is not None:
+            sessions = engine.group_sessions(messages)
+            selected = []
+            for index in self.sessions:
+                if not -len(sessions) <= index < len(sessions):
+                    raise ValueError(f"No session {index}, there are {len(sessions)}")
+                selected += sessions[index].messages
+            messages = sorted(selected, key=lambda m: m.timestamp)
+
+        return [m for m in messages if self.matches_message(m)]
+
+
+def query_from_params(params: Dict[str, str]) -> Query:
+    """
+    Builds a `Query` from string parameters, as sent to server_main.py.
+    Lists are comma separated; "player" accepts "All" and "All Players" like
+    `generate_data`.
+    """
+
+    def split(name: str) -> List[str] | None:
+        if name not in params or params[name] == "":
+            return None
+        return params[name].split(",")
+
+    users = split("player")
+    exclude_users = None
+    if users == ["All"]:
+        users = None
+    elif users == ["All Players"]:
+        users = None
+        exclude_users = ["Gamemaster"]
+
+    sessions = split("session")
+    die_faces = split("die")
+    try:
+        return Query(
+            users=users,
+            exclude_users=exclude_users,
+            start=datetime.fromisoformat(params["start"]) if "start" in params else None,
+            end=datetime.fromisoformat(params["end"]) if "end" in params else None,
+            sessions=None if sessions is None else [int(s) for s in sessions],
+            roll_types=split("category"),
+            die_faces=(
+                None if die_faces is None else [int(d.removeprefix("d")) for d in die_faces]
+            ),
+            aliases=split("alias"),
+            exclude_markers=params.get("markers", "exclude") == "exclude",
+        )
+    except ValueError as e:
+        raise ValueError(f"Bad query: {e}") from e
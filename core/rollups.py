@@ -0,0 +1,386 @@
+import argparse
+import hashlib
+import json
+import os
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Tuple, Union
+
+from core.counters import COUNTERS, StatsAccumulator
+
+ROLLUP_VERSION = 4
+PERIODS = ["day", "week", "month"]
+
+Bucket = Dict[str, StatsAccumulator]  # user -> counters
+
+
+def local_date(timestamp: int) -> date:
+    # The day a millisecond timestamp falls on, in local time
+    return datetime.fromtimestamp(timestamp / 1000).date()
+
+
+def day_start(day: date) -> int:
+    return int(datetime.combine(day, datetime.min.time()).timestamp() * 1000)
+
+
+def period_start(period: str, day: date) -> date:
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def period_end(period: str, start: date) -> date:
+    if period == "week":
+        return start + timedelta(days=7)
+    if period == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def period_key(period: str, start: date) -> str:
+    # Keys sort in time order within a period
+    if period == "week":
+        (year, week, _) = start.isocalendar()
+        return f"{year}-W{week:02d}"
+    if period == "month":
+        return start.strftime("%Y-%m")
+    return start.isoformat()
+
+
+class Rollups(object):
+    """
+    The counters behind `generate_data`, per user, bucketed by day, week and
+    month. Every message is counted once, into its day; weeks and months are
+    merged from days. Reports for any date range are merged from the fewest
+    buckets that cover it.
+
+    `days` also records each day's first and last message timestamps and
+    message count, which is all that is needed to rebuild `group_sessions`. Consecutive
+    sessions are at least 24 hours apart, so every session covers whole days
+    that no other session touches.
+
+    `digest` identifies the messages counted so far, see `update_digest`.
+    """
+
+    def __init__(self):
+        self.buckets: Dict[str, Dict[str, Bucket]] = {p: {} for p in PERIODS}
+        self.days: Dict[str, List[Any]] = {}
+        self.last: int | None = None
+        self.message_count = 0
+        self.digest: str | None = None
+
+    def update(self, messages: List[Any]) -> int:
+        """
+        Brings the rollups up to date with `messages`, which must be sorted
+        and filtered as in `run`. Only the days from the first message after
+        `last` onward are recounted. If anything up to `last` changed, every
+        bucket is rebuilt. Returns the number of messages counted.
+        """
+        timestamps = [m.timestamp for m in messages]
+
+        counted = 0
+        digest = hashlib.sha256()
+        if self.last is not None:
+            counted = bisect_right(timestamps, self.last)
+            # The same number of messages may still be different ones, e.g.
+            # one edited, or one deleted and another added
+            if counted == self.message_count:
+                update_digest(digest, messages[:counted])
+            if counted != self.message_count or digest.hexdigest() != self.digest:
+                self.__init__()
+                counted = 0
+                digest = hashlib.sha256()
+
+        if counted == len(messages):
+            return 0
+
+        first_day = local_date(messages[counted].timestamp)
+        first_key = period_key("day", first_day)
+        for key in [k for k in self.buckets["day"] if k >= first_key]:
+            del self.buckets["day"][key]
+            del self.days[key]
+
+        start = bisect_left(timestamps, day_start(first_day))
+        for message in messages[start:]:
+            key = period_key("day", local_date(message.timestamp))
+            bucket = self.buckets["day"].setdefault(key, {})
+            if message.user not in bucket:
+                bucket[message.user] = StatsAccumulator()
+            bucket[message.user].add(message)
+
+            stamp = message.timestamp
+            if key not in self.days:
+                self.days[key] = [stamp, stamp, 0]
+            self.days[key][1] = stamp
+            self.days[key][2] += 1
+
+        for period in ["week", "month"]:
+            self.merge_period(period, period_start(period, first_day))
+
+        update_digest(digest, messages[counted:])
+        self.last = messages[-1].timestamp
+        self.message_count = len(messages)
+        self.digest = digest.hexdigest()
+        return len(messages) - start
+
+    def merge_period(self, period: str, start: date):
+        buckets = self.buckets[period]
+        for key in [k for k in buckets if k >= period_key(period, start)]:
+            del buckets[key]
+
+        last_day = date.fromisoformat(max(self.buckets["day"]))
+        while start <= last_day:
+            end = period_end(period, start)
+            merged = self.merge_days(start, end)
+            if len(merged) > 0:
+                buckets[period_key(period, start)] = merged
+            start = end
+
+    def merge_days(self, start: date, end: date) -> Bucket:
+        merged: Bucket = {}
+        day = start
+        while day < end:
+            bucket = self.buckets["day"].get(day.isoformat(), {})
+            for (user, accumulator) in bucket.items():
+                if user in merged:
+                    merged[user].merge(accumulator)
+                else:
+                    merged[user] = accumulator.copy()
+            day += timedelta(days=1)
+        return merged
+
+    def covering_buckets(self, start: date, end: date) -> List[Bucket]:
+        # Greedily take whole months, then whole weeks, then single days
+        covering = []
+        cursor = start
+        while cursor < end:
+            for period in ["month", "week", "day"]:
+                if period_start(period, cursor) != cursor:
+                    continue
+                period_stop = period_end(period, cursor)
+                if period_stop <= end:
+                    key = period_key(period, cursor)
+                    if key in self.buckets[period]:
+                        covering.append(self.buckets[period][key])
+                    cursor = period_stop
+                    break
+        return covering
+
+    def report(
+        self,
+        user: str | None = None,
+        start: date | None = None,
+        end: date | None = None,
+    ) -> Dict[str, Union[float, str]]:
+        """
+        `generate_data(messages, user)` for the messages from `start` up to,
+        but not including, `end`.
+        """
+        if len(self.days) == 0:
+            return StatsAccumulator().to_dict()
+        if start is None:
+            start = date.fromisoformat(min(self.days))
+        if end is None:
+            end = date.fromisoformat(max(self.days)) + timedelta(days=1)
+
+        selected = []
+        for bucket in self.covering_buckets(start, end):
+            for (name, accumulator) in bucket.items():
+                if user is None:
+                    selected.append(accumulator)
+                elif user == "All Players":
+                    if name != "Gamemaster":
+                        selected.append(accumulator)
+                elif name == user:
+                    selected.append(accumulator)
+        return StatsAccumulator.merged(selected).to_dict()
+
+    def sessions(self) -> List[Tuple[date, date, int]]:
+        # Same grouping as group_sessions, as (first day, last day, count)
+        sessions = []
+        previous_last = None
+        for key in sorted(self.days):
+            (first, last, count) = self.days[key]
+            day = date.fromisoformat(key)
+            if previous_last is not None and first - previous_last < 24 * 3600 * 1000:
+                (start, _, total) = sessions[-1]
+                sessions[-1] = (start, day, total + count)
+            else:
+                sessions.append((day, day, count))
+            previous_last = last
+        return [s for s in sessions if s[2] > 10]
+
+    def session_report(self, index: int, user: str | None = None):
+        (first, last, _) = self.sessions()[index]
+        return self.report(user, first, last + timedelta(days=1))
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "version": ROLLUP_VERSION,
+            "counters": COUNTERS,
+            "last": self.last,
+            "message_count": self.message_count,
+            "digest": self.digest,
+            "days": self.days,
+            "buckets": {
+                period: {
+                    key: {user: a.to_row() for (user, a) in bucket.items()}
+                    for (key, bucket) in buckets.items()
+                }
+                for (period, buckets) in self.buckets.items()
+            },
+        }
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> "Rollups":
+        rollups = Rollups()
+        if data.get("version") != ROLLUP_VERSION or data.get("counters") != COUNTERS:
+            # Written by another version: start over
+            return rollups
+        rollups.last = data["last"]
+        rollups.message_count = data["message_count"]
+        rollups.digest = data["digest"]
+        rollups.days = data["days"]
+        rollups.buckets = {
+            period: {
+                key: {
+                    user: StatsAccumulator.from_row(row)
+                    for (user, row) in bucket.items()
+                }
+                for (key, bucket) in buckets.items()
+            }
+            for (period, buckets) in data["buckets"].items()
+        }
+        return rollups
+
+
+def update_digest(digest: Any, messages: List[Any]):
+    """
+    Feeds `messages` to `digest`, a hashlib object, by what identifies them
+    and what an edit changes: id, time, author, content and rolls, down to
+    each die's results.
+    """
+    for m in messages:
+        id = None if m.raw is None else m.raw.get("_id")
+        rolls = json.dumps(
+            [
+                [r.formula, r.total, [[d.faces, d.options, d.results] for d in r.dice]]
+                for r in m.rolls
+            ],
+            sort_keys=True,
+        )
+        digest.update(
+            f"{id}\0{m.timestamp}\0{m.user}\0{m.content}\0{rolls}\n".encode()
+        )
+
+
+def rollups_path(world_name: str, directory: str = "./rollups") -> str:
+    return f"{directory}/{world_name}_rollups.json"
+
+
+def load_rollups(world_name: str, directory: str = "./rollups") -> Rollups:
+    path = rollups_path(world_name, directory)
+    if not os.path.exists(path):
+        return Rollups()
+    with open(path) as f:
+        return Rollups.from_json(json.load(f))
+
+
+def save_rollups(world_name: str, rollups: Rollups, directory: str = "./rollups"):
+    os.makedirs(directory, exist_ok=True)
+    path = rollups_path(world_name, directory)
+    with open(path, "w") as f:
+        print(path)
+        json.dump(rollups.to_json(), f, separators=(",", ":"))
+
+
+def update_rollups(
+    world_name: str, messages: List[Any], directory: str = "./rollups"
+) -> Rollups:
+    rollups = load_rollups(world_name, directory)
+    previous = rollups.message_count
+    # Nothing is counted when every message is gone, but the file must
+    # still be emptied
+    if rollups.update(messages) > 0 or rollups.message_count != previous:
+        save_rollups(world_name, rollups, directory)
+    return rollups
+
+
+def report_path(world_name: str, directory: str = "./rollups") -> str:
+    return f"{directory}/{world_name}_report.json"
+
+
+def save_report(
+    world_name: str, d20_data: List[Dict[str, Any]], directory: str = "./rollups"
+):
+    """
+    Saves the all-time `generate_data` row of each player row (see
+    `counters.player_rows`) as built by `run`, so the current numbers can be
+    read back without loading the rollups or any messages.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rows = {
+        row["player"]: {
+            key: value
+            for (key, value) in row.items()
+            if key != "player" and not key.endswith("_prev")
+        }
+        for row in d20_data
+    }
+    path = report_path(world_name, directory)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump({"version": ROLLUP_VERSION, "rows": rows}, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_report(
+    world_name: str, directory: str = "./rollups"
+) -> Dict[str, Dict[str, Union[float, str]]]:
+    # {} if there is none
+    path = report_path(world_name, directory)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        report = json.load(f)
+    if report.get("version") != ROLLUP_VERSION:
+        return {}
+    return report["rows"]
+
+
+def this_month_vs_all_time(
+    rollups: Rollups, user: str | None = None, today: date | None = None
+) -> Dict[str, Dict[str, Union[float, str]]]:
+    if today is None:
+        today = date.today()
+    start = today.replace(day=1)
+    return {
+        "this_month": rollups.report(user, start, period_end("month", start)),
+        "all_time": rollups.report(user),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report from a world's rollups")
+    parser.add_argument("world_name")
+    parser.add_argument("--directory", default="./rollups")
+    parser.add_argument(
+        "--user", help='a player, "All Players", or everyone if omitted'
+    )
+    parser.add_argument("--start", type=date.fromisoformat)
+    parser.add_argument("--end", type=date.fromisoformat, help="exclusive")
+    parser.add_argument("--session", type=int, help="session index, -1 for the latest")
+    parser.add_argument(
+        "--this-month", action="store_true", help="this month vs all time"
+    )
+    args = parser.parse_args()
+
+    rollups = load_rollups(args.world_name, args.directory)
+    if args.session is not None:
+        report = rollups.session_report(args.session, args.user)
+    elif args.this_month:
+        report = this_month_vs_all_time(rollups, args.user)
+    else:
+        report = rollups.report(args.user, args.start, args.end)
+    print(json.dumps(report, indent=4))
@@ -0,0 +1,468 @@
+import argparse
+import gc
+import hashlib
+import html
+import os
+import re
+import sqlite3
+from array import array
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+# An inverted index over chat messages and journal pages, kept in SQLite:
+# `postings` holds, for every token, the documents it occurs in with its
+# positions there, clustered by token so a lookup reads one contiguous run.
+# Documents are keyed by their Foundry id and hashed, so updating the index
+# only touches what was added, changed or removed since the last update.
+
+# Stored as the database's user_version; an index with another is rebuilt
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    parent TEXT,
+    timestamp INTEGER,
+    speaker TEXT,
+    user TEXT,
+    title TEXT,
+    text TEXT NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_kind ON documents (kind, parent);
+CREATE INDEX IF NOT EXISTS documents_timestamp ON documents (timestamp);
+CREATE TABLE IF NOT EXISTS postings (
+    token TEXT NOT NULL,
+    doc INTEGER NOT NULL,
+    positions BLOB NOT NULL,
+    PRIMARY KEY (token, doc)
+) WITHOUT ROWID;
+"""
+
+TAG = re.compile(r"<[^>]*>")
+TOKEN = re.compile(r"\w+")
+TERM = re.compile(r'"([^"]*)"|(\S+)')
+# Candidate sets below this are looked up by document instead of by
+# reading a term's whole postings list
+PROBE_LIMIT = 512
+SNIPPET = 60
+
+
+def plain_text(content: str | None) -> str:
+    if not content:
+        return ""
+    return " ".join(html.unescape(TAG.sub(" ", content)).split())
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN.findall(text.lower())
+
+
+def positions_by_token(tokens: List[str]) -> Dict[str, array]:
+    positions: Dict[str, array] = {}
+    for (i, token) in enumerate(tokens):
+        if token not in positions:
+            positions[token] = array("I")
+        positions[token].append(i)
+    return positions
+
+
+def text_hash(*parts: Any) -> str:
+    return hashlib.sha1("\0".join(str(p) for p in parts).encode()).hexdigest()
+
+
+class SearchIndex(object):
+    """
+    Full-text search over a world's chat and journal pages. Messages and
+    pages are added with `update_messages` and `update_pages`, which skip
+    anything already indexed unchanged; `search` runs a query.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        (version,) = self.db.execute("PRAGMA user_version").fetchone()
+        if version != SCHEMA_VERSION:
+            self.db.executescript(
+                "DROP TABLE IF EXISTS documents; DROP TABLE IF EXISTS postings;"
+            )
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.executescript(SCHEMA)
+
+    def __enter__(self) -> "SearchIndex":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def hashes(self, kind: str) -> Dict[str, Tuple[int, str, str | None]]:
+        # key -> (document id, hash, parent)
+        rows = self.db.execute(
+            "SELECT key, id, hash, parent FROM documents WHERE kind = ?", (kind,)
+        )
+        return {key: (id, hash, parent) for (key, id, hash, parent) in rows}
+
+    def remove(self, ids: Iterable[int]):
+        for id in ids:
+            (text,) = self.db.execute(
+                "SELECT text FROM documents WHERE id = ?", (id,)
+            ).fetchone()
+            self.db.executemany(
+                "DELETE FROM postings WHERE token = ? AND doc = ?",
+                [(token, id) for token in set(tokenize(text))],
+            )
+            self.db.execute("DELETE FROM documents WHERE id = ?", (id,))
+
+    def insert(self, documents: List[Dict[str, Any]]):
+        (last,) = self.db.execute("SELECT MAX(id) FROM documents").fetchone()
+        postings = []
+        for (id, document) in enumerate(documents, start=(last or 0) + 1):
+            document["id"] = id
+            tokens = tokenize(document["text"])
+            for (token, positions) in positions_by_token(tokens).items():
+                postings.append((token, id, positions.tobytes()))
+        self.db.executemany(
+            "INSERT INTO documents"
+            " (id, key, kind, parent, timestamp, speaker, user, title, text, hash)"
+            " VALUES (:id, :key, :kind, :parent, :timestamp, :speaker, :user,"
+            " :title, :text, :hash)",
+            documents,
+        )
+        self.db.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+
+    def update_documents(
+        self,
+        kind: str,
+        documents: Iterable[Dict[str, Any]],
+        stale: Set[str | None] | None = None,
+    ) -> Tuple[int, int]:
+        """
+        Adds or replaces the `documents` of `kind` whose hash changed. If
+        given, `stale` is the set of parents whose documents are all in
+        `documents`: any other document of theirs is removed.
+        Returns (added or changed, removed).
+        """
+        known = self.hashes(kind)
+        seen = set()
+        changed = []
+        replaced = []
+        for document in documents:
+            document["kind"] = kind
+            seen.add(document["key"])
+            previous = known.get(document["key"])
+            if previous is not None:
+                if previous[1] == document["hash"]:
+                    continue
+                replaced.append(previous[0])
+            changed.append(document)
+
+        removed = []
+        if stale is not None:
+            removed = [
+                id
+                for (key, (id, _, parent)) in known.items()
+                if key not in seen and parent in stale
+            ]
+        with self.db:
+            self.remove(replaced + removed)
+            self.insert(changed)
+        return len(changed), len(removed)
+
+    def update(
+        self,
+        kind: str,
+        documents: Iterable[Dict[str, Any]],
+        stale: Set[str | None] | None = None,
+    ) -> Tuple[int, int]:
+        # As in `load_messages`, everything allocated here stays alive until
+        # the batch is written, so the cyclic collector would only rescan it
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self.update_documents(kind, documents, stale)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def update_messages(
+        self, messages: Iterable[Any], complete: bool = True
+    ) -> Tuple[int, int]:
+        """
+        Indexes the content of `messages`. If `complete`, they are every
+        message of the world and any other indexed message is removed.
+        """
+        documents = (
+            message_document(message)
+            for message in messages
+            if message.raw.get("_id") is not None
+        )
+        return self.update("message", documents, {None} if complete else None)
+
+    def remove_messages(self, keys: Iterable[str]) -> int:
+        known = self.hashes("message")
+        ids = [known[key][0] for key in keys if key in known]
+        with self.db:
+            self.remove(ids)
+        return len(ids)
+
+    def update_pages(
+        self, journals: Dict[str, Dict[str, Any]], existing: Set[str] | None = None
+    ) -> Tuple[int, int]:
+        """
+        Indexes every page of `journals`, journal entries by id, and removes
+        the other pages of those journals. If given, `existing` holds the id
+        of every journal in the world; pages of any other are removed too.
+        """
+        documents = [
+            page_document(id, journal, page)
+            for (id, journal) in journals.items()
+            for page in journal.get("pages", [])
+        ]
+        stale = set(journals)
+        if existing is not None:
+            rows = self.db.execute(
+                "SELECT DISTINCT parent FROM documents WHERE kind = 'page'"
+            )
+            stale |= {parent for (parent,) in rows if parent not in existing}
+        return self.update("page", documents, stale)
+
+    def postings(
+        self, token: str, docs: Set[int] | None = None
+    ) -> Dict[int, array]:
+        if docs is not None and len(docs) < PROBE_LIMIT:
+            marks = ",".join("?" * len(docs))
+            rows = self.db.execute(
+                "SELECT doc, positions FROM postings"
+                f" WHERE token = ? AND doc IN ({marks})",
+                (token, *docs),
+            )
+        else:
+            rows = self.db.execute(
+                "SELECT doc, positions FROM postings WHERE token = ?", (token,)
+            )
+        result = {}
+        for (doc, blob) in rows:
+            positions = array("I")
+            positions.frombytes(blob)
+            result[doc] = positions
+        return result
+
+    def containing(self, token: str, docs: Set[int] | None = None) -> Set[int]:
+        if docs is not None and len(docs) < PROBE_LIMIT:
+            marks = ",".join("?" * len(docs))
+            rows = self.db.execute(
+                f"SELECT doc FROM postings WHERE token = ? AND doc IN ({marks})",
+                (token, *docs),
+            )
+        else:
+            rows = self.db.execute(
+                "SELECT doc FROM postings WHERE token = ?", (token,)
+            )
+        found = {doc for (doc,) in rows}
+        return found if docs is None else found & docs
+
+    def matches(self, phrase: List[str], docs: Set[int] | None) -> Set[int]:
+        # Documents in `docs` (or any) with the tokens of `phrase` in a row
+        if len(phrase) == 1:
+            # No positions needed
+            return self.containing(phrase[0], docs)
+        found = None
+        for (offset, token) in enumerate(phrase):
+            postings = self.postings(token, docs)
+            starts = {
+                doc: {p - offset for p in positions}
+                for (doc, positions) in postings.items()
+            }
+            if found is None:
+                found = starts
+            else:
+                found = {
+                    doc: found[doc] & starts[doc]
+                    for doc in found.keys() & starts.keys()
+                    if found[doc] & starts[doc]
+                }
+            docs = set(found)
+            if len(docs) == 0:
+                break
+        return docs if docs is not None else set()
+
+    def search(
+        self, text: str, limit: int = 20, kind: str | None = None
+    ) -> List[Dict[str, Any]]:
+        """
+        The documents containing every word and "quoted phrase" of `text`,
+        newest message first, then pages, up to `limit` of them.
+        """
+        phrases = []
+        for (quoted, word) in TERM.findall(text):
+            tokens = tokenize(quoted or word)
+            if tokens:
+                phrases.append(tokens)
+        if len(phrases) == 0:
+            return []
+
+        # Rarest phrase first, so later ones only probe its documents
+        def rarity(phrase: List[str]) -> int:
+            return min(self.document_frequency(token) for token in phrase)
+
+        docs = None
+        for phrase in sorted(phrases, key=rarity):
+            docs = self.matches(phrase, docs)
+            if len(docs) == 0:
+                return []
+
+        kinds = ("message", "page") if kind is None else (kind,)
+        if len(docs) < PROBE_LIMIT:
+            marks = ",".join("?" * len(docs))
+            rows = self.db.execute(
+                f"SELECT id, kind FROM documents WHERE id IN ({marks})"
+                " ORDER BY timestamp DESC, id DESC",
+                tuple(docs),
+            )
+        else:
+            # Common words: walk the timestamp index newest first, which
+            # finds `limit` hits long before reaching the end
+            rows = self.db.execute(
+                "SELECT id, kind FROM documents ORDER BY timestamp DESC, id DESC"
+            )
+        hits = []
+        for (id, found_kind) in rows:
+            if id in docs and found_kind in kinds:
+                hits.append(id)
+                if len(hits) == limit:
+                    break
+
+        rows = [
+            self.db.execute(
+                "SELECT key, kind, timestamp, speaker, user, title, text"
+                " FROM documents WHERE id = ?",
+                (id,),
+            ).fetchone()
+            for id in hits
+        ]
+        return [
+            {
+                "id": key,
+                "kind": kind,
+                "timestamp": timestamp,
+                "speaker": speaker,
+                "user": user,
+                "title": title,
+                "snippet": snippet(text, phrases[0][0]),
+            }
+            for (key, kind, timestamp, speaker, user, title, text) in rows
+        ]
+
+    def document_frequency(self, token: str) -> int:
+        (count,) = self.db.execute(
+            "SELECT COUNT(*) FROM postings WHERE token = ?", (token,)
+        ).fetchone()
+        return count
+
+
+def message_document(message: Any) -> Dict[str, Any]:
+    text = plain_text(message.content)
+    speaker = message.alias or message.user
+    return {
+        "key": message.raw["_id"],
+        "parent": None,
+        "timestamp": message.raw.get("timestamp"),
+        "speaker": speaker,
+        "user": message.user,
+        "title": None,
+        "text": text,
+        "hash": text_hash(text, speaker, message.user, message.raw.get("timestamp")),
+    }
+
+
+def page_document(
+    journal_id: str, journal: Dict[str, Any], page: Dict[str, Any]
+) -> Dict[str, Any]:
+    # Page names are searchable too
+    content = plain_text((page.get("text") or {}).get("content"))
+    text = f"{page.get('name')}: {content}"
+    title = f"{journal.get('name', journal_id)} / {page.get('name')}"
+    return {
+        # Page ids are only unique within their journal
+        "key": f"{journal_id}.{page['_id']}",
+        "parent": journal_id,
+        "timestamp": None,
+        "speaker": None,
+        "user": None,
+        "title": title,
+        "text": text,
+        "hash": text_hash(text, title),
+    }
+
+
+def snippet(text: str, token: str) -> str:
+    at = text.lower().find(token)
+    if at < 0:
+        return text[: 2 * SNIPPET]
+    start = max(0, at - SNIPPET)
+    prefix = "..." if start > 0 else ""
+    suffix = "..." if at + SNIPPET < len(text) else ""
+    return prefix + text[start : at + SNIPPET] + suffix
+
+
+def search_path(world_name: str, directory: str = "./search") -> str:
+    return f"{directory}/{world_name}_search.db"
+
+
+def open_search_index(world_name: str, directory: str = "./search") -> SearchIndex:
+    os.makedirs(directory, exist_ok=True)
+    return SearchIndex(search_path(world_name, directory))
+
+
+def update_search_index(
+    world_name: str, messages: List[Any], directory: str = "./search"
+) -> Tuple[int, int]:
+    with open_search_index(world_name, directory) as index:
+        (changed, removed) = index.update_messages(messages)
+    if changed or removed:
+        path = search_path(world_name, directory)
+        print(f"{path}: {changed} indexed, {removed} removed")
+    return changed, removed
+
+
+def format_hit(hit: Dict[str, Any]) -> str:
+    if hit["kind"] == "message":
+        when = datetime.fromtimestamp(hit["timestamp"] / 1000).isoformat(" ", "seconds")
+        return f"{when}  {hit['speaker']}: {hit['snippet']}"
+    return f"[{hit['title']}]  {hit['snippet']}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search a world's chat and journals")
+    parser.add_argument("world_name")
+    parser.add_argument("query", nargs="?", help='words and "quoted phrases"')
+    parser.add_argument("-n", "--limit", type=int, default=20)
+    parser.add_argument("--kind", choices=["message", "page"])
+    parser.add_argument("--directory", default="./search")
+    parser.add_argument(
+        "--build",
+        metavar="LOCATION",
+        help="index the chat of a world export, directory or snapshot first",
+    )
+    args = parser.parse_args()
+
+    if args.build is not None:
+        from core.sources import load_messages, open_source
+
+        messages = load_messages(open_source(args.build, args.world_name))
+        update_search_index(args.world_name, messages, args.directory)
+
+    if args.query is not None:
+        path = search_path(args.world_name, args.directory)
+        if not os.path.exists(path):
+            print(f"No search index at {path}")
+            exit(1)
+        with SearchIndex(path) as index:
+            for hit in index.search(args.query, args.limit, args.kind):
+                print(format_hit(hit))
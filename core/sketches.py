@@ -0,0 +1,259 @@
+import math
+from typing import Any, Dict, Iterable, List, Tuple
+
+from core.counters import RAW_DICE
+from core.fairness import RunStats, fairness
+
+QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+class Histogram(object):
+    """Exact counts per value, for die faces: memory grows with the faces."""
+
+    __slots__ = ["counts"]
+
+    def __init__(self, counts: Dict[int, int] | None = None):
+        self.counts: Dict[int, int] = {} if counts is None else dict(counts)
+
+    def add(self, value: int, count: int = 1):
+        self.counts[value] = self.counts.get(value, 0) + count
+
+    def merge(self, other: "Histogram") -> "Histogram":
+        for (value, count) in other.counts.items():
+            self.add(value, count)
+        return self
+
+    def dense(self, faces: int) -> List[int]:
+        # Index 0 is face 1
+        return [self.counts.get(face, 0) for face in range(1, faces + 1)]
+
+
+class TDigest(object):
+    """
+    A merging t-digest (Dunning & Ertl): a sorted list of (mean, weight)
+    centroids, small near the tails and large in the middle, that answers
+    quantile queries in memory bounded by `compression`. Digests merge by
+    pooling their centroids, so the digest of two sessions is the merge of
+    their digests. Quantiles are approximate, and shift slightly with the
+    order values arrive in; counts, extremes and the mean do not. Reading a
+    digest leaves it as it was, so one read part way through ends up the
+    same as one that never was.
+    """
+
+    __slots__ = ["compression", "centroids", "buffer", "count", "min", "max"]
+
+    def __init__(self, compression: int = 100):
+        self.compression = compression
+        self.centroids: List[Tuple[float, float]] = []
+        self.buffer: List[Tuple[float, float]] = []
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, weight: float = 1):
+        self.buffer.append((value, weight))
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.buffer) >= 5 * self.compression:
+            self.compress()
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        if other.count == 0:
+            return self
+        self.buffer += other.centroids + other.buffer
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self.buffer) >= 5 * self.compression:
+            self.compress()
+        return self
+
+    def scale(self, q: float) -> float:
+        # The k1 scale function: centroids may span at most 1 unit of k
+        q = min(max(q, 0.0), 1.0)
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def compress(self):
+        if len(self.buffer) == 0:
+            return
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+
+        merged = []
+        before = 0  # weight of the centroids already emitted
+        k_start = self.scale(0)
+        (mean, weight) = points[0]
+        for (m, w) in points[1:]:
+            if self.scale((before + weight + w) / self.count) - k_start <= 1:
+                weight += w
+                mean += (m - mean) * w / weight
+            else:
+                merged.append((mean, weight))
+                before += weight
+                k_start = self.scale(before / self.count)
+                (mean, weight) = (m, w)
+        merged.append((mean, weight))
+        self.centroids = merged
+
+    def compressed(self) -> "TDigest":
+        # A compressed copy, to read from
+        if len(self.buffer) == 0:
+            return self
+        digest = TDigest(self.compression)
+        digest.centroids = list(self.centroids)
+        digest.buffer = list(self.buffer)
+        digest.count = self.count
+        digest.min = self.min
+        digest.max = self.max
+        digest.compress()
+        return digest
+
+    def quantile(self, q: float) -> float | None:
+        if self.count == 0:
+            return None
+
+        # Each centroid's mean sits at the middle of its weight; interpolate
+        # between neighbours, and out to the extremes at either end
+        target = q * self.count
+        previous = (0.0, self.min)
+        cumulative = 0.0
+        for (mean, weight) in self.compressed().centroids + [(self.max, 0)]:
+            position = self.count if weight == 0 else cumulative + weight / 2
+            if target <= position:
+                (p0, v0) = previous
+                if position == p0:
+                    return mean
+                return v0 + (mean - v0) * (target - p0) / (position - p0)
+            previous = (position, mean)
+            cumulative += weight
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        if self.count == 0:
+            return {"count": 0}
+        digest = self.compressed()
+        mean = sum(m * w for (m, w) in digest.centroids) / self.count
+        data = {"count": self.count, "min": self.min, "max": self.max, "mean": mean}
+        for q in QUANTILES:
+            data[f"p{round(q * 100)}"] = digest.quantile(q)
+        return data
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "compression": self.compression,
+            "count": self.count,
+            "min": self.min if self.count > 0 else None,
+            "max": self.max if self.count > 0 else None,
+            "centroids": [list(c) for c in self.compressed().centroids],
+        }
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> "TDigest":
+        digest = TDigest(data["compression"])
+        digest.centroids = [tuple(c) for c in data["centroids"]]
+        digest.count = data["count"]
+        if digest.count > 0:
+            digest.min = data["min"]
+            digest.max = data["max"]
+        return digest
+
+
+class Distributions(object):
+    """
+    Distributions for some set of messages: exact histograms and low/high
+    streaks of the raw results of each die type in `RAW_DICE`, and t-digests
+    of the totals (after modifiers) of d20 rolls and of damage rolls, per
+    damage item. Like `StatsAccumulator`, filled one message at a time, in
+    order, and mergeable.
+    """
+
+    __slots__ = ["faces", "runs", "d20_totals", "damage"]
+
+    def __init__(self):
+        self.faces: Dict[int, Histogram] = {}
+        self.runs: Dict[int, RunStats] = {}
+        self.d20_totals = TDigest()
+        self.damage: Dict[str | None, TDigest] = {}
+
+    def add(self, message: Any):
+        dice = message.get_dice()
+        for die in dice:
+            if die.faces in RAW_DICE:
+                if die.faces not in self.faces:
+                    self.faces[die.faces] = Histogram()
+                    self.runs[die.faces] = RunStats()
+                histogram = self.faces[die.faces]
+                runs = self.runs[die.faces]
+                half = die.faces / 2
+                for result in die.get_all_dice_results():
+                    histogram.add(result)
+                    runs.add(result > half)
+
+        is_d20 = any(die.is_dx(20) for die in dice)
+        if is_d20 or message.is_damage():
+            totals = [roll.total for roll in message.rolls]
+            if None in totals:
+                return
+            if is_d20:
+                self.d20_totals.add(sum(totals))
+            if message.is_damage():
+                if message.damage_item not in self.damage:
+                    self.damage[message.damage_item] = TDigest()
+                self.damage[message.damage_item].add(sum(totals))
+
+    def merge(self, other: "Distributions") -> "Distributions":
+        for (faces, histogram) in other.faces.items():
+            if faces not in self.faces:
+                self.faces[faces] = Histogram()
+                self.runs[faces] = RunStats()
+            self.faces[faces].merge(histogram)
+            self.runs[faces].merge(other.runs[faces])
+        self.d20_totals.merge(other.d20_totals)
+        for (item, digest) in other.damage.items():
+            if item not in self.damage:
+                self.damage[item] = TDigest()
+            self.damage[item].merge(digest)
+        return self
+
+    @staticmethod
+    def merged(distributions: Iterable["Distributions"]) -> "Distributions":
+        total = Distributions()
+        for d in distributions:
+            total.merge(d)
+        return total
+
+    def fairness(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            str(faces): fairness(self.faces[faces].dense(faces), self.runs[faces])
+            for faces in RAW_DICE
+            if faces in self.faces
+        }
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "faces": {
+                str(faces): self.faces[faces].dense(faces)
+                for faces in RAW_DICE
+                if faces in self.faces
+            },
+            "d20_total": self.d20_totals.summary(),
+            "damage": {
+                "unknown" if item is None else item: digest.summary()
+                for (item, digest) in self.damage.items()
+            },
+        }
+
+
+def distribution_rows(
+    by_user: Dict[str, Distributions], players: List[str]
+) -> List[Distributions]:
+    # Same rows, in the same order, as counters.player_rows. The streaks of
+    # a merged row are each user's own, one user after another.
+    return [
+        Distributions.merged(by_user.values()),
+        Distributions.merged(
+            d for (user, d) in by_user.items() if user != "Gamemaster"
+        ),
+    ] + [by_user.get(user, Distributions()) for user in ["Gamemaster"] + players]
+
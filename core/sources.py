@@ -0,0 +1,402 @@
+import gc
+import gzip
+import heapq
+import json
+import os
+import sys
+import zipfile
+from contextlib import ExitStack
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+from core.models import Message
+from core.query import Query
+from core.world_archive import NEDB_MESSAGES, detect_format, extracted_world
+
+# Every source yields the same stream: a map of user ids to names, then the
+# chat records as Foundry stores them. `load_messages` turns any source into
+# `Message`s, so parsing, filtering and query pushdown exist once.
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = ".jsonl.gz"
+BATCH_SIZE = 4096
+
+
+def parse_lines(lines: List[bytes]) -> List[Dict[str, Any]]:
+    lines = [line for line in lines if line.strip()]
+    try:
+        # One parser call per batch rather than per record
+        return json.loads(b"[" + b",".join(lines) + b"]")
+    except json.JSONDecodeError:
+        # Find the bad record, for the error message
+        return [json.loads(line) for line in lines]
+
+
+def split_records(f, chunk_size: int = 1 << 22) -> Iterator[Dict[str, Any]]:
+    # NeDB files and snapshots hold one JSON record per line
+    tail = b""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        yield from parse_lines(lines)
+    yield from parse_lines([tail])
+
+
+class Source(object):
+    """
+    A world's users and chat records. Use as a context manager: a source
+    may need to open databases or extract files first.
+    """
+
+    def __enter__(self) -> "Source":
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def users(self) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def segments(self) -> List[Iterator[Dict[str, Any]]]:
+        # The records, split where they come from separately ordered files
+        return [self.records()]
+
+
+class ForgeArchive(object):
+    """
+    A Forge world export. Member names are resolved once, by base name, and
+    NeDB members are decompressed in large chunks, split on newlines in bulk
+    and parsed a chunk at a time.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.archive = zipfile.ZipFile(filename, "r")
+        # Base name -> (position in the archive, member); the first wins
+        self.members: Dict[str, Tuple[int, zipfile.ZipInfo]] = {}
+        for (position, info) in enumerate(self.archive.infolist()):
+            name = info.filename.rsplit("/", 1)[-1]
+            if name not in self.members:
+                self.members[name] = (position, info)
+
+    def find(self, *names: str) -> zipfile.ZipInfo | None:
+        # Whichever of `names` comes first in the archive
+        found = [self.members[name] for name in names if name in self.members]
+        return min(found, key=lambda member: member[0])[1] if found else None
+
+    def records(self, member: zipfile.ZipInfo) -> Iterator[Dict[str, Any]]:
+        with self.archive.open(member) as f:
+            yield from split_records(f)
+
+    def close(self):
+        self.archive.close()
+
+    def __enter__(self) -> "ForgeArchive":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class NedbZipSource(Source):
+    """NeDB `.db` files read in place from one or more Forge exports."""
+
+    def __init__(self, filenames: List[str]):
+        self.filenames = filenames
+
+    def users(self) -> Dict[str, str]:
+        user_map = {}
+        for filename in self.filenames:
+            with ForgeArchive(filename) as archive:
+                file = archive.find("users.db")
+                if file is None:
+                    print(f"Could not find users.db in {filename}, using user ids")
+                    continue
+                for raw in archive.records(file):
+                    user_map[raw["_id"]] = raw["name"]
+        return user_map
+
+    def archive_records(self, filename: str) -> Iterator[Dict[str, Any]]:
+        with ForgeArchive(filename) as archive:
+            file = archive.find("chat.db", "messages.db")
+            if file is None:
+                raise FileNotFoundError(
+                    f"Could not find chat.db or messages.db in {filename}"
+                )
+            yield from archive.records(file)
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        for filename in self.filenames:
+            yield from self.archive_records(filename)
+
+    def segments(self) -> List[Iterator[Dict[str, Any]]]:
+        return [self.archive_records(filename) for filename in self.filenames]
+
+
+class NedbDirectorySource(Source):
+    """An unzipped NeDB world: `{path}/data/users.db` and `messages.db`."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def users(self) -> Dict[str, str]:
+        path = f"{self.path}/data/users.db"
+        if not os.path.exists(path):
+            print(f"Could not find {path}, using user ids")
+            return {}
+        with open(path, "rb") as f:
+            return {raw["_id"]: raw["name"] for raw in split_records(f)}
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        for name in NEDB_MESSAGES:
+            path = f"{self.path}/data/{name}"
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    yield from split_records(f)
+                return
+        raise FileNotFoundError(
+            f"Could not find chat.db or messages.db in {self.path}"
+        )
+
+
+def leveldb_values(db) -> Iterator[Dict[str, Any]]:
+    batch = []
+    for value in db.iterator(include_key=False):
+        batch.append(value)
+        if len(batch) == BATCH_SIZE:
+            yield from parse_lines(batch)
+            batch = []
+    yield from parse_lines(batch)
+
+
+def leveldb_user_map(db) -> Dict[str, str]:
+    user_map = {}
+    for key, value in db:
+        user_map[key.decode().split("!")[-1]] = json.loads(value.decode())["name"]
+    return user_map
+
+
+class LevelDBSource(Source):
+    """A LevelDB world directory (Foundry v11+), read with plyvel."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def open(self, store: str):
+        import plyvel
+
+        return plyvel.DB(f"{self.path}/data/{store}", create_if_missing=False)
+
+    def users(self) -> Dict[str, str]:
+        db = self.open("users")
+        try:
+            return leveldb_user_map(db)
+        finally:
+            db.close()
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        db = self.open("messages")
+        try:
+            yield from leveldb_values(db)
+        finally:
+            db.close()
+
+
+class LevelDBArchiveSource(LevelDBSource):
+    """A LevelDB world inside a Forge export; see `extracted_world`."""
+
+    def __init__(self, filename: str, world_name: str | None = None):
+        super().__init__("")
+        self.filename = filename
+        self.world_name = world_name
+        self.stack = ExitStack()
+
+    def __enter__(self) -> "LevelDBArchiveSource":
+        self.path = self.stack.enter_context(
+            extracted_world(self.filename, self.world_name)
+        )
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stack.close()
+
+
+class SnapshotSource(Source):
+    """
+    A snapshot written by `write_snapshot`: the users and records of another
+    source, gzipped, one JSON document per line, with deleted records
+    already dropped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def header(self, f) -> Dict[str, Any]:
+        header = json.loads(f.readline())
+        if header.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"{self.path} is not a version {SNAPSHOT_VERSION} snapshot"
+            )
+        return header
+
+    def users(self) -> Dict[str, str]:
+        with gzip.open(self.path, "rb") as f:
+            return self.header(f)["users"]
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        with gzip.open(self.path, "rb") as f:
+            self.header(f)
+            yield from split_records(f)
+
+
+def write_snapshot(source: Source, path: str):
+    with source, gzip.open(path, "wb", compresslevel=1) as f:
+        header = {"version": SNAPSHOT_VERSION, "users": source.users()}
+        f.write(json.dumps(header).encode() + b"\n")
+        for raw in source.records():
+            if not raw.get("$$deleted"):
+                f.write(json.dumps(raw, separators=(",", ":")).encode() + b"\n")
+    print(path)
+
+
+def open_source(location: str, world_name: str | None = None) -> Source:
+    """
+    Picks the source for `location`: a Forge export (LevelDB or NeDB), a
+    snapshot, or a LevelDB or NeDB world directory.
+    """
+    if location.endswith(SNAPSHOT_SUFFIX):
+        return SnapshotSource(location)
+    if location.endswith(".zip"):
+        if detect_format(location, world_name) == "leveldb":
+            return LevelDBArchiveSource(location, world_name)
+        return NedbZipSource([location])
+    if os.path.isdir(f"{location}/data/messages"):
+        return LevelDBSource(location)
+    if any(os.path.exists(f"{location}/data/{n}") for n in NEDB_MESSAGES):
+        return NedbDirectorySource(location)
+    raise ValueError(f"No Foundry world found at {location}")
+
+
+def record_user(raw: Dict[str, Any]) -> Tuple[bool, str | None]:
+    # Foundry v11 renamed a message's "user" to "author"
+    if "author" in raw:
+        return True, raw["author"]
+    if "user" in raw:
+        return True, raw["user"]
+    return False, None
+
+
+def intern_optional(value: Any) -> Any:
+    return sys.intern(value) if type(value) == str else value
+
+
+def message_from_record(
+    raw: Dict[str, Any], user_map: Dict[str | None, str], query: Query | None = None
+) -> Message | None:
+    if "$$deleted" in raw and raw["$$deleted"]:
+        return None
+    (found, user_id) = record_user(raw)
+    if not found:
+        return None
+    user = user_map.get(user_id, user_id)
+    if query is not None and not query.matches_raw(raw, user):
+        return None
+    roll_data = []
+    if "roll" in raw:
+        roll_data.append(raw["roll"])
+    if "rolls" in raw:
+        roll_data = raw["rolls"]
+
+    # A world has few distinct speakers but many messages from each, so
+    # every message shares one copy of its speaker's strings
+    speaker = raw["speaker"]
+    alias = intern_optional(speaker.get("alias"))
+
+    for i in range(len(roll_data)):
+        if type(roll_data[i]) == str:
+            roll_data[i] = json.loads(roll_data[i])
+    d = {
+        "user": user,
+        "data": roll_data,
+        "timestamp": int(raw["timestamp"]),
+        "content": raw["content"],
+        "alias": alias,
+        "flags": raw["flags"],
+        "raw": raw,
+        "actor": intern_optional(speaker.get("actor")),
+        "token": intern_optional(speaker.get("token")),
+    }
+    if "data" in d and not d["data"] is None:
+        if "class" in d["data"]:
+            d["data"]["roll_type"] = d["data"]["class"]
+            del d["data"]["class"]
+    return Message(**d)
+
+
+def parse_message(
+    value: str, user_map: Dict[str | None, str], query: Query | None = None
+) -> Message | None:
+    # One LevelDB value, as read by watch_main.py
+    return message_from_record(json.loads(value), user_map, query)
+
+
+def timestamp(message: Message) -> int:
+    return message.timestamp
+
+
+def load_messages(source: Source, query: Query | None = None) -> List[Message]:
+    """
+    The messages of `source`, by timestamp. Messages with the same
+    timestamp keep the order of their segments and, within a segment, of
+    their records.
+    """
+    # Parsing allocates millions of small dicts that all stay alive; the
+    # cyclic garbage collector would only rescan them again and again
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with source:
+            user_map: Dict[str | None, str] = {None: "UNKNOWN USER"}
+            user_map |= source.users()
+            ids: Set[str] = set()
+            segments = []
+            for records in source.segments():
+                segment = messages_from_records(records, user_map, query, ids)
+                # NeDB files are appended to as messages arrive, so this is
+                # close to linear; LevelDB records come in id order
+                segment.sort(key=timestamp)
+                segments.append(segment)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    if len(segments) == 1:
+        return segments[0]
+    return list(heapq.merge(*segments, key=timestamp))
+
+
+def messages_from_records(
+    records: Iterable[Dict[str, Any]],
+    user_map: Dict[str | None, str],
+    query: Query | None = None,
+    ids: Set[str] | None = None,
+) -> List[Message]:
+    # Exports merged from several archives repeat records; the first wins.
+    # `ids` holds the ids seen in earlier segments.
+    if ids is None:
+        ids = set()
+    messages = []
+    for raw in records:
+        id = raw.get("_id")
+        if id is not None:
+            if id in ids:
+                continue
+            ids.add(id)
+        message = message_from_record(raw, user_map, query)
+        if message is not None:
+            messages.append(message)
+    return messages
@@ -0,0 +1,417 @@
+from typing import Any, Dict, Iterator, List, Mapping, Tuple, Union
+
+from core.aggregates import Aggregates
+from core.counters import player_rows
+from core.models import Die, Message
+from core.timing import timed
+
+
+def flatten(l: List[List[Any]]) -> List[Any]:
+    return [item for sublist in l for item in sublist]
+
+
+def apply_april_fools_filter(messages: List[Message]) -> List[Message]:
+    filtered = []
+    in_april_fools = False
+
+    for message in messages:
+        if "# April Fools Marker" in message.content:
+            in_april_fools = True
+
+        if "#End April Fools" in message.content:
+            in_april_fools = False
+
+        if not in_april_fools:
+            filtered.append(message)
+
+    return filtered
+
+
+def get_all_dice(messages: List[Message]) -> List[Die]:
+    dice_nested = [m.get_dice() for m in messages]
+    dice = flatten(dice_nested)
+    return dice
+
+
+def generate_die_type_count(messages: List[Message]) -> Dict[int, int]:
+    dice = get_all_dice(messages)
+    unique_die_types = set([die.faces for die in dice])
+    data = {}
+    for die_type in unique_die_types:
+        count = sum([die.number for die in dice if die.is_dx(die_type)])
+        data[die_type] = count
+    return data
+
+
+def generate_die_type_average(messages: List[Message]) -> Dict[int, int]:
+    dice = get_all_dice(messages)
+    data = generate_die_type_count(messages)
+    for die_type in data.keys():
+        count = data[die_type]
+        total_value = sum(
+            flatten([die.get_all_dice_results() for die in dice if die.is_dx(die_type)])
+        )
+        data[die_type] = total_value / count
+    return data
+
+
+def get_d20s(messages: List[Message]) -> List[Die]:
+    dice = get_all_dice(messages)
+    return [die for die in dice if die.is_dx(20)]
+
+
+def count_advantage(dice: List[Die]) -> int:
+    return len([die for die in dice if die.advantage])
+
+
+def count_disadvantage(dice: List[Die]) -> int:
+    return len([die for die in dice if die.disadvantage])
+
+
+def count_nat_20s(dice: List[Die]) -> int:
+    return len([die for die in dice if die.is_nat_20()])
+
+
+def count_nat_1s(dice: List[Die]) -> int:
+    return len([die for die in dice if die.is_nat_1()])
+
+
+def count_msgs_if(messages: List[Message], function, expected) -> int:
+    return len(get_matching_msgs(messages, function, expected))
+
+
+def get_matching_msgs(messages: List[Message], function, expected) -> List[Message]:
+    return [message for message in messages if function(message) == expected]
+
+
+def inverse_filter_user(messages: List[Message], user: str) -> List[Message]:
+    return list(filter(lambda message: message.user != user, messages))
+
+
+def average_raw_roll(dice: List[Die]) -> float:
+    all_active = flatten([die.active_results for die in dice])
+    all_inactive = flatten([
+        die.inactive_results for die in dice
+    ])
+    all = all_active + all_inactive
+    total_value = sum(all)
+    count = len(all)
+    if count == 0:
+        return 0
+    return total_value / count
+
+
+def average_final_d20_roll(messages: List[Message]) -> float:
+    dice = get_d20s(messages)
+    all_active = [die.active_results[0] for die in dice]
+    total_value = sum(all_active)
+    count = len(all_active)
+    if count == 0:
+        return 0
+    return total_value / count
+
+
+def average_d20_after_modifiers(messages: List[Message]) -> float:
+    total_value = sum(
+        flatten([[roll.total for roll in message.rolls] for message in messages])
+    )
+    count = len(messages)
+    if count == 0:
+        return 0
+    return total_value / count
+
+
+def saving_throw_average(messages: List[Message], save_type: str) -> float:
+    count = count_msgs_if(messages, Message.save_type, save_type)
+    if count == 0:
+        return 0.0
+    return average_d20_after_modifiers(
+        [message for message in messages if message.save_type() == save_type]
+    )
+
+
+def ability_check_average(messages: List[Message], ability_type: str) -> float:
+    count = count_msgs_if(messages, Message.ability_type, ability_type)
+    if count == 0:
+        return 0.0
+    return average_d20_after_modifiers(
+        [message for message in messages if message.ability_type() == ability_type]
+    )
+
+
+def skill_check_average(messages: List[Message], skill_type: str) -> float:
+    count = count_msgs_if(messages, Message.skill_type, skill_type)
+    if count == 0:
+        return 0.0
+    return average_d20_after_modifiers(
+        [message for message in messages if message.skill_type() == skill_type]
+    )
+
+
+def generate_skill_data(messages: List[Message]) -> Mapping[str, Union[float, str, int]]:
+    skills = [
+        "acr",
+        "ani",
+        "arc",
+        "ath",
+        "dec",
+        "his",
+        "ins",
+        "itm",
+        "inv",
+        "med",
+        "nat",
+        "prc",
+        "prf",
+        "per",
+        "rel",
+        "slt",
+        "ste",
+        "sur",
+    ]
+    data = {}
+    for id in skills:
+        data[f"{id}_skill_average"] = skill_check_average(messages, id)
+        data[f"{id}_skill_count"] = count_msgs_if(messages, Message.skill_type, id)
+    return data
+
+
+def generate_ability_data(messages: List[Message]) -> Mapping[str, Union[float, str]]:
+    abilities = ["str", "dex", "con", "wis", "int", "cha"]
+    data = {}
+    for id in abilities:
+        data[f"{id}_ability_average"] = ability_check_average(messages, id)
+        data[f"{id}_ability_count"] = count_msgs_if(messages, Message.ability_type, id)
+    return data
+
+
+def generate_save_data(messages: List[Message]) -> Mapping[str, Union[float, str]]:
+    skills = ["str", "dex", "con", "wis", "int", "cha", "death"]
+    data = {}
+    for id in skills:
+        data[f"{id}_save_average"] = saving_throw_average(messages, id)
+        data[f"{id}_save_count"] = count_msgs_if(messages, Message.save_type, id)
+    return data
+
+
+def get_dx_raw_count(messages: List[Message], x: int) -> int:
+    dice = get_all_dice(messages)
+    dxs = [die for die in dice if die.is_dx(x)]
+    all_active = flatten([die.active_results for die in dxs])
+    all_inactive = flatten([
+        die.inactive_results for die in dxs
+    ])
+    all = all_active + all_inactive
+    count = len(all)
+
+    return count
+
+
+def generate_raw_die_stats(messages: List[Message]) -> Mapping[str, Union[float, str]]:
+    dice = [347, 100, 20, 12, 10, 8, 6, 4]
+
+    data = {}
+    for x in dice:
+        count = get_dx_raw_count(messages, x)
+        data[f"d{x}_raw_count"] = count
+        all_dice = get_all_dice(messages)
+        dxs = [die for die in all_dice if die.is_dx(x)]
+        data[f"d{x}_raw_average"] = average_raw_roll(dxs)
+    return data
+
+
+def generate_data(messages: List[Message], user=None) -> Dict[str, Union[float, str]]:
+    if user == "All Players":
+        messages = inverse_filter_user(messages, "Gamemaster")
+    elif not user is None:
+        messages = get_matching_msgs(messages, lambda m: m.user, user)
+
+    d20s = get_d20s(messages)
+    d20_messages = get_matching_msgs(messages, Message.has_d20, True)
+
+    d20_attack_messages = get_matching_msgs(messages, Message.is_attack, True)
+    d20_save_messages = get_matching_msgs(messages, Message.is_saving_throw, True)
+    d20_skill_messages = get_matching_msgs(messages, Message.is_skill_check, True)
+    d20_ability_messages = get_matching_msgs(messages, Message.is_ability_check, True)
+    d20_initiative_messages = get_matching_msgs(
+        messages, Message.is_initiative_roll, True
+    )
+
+    d20_count = sum([die.number for die in d20s])
+    roll_count = len(d20_messages)  # Number of rolls (advantage and disadvantage count as 1)
+    advantage_count = count_advantage(d20s)
+    disadvantage_count = count_disadvantage(d20s)
+    skill_check_count = len(d20_skill_messages)
+    ability_check_count = len(d20_ability_messages)
+    saving_throw_count = len(d20_save_messages)
+    attack_roll_count = len(d20_attack_messages)
+    initiative_roll_count = len(d20_initiative_messages)
+    advantage_ratio = 0 if roll_count == 0 else advantage_count / roll_count
+    disadvantage_ratio = 0 if roll_count == 0 else disadvantage_count / roll_count
+
+    return (
+        {
+            "d20_roll_count": roll_count,
+            "advantage_count": advantage_count,
+            "disadvantage_count": disadvantage_count,
+            "advantage_ratio": advantage_ratio,
+            "disadvantage_ratio": disadvantage_ratio,
+            "skill_check_count": skill_check_count,
+            "skill_check_ratio": 0
+            if roll_count == 0
+            else skill_check_count / roll_count,
+            "ability_check_count": ability_check_count,
+            "ability_check_ratio": 0
+            if roll_count == 0
+            else ability_check_count / roll_count,
+            "saving_throw_count": saving_throw_count,
+            "saving_throw_ratio": 0
+            if roll_count == 0
+            else saving_throw_count / roll_count,
+            "attack_roll_count": attack_roll_count,
+            "attack_roll_ratio": 0
+            if roll_count == 0
+            else attack_roll_count / roll_count,
+            "initiative_roll_count": initiative_roll_count,
+            "initiative_roll_ratio": 0.0
+            if initiative_roll_count == 0
+            else initiative_roll_count / roll_count,
+            "nat_20_count": count_nat_20s(d20s),
+            "nat_20_ratio": 0 if roll_count == 0 else count_nat_20s(d20s) / roll_count,
+            "nat_1_count": count_nat_1s(d20s),
+            "nat_1_ratio": 0 if roll_count == 0 else count_nat_1s(d20s) / roll_count,
+            "stolen_nat_20_count": len([die for die in d20s if die.is_stolen_nat_20()]),
+            "super_nat_20_count": len([die for die in d20s if die.is_super_nat_20()]),
+            "disadvantage_nat_20_count": len(
+                [die for die in d20s if die.is_disadvantage_nat_20()]
+            ),
+            "dropped_nat_1_count": len([die for die in d20s if die.is_dropped_nat_1()]),
+            "super_nat_1_count": len([die for die in d20s if die.is_super_nat_1()]),
+            "advantage_nat_1_count": len(
+                [die for die in d20s if die.is_advantage_nat_1()]
+            ),
+            "average_raw_d20_roll": average_raw_roll(d20s),
+            "average_final_d20_roll": average_final_d20_roll(d20_messages),
+            "average_d20_after_modifiers": average_d20_after_modifiers(d20_messages),
+            "average_attack_before_modifiers": average_final_d20_roll(
+                d20_attack_messages
+            ),
+            "average_initiative_before_modifiers": average_final_d20_roll(
+                d20_initiative_messages
+            ),
+            "average_save_before_modifiers": average_final_d20_roll(d20_save_messages),
+            "average_skill_before_modifiers": average_final_d20_roll(
+                d20_skill_messages
+            ),
+            "average_ability_before_modifiers": average_final_d20_roll(
+                d20_ability_messages
+            ),
+            "average_attack_after_modifiers": average_d20_after_modifiers(
+                d20_attack_messages
+            ),
+            "average_initiative_after_modifiers": average_d20_after_modifiers(
+                d20_initiative_messages
+            ),
+            "average_save_after_modifiers": average_d20_after_modifiers(
+                d20_save_messages
+            ),
+            "average_skill_after_modifiers": average_d20_after_modifiers(
+                d20_skill_messages
+            ),
+            "average_ability_after_modifiers": average_d20_after_modifiers(
+                d20_ability_messages
+            ),
+        }
+        | generate_save_data(d20_save_messages)
+        | generate_ability_data(d20_ability_messages)
+        | generate_skill_data(d20_skill_messages)
+        | generate_raw_die_stats(messages)
+    )
+
+
+# Messages at least this far apart (in milliseconds) are in different sessions
+SESSION_GAP = 24 * 3600 * 1000
+
+
+class Session(object):
+    def __init__(self, message: Message):
+        self.messages = [message]
+        self.min_time = message.timestamp
+        self.max_time = message.timestamp
+        self.count = 1
+
+    def in_session(self, message: Message):
+        return message.timestamp - self.max_time < SESSION_GAP
+
+    def add_message(self, message: Message):
+        self.messages.append(message)
+        self.max_time = message.timestamp
+        self.count += 1
+
+    @staticmethod
+    def from_messages(messages: List[Message]) -> "Session":
+        session = Session(messages[0])
+        session.messages = messages
+        session.max_time = messages[-1].timestamp
+        session.count = len(messages)
+        return session
+
+
+def group_sessions(messages: List[Message]) -> List[Session]:
+    # Sessions of more than 10 messages; `messages` must be sorted
+    return [
+        Session.from_messages(messages[start:end])
+        for (start, end) in session_ranges(messages)
+    ]
+
+
+def session_ranges(messages: List[Message]) -> Iterator[Tuple[int, int]]:
+    """
+    The sessions in `messages`, which must be sorted, as (start, end)
+    slices. A session ends at the first gap of `SESSION_GAP`.
+    """
+    start = 0
+    for i in range(1, len(messages) + 1):
+        if (
+            i == len(messages)
+            or messages[i].timestamp - messages[i - 1].timestamp >= SESSION_GAP
+        ):
+            if i - start > 10:
+                yield start, i
+            start = i
+
+
+def build_d20_data(
+    messages: List[Message],
+    players: List[str],
+    timings: Dict[str, float] | None = None,
+    aggregates: Aggregates | None = None,
+) -> Tuple[List[Dict[str, Union[float, str]]], Dict[str, Dict[str, Any]]]:
+    """
+    One `generate_data` row per player, as accumulated in a single pass
+    rather than one pass per row, and the tables published next to them.
+    `aggregates` may hold the accumulators for `messages` already, e.g. kept
+    up to date by watch_main.py.
+    """
+    if timings is None:
+        timings = {}
+
+    with timed(timings, "generate_data"):
+        if aggregates is None:
+            aggregates = Aggregates.from_messages(messages)
+        d20_data = player_rows(aggregates.by_user, players)
+
+    with timed(timings, "sessions"):
+        sessions = group_sessions(messages)
+
+    with timed(timings, "generate_data"):
+        prev = Aggregates.from_messages(sessions[-1].messages)
+        d20_data_prev_session = player_rows(prev.by_user, players)
+        tables = aggregates.tables(players, prev)
+
+        for i in range(len(d20_data)):
+            for (key, value) in d20_data_prev_session[i].items():
+                if "count" in key:
+                    d20_data[i][f"{key}_prev"] = value
+
+    return d20_data, tables
@@ -0,0 +1,20 @@
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+@contextmanager
+def timed(timings: Dict[str, float], stage: str):
+    # Accumulates, so a stage that runs more than once reports its total
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def format_timings(timings: Dict[str, float]) -> str:
+    width = max([len(stage) for stage in timings] + [5])
+    lines = [f"{stage:<{width}}  {seconds:8.3f}s" for (stage, seconds) in timings.items()]
+    lines.append(f"{'total':<{width}}  {sum(timings.values()):8.3f}s")
+    return "\n".join(lines)
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from typing import Iterator, List
+
+# The only LevelDB stores the stats need; a world export also holds every
+# other store and all of the world's assets
+LEVELDB_STORES = ["users", "messages"]
+NEDB_MESSAGES = ["chat.db", "messages.db"]
+
+
+def leveldb_roots(archive: zipfile.ZipFile) -> List[str]:
+    # The world directory prefix of every LevelDB world in the archive
+    marker = "data/messages/CURRENT"
+    return [
+        name[: -len(marker)] for name in archive.namelist() if name.endswith(marker)
+    ]
+
+
+def leveldb_root(
+    archive: zipfile.ZipFile, world_name: str | None = None
+) -> str | None:
+    roots = leveldb_roots(archive)
+    for root in roots:
+        if root.rstrip("/").rsplit("/", 1)[-1] == world_name:
+            return root
+    # A single world is taken whatever its directory is called
+    return roots[0] if len(roots) == 1 else None
+
+
+def detect_format(filename: str, world_name: str | None = None) -> str:
+    """
+    "leveldb" for a world directory with LevelDB stores (Foundry v11+),
+    "nedb" for NeDB `.db` files, which main.py reads straight from the zip.
+    """
+    with zipfile.ZipFile(filename) as archive:
+        if leveldb_root(archive, world_name) is not None:
+            return "leveldb"
+        names = {name.rsplit("/", 1)[-1] for name in archive.namelist()}
+        if any(name in names for name in NEDB_MESSAGES):
+            return "nedb"
+    raise ValueError(f"No {world_name or 'Foundry'} world found in {filename}")
+
+
+@contextmanager
+def extracted_world(
+    filename: str, world_name: str | None = None, directory: str | None = None
+) -> Iterator[str]:
+    """
+    Extracts only the `LEVELDB_STORES` of the world in `filename` into a
+    temporary world directory (in `directory`, e.g. /dev/shm, if given),
+    yields its path and removes it afterwards.
+    """
+    world = tempfile.mkdtemp(prefix="world_", dir=directory)
+    try:
+        with zipfile.ZipFile(filename) as archive:
+            root = leveldb_root(archive, world_name)
+            if root is None:
+                raise ValueError(
+                    f"No {world_name or 'LevelDB'} world found in {filename}"
+                )
+            for store in LEVELDB_STORES:
+                prefix = f"{root}data/{store}/"
+                os.makedirs(os.path.join(world, "data", store))
+                for info in archive.infolist():
+                    name = info.filename[len(prefix) :]
+                    if not info.filename.startswith(prefix) or "/" in name:
+                        continue
+                    if info.is_dir() or name == "LOCK":
+                        continue
+                    path = os.path.join(world, "data", store, name)
+                    with archive.open(info) as src, open(path, "wb") as dst:
+                        shutil.copyfileobj(src, dst, 1 << 20)
+        yield world
+    finally:
+        shutil.rmtree(world, ignore_errors=True)
@@ -0,0 +1,455 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+from typing import Any, Callable, Dict, List, Tuple
+
+import synthetic
+
+# Checks that every faster way of computing the published stats agrees with
+# the reference: `core.stats.generate_data` run once per row over the
+# messages of `reference_messages`, a copy of the original main.py's NeDB
+# loader that shares nothing with `core.sources`. Each engine
+# below replaces one piece (the aggregation, the loader, ...) and must
+# produce the same rows, key for key, value for value and type for type,
+# so `0` and `0.0` differ, as `initiative_roll_ratio` needs.
+#
+#   differential.py                       100 random corpora, every engine
+#   differential.py --seeds 500 --engine snapshot
+#
+# Corpora are made-up worlds (see synthetic.py) of a few hundred records,
+# with extra session gaps right at the one day boundary, April Fools
+# markers and deleted records. On the first difference the corpus is
+# shrunk to the fewest records that still show it, and written out with
+# the difference; the exit status is 1.
+
+DAY = 24 * 3600 * 1000
+# (session gap, chance per record): just inside, at and past the boundary
+GAPS = [DAY - 1, DAY, DAY + 1, 7 * DAY]
+GAP_RATE = 0.04
+MARKER_RATE = 0.02
+DELETED_RATE = 0.03
+
+Rows = List[Dict[str, Any]]
+# (row, field, reference value, engine value)
+Difference = Tuple[str, str, Any, Any]
+
+
+class Case(object):
+    """One corpus, written out as whatever an engine needs to load."""
+
+    def __init__(
+        self,
+        users: List[Dict[str, Any]],
+        records: List[Dict[str, Any]],
+        directory: str,
+        seed: int,
+    ):
+        self.users = users
+        self.records = records
+        self.directory = directory
+        self.players = synthetic.PLAYERS
+        # For engines that make random choices of their own, e.g. chunks
+        self.seed = seed
+
+    def write_zip(self, name: str, records: List[Dict[str, Any]]) -> str:
+        path = os.path.join(self.directory, name)
+        synthetic.write_nedb_zip(path, self.users, records)
+        return path
+
+    def archive(self) -> str:
+        return self.write_zip("world.zip", self.records)
+
+
+def corpus(seed: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    rng = random.Random(seed)
+    (users, records) = synthetic.world(seed, rng.randint(20, 300))
+    shift = 0
+    open_marker = False
+    for (i, raw) in enumerate(records):
+        if rng.random() < GAP_RATE:
+            shift += rng.choice(GAPS)
+        if "timestamp" in raw:
+            raw["timestamp"] += shift
+        if rng.random() < MARKER_RATE and "content" in raw:
+            raw["content"] = (
+                "#End April Fools" if open_marker else "# April Fools Marker"
+            )
+            open_marker = not open_marker
+        if rng.random() < DELETED_RATE:
+            records[i] = {"_id": raw["_id"], "$$deleted": True}
+    return users, records
+
+
+def load(source) -> List[Any]:
+    from core.sources import load_messages
+    from core.stats import apply_april_fools_filter
+
+    return apply_april_fools_filter(load_messages(source))
+
+
+def reference_messages(filenames: List[str]) -> List[Any]:
+    # The original load_zip_files, changed only where the loaders have
+    # changed on purpose since: timestamps stay in milliseconds, v11's
+    # "author" stands in for "user", and unknown user ids name themselves
+    import zipfile
+
+    from core.models import Message
+
+    user_map: Dict[str | None, str] = {None: "UNKNOWN USER"}
+    ids = set()
+    raw_data = []
+
+    for filename in filenames:
+        with zipfile.ZipFile(filename, "r") as archive:
+            file = None
+            for f in archive.filelist:
+                if f.filename.endswith("users.db"):
+                    file = f
+                    break
+
+            if file is None:
+                raise FileNotFoundError(f"Could not find users.db in {filename}")
+
+            for line in archive.open(file):
+                raw = json.loads(line)
+                user_map[raw["_id"]] = raw["name"]
+
+            file = None
+            for f in archive.filelist:
+                if f.filename.endswith("chat.db") or f.filename.endswith("messages.db"):
+                    file = f
+                    break
+
+            if file is None:
+                raise FileNotFoundError(
+                    f"Could not find chat.db or messages.db in {filename}"
+                )
+
+            for line in archive.open(file):
+                data = json.loads(line)
+                if not data["_id"] in ids:
+                    raw_data.append(data)
+                    ids.add(data["_id"])
+
+    data = []
+    for raw in raw_data:
+        if "$$deleted" in raw and raw["$$deleted"]:
+            continue
+        roll_data = []
+        if "roll" in raw:
+            roll_data.append(raw["roll"])
+        if "rolls" in raw:
+            roll_data = raw["rolls"]
+
+        alias = raw["speaker"]["alias"] if "alias" in raw["speaker"] else None
+
+        for i in range(len(roll_data)):
+            if type(roll_data[i]) == str:
+                roll_data[i] = json.loads(roll_data[i])
+        user = raw["author"] if "author" in raw else raw["user"]
+        data.append(
+            {
+                "user": user_map.get(user, user),
+                "data": roll_data,
+                "timestamp": int(raw["timestamp"]),
+                "content": raw["content"],
+                "alias": alias,
+                "flags": raw["flags"],
+                "raw": raw,
+            }
+        )
+    for d in data:
+        if "data" in d and not d["data"] is None:
+            if "class" in d["data"]:
+                d["data"]["roll_type"] = d["data"]["class"]
+                del d["data"]["class"]
+    messages = [Message(**d) for d in data]
+    messages.sort(key=lambda m: m.timestamp)
+    return messages
+
+
+def reference_sessions(messages: List[Any]) -> List[List[Any]]:
+    # The original grouping: each message joins the first session it is
+    # within a day of
+    sessions: List[List[Any]] = []
+    for message in messages:
+        for session in sessions:
+            if message.timestamp - session[-1].timestamp < DAY:
+                session.append(message)
+                break
+        else:
+            sessions.append([message])
+    return [session for session in sessions if len(session) > 10]
+
+
+def reference_rows(messages: List[Any], players: List[str]) -> Rows:
+    from core.stats import generate_data
+
+    def rows(messages: List[Any]) -> Rows:
+        data = []
+        for user in [None, "All Players", "Gamemaster"] + players:
+            row = generate_data(messages, user=user)
+            row["player"] = "All" if user is None else user
+            data.append(row)
+        return data
+
+    d20_data = rows(messages)
+    prev = rows(reference_sessions(messages)[-1])
+    for (row, prev_row) in zip(d20_data, prev):
+        for (key, value) in prev_row.items():
+            if "count" in key:
+                row[f"{key}_prev"] = value
+    return d20_data
+
+
+def reference(case: Case) -> Rows:
+    from core.stats import apply_april_fools_filter
+
+    messages = apply_april_fools_filter(reference_messages([case.archive()]))
+    return reference_rows(messages, case.players)
+
+
+def build_d20_data(case: Case) -> Rows:
+    # The pipeline's aggregation: per character accumulators, one pass
+    from core.sources import NedbZipSource
+    from core.stats import build_d20_data
+
+    messages = load(NedbZipSource([case.archive()]))
+    return build_d20_data(messages, case.players)[0]
+
+
+def accumulator_rows(
+    messages: List[Any], players: List[str], accumulate: Callable
+) -> Rows:
+    from core.counters import player_rows
+    from core.stats import session_ranges
+
+    d20_data = player_rows(accumulate(messages), players)
+    (start, end) = list(session_ranges(messages))[-1]
+    prev = player_rows(accumulate(messages[start:end]), players)
+    for (row, prev_row) in zip(d20_data, prev):
+        for (key, value) in prev_row.items():
+            if "count" in key:
+                row[f"{key}_prev"] = value
+    return d20_data
+
+
+def chunked(case: Case) -> Rows:
+    # Accumulators of random chunks, merged, as parallel workers would
+    from core.sources import NedbZipSource
+    from core.counters import StatsAccumulator
+
+    rng = random.Random(case.seed)
+
+    def accumulate(messages: List[Any]) -> Dict[str, StatsAccumulator]:
+        shuffled = list(messages)
+        rng.shuffle(shuffled)
+        cuts = sorted(rng.randint(0, len(shuffled)) for _ in range(3))
+        chunks = [
+            shuffled[a:b] for (a, b) in zip([0] + cuts, cuts + [len(shuffled)])
+        ]
+        by_user: Dict[str, StatsAccumulator] = {}
+        for chunk in chunks:
+            for message in chunk:
+                if message.user not in by_user:
+                    by_user[message.user] = StatsAccumulator()
+            partial: Dict[str, StatsAccumulator] = {}
+            for message in chunk:
+                partial.setdefault(message.user, StatsAccumulator()).add(message)
+            for (user, accumulator) in partial.items():
+                by_user[user].merge(accumulator)
+        return by_user
+
+    messages = load(NedbZipSource([case.archive()]))
+    return accumulator_rows(messages, case.players, accumulate)
+
+
+def removed(case: Case) -> Rows:
+    # Every message counted twice, then removed once, as the watcher would
+    from core.sources import NedbZipSource
+    from core.counters import accumulate_by_user
+
+    def accumulate(messages: List[Any]) -> Dict[str, Any]:
+        by_user = accumulate_by_user(messages + messages)
+        for message in messages:
+            by_user[message.user].remove(message)
+        return by_user
+
+    messages = load(NedbZipSource([case.archive()]))
+    return accumulator_rows(messages, case.players, accumulate)
+
+
+def snapshot(case: Case) -> Rows:
+    from core.sources import NedbZipSource, SnapshotSource, write_snapshot
+
+    path = os.path.join(case.directory, "world.jsonl.gz")
+    with contextlib.redirect_stdout(io.StringIO()):
+        write_snapshot(NedbZipSource([case.archive()]), path)
+    return reference_rows(load(SnapshotSource(path)), case.players)
+
+
+def directory(case: Case) -> Rows:
+    import zipfile
+
+    from core.sources import NedbDirectorySource
+
+    path = os.path.join(case.directory, "world")
+    with zipfile.ZipFile(case.archive()) as archive:
+        for name in ["users.db", "messages.db"]:
+            os.makedirs(f"{path}/data", exist_ok=True)
+            with open(f"{path}/data/{name}", "wb") as f:
+                f.write(archive.read(f"synthetic/data/{name}"))
+    return reference_rows(load(NedbDirectorySource(path)), case.players)
+
+
+def split_archives(case: Case) -> Rows:
+    # Two exports with overlapping records, merged by timestamp
+    from core.sources import NedbZipSource
+
+    rng = random.Random(case.seed)
+    (a, b) = sorted([rng.randint(0, len(case.records)) for _ in range(2)])
+    first = case.write_zip("first.zip", case.records[:b])
+    second = case.write_zip("second.zip", case.records[a:])
+    return reference_rows(load(NedbZipSource([first, second])), case.players)
+
+
+ENGINES: Dict[str, Callable[[Case], Rows]] = {
+    "build_d20_data": build_d20_data,
+    "chunked": chunked,
+    "removed": removed,
+    "snapshot": snapshot,
+    "directory": directory,
+    "split_archives": split_archives,
+}
+
+
+def first_difference(expected: Rows, actual: Rows) -> Difference | None:
+    if len(expected) != len(actual):
+        return ("", "rows", len(expected), len(actual))
+    for (want, got) in zip(expected, actual):
+        player = str(want.get("player"))
+        for key in list(want) + [key for key in got if key not in want]:
+            if key not in got or key not in want:
+                missing = "<missing>"
+                return (player, key, want.get(key, missing), got.get(key, missing))
+            # 0 and 0.0 are equal, but not the same output
+            if type(want[key]) != type(got[key]) or want[key] != got[key]:
+                return (player, key, want[key], got[key])
+    return None
+
+
+def outcome(engine: Callable[[Case], Rows], case: Case) -> Rows | str:
+    try:
+        return engine(case)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+def check(
+    engine: Callable[[Case], Rows],
+    users: List[Dict[str, Any]],
+    records: List[Dict[str, Any]],
+    seed: int,
+) -> Difference | None:
+    with tempfile.TemporaryDirectory(prefix="differential_") as directory:
+        case = Case(users, records, directory, seed)
+        expected = outcome(reference, case)
+        actual = outcome(engine, case)
+    if isinstance(expected, str) or isinstance(actual, str):
+        # Both failing alike, e.g. no session long enough, is agreement
+        if expected == actual:
+            return None
+
+        def summary(result: Rows | str) -> str:
+            return result if isinstance(result, str) else f"{len(result)} rows"
+
+        return ("", "error", summary(expected), summary(actual))
+    return first_difference(expected, actual)
+
+
+def minimize(
+    records: List[Dict[str, Any]], differs: Callable[[List[Dict[str, Any]]], bool]
+) -> List[Dict[str, Any]]:
+    # Drops ever smaller runs of records for as long as the difference stays
+    chunk = len(records) // 2
+    while chunk >= 1:
+        i = 0
+        while i < len(records):
+            candidate = records[:i] + records[i + chunk :]
+            if candidate and differs(candidate):
+                records = candidate
+            else:
+                i += chunk
+        chunk //= 2
+    return records
+
+
+def run(seeds: List[int], engines: List[str], output: str) -> int:
+    for seed in seeds:
+        (users, records) = corpus(seed)
+        for name in engines:
+            engine = ENGINES[name]
+            difference = check(engine, users, records, seed)
+            if difference is None:
+                continue
+
+            print(f"seed {seed}: {name} differs, minimizing {len(records)} records")
+            # The same field must keep differing, not just anything
+            smallest = minimize(
+                records,
+                lambda r: (check(engine, users, r, seed) or ())[:2] == difference[:2],
+            )
+            difference = check(engine, users, smallest, seed) or difference
+            (player, field, expected, actual) = difference
+            os.makedirs(output, exist_ok=True)
+            path = os.path.join(output, f"{name}_{seed}.json")
+            with open(path, "w") as f:
+                json.dump(
+                    {
+                        "engine": name,
+                        "seed": seed,
+                        "difference": {
+                            "player": player,
+                            "field": field,
+                            "reference": expected,
+                            "engine": actual,
+                        },
+                        "users": users,
+                        "records": smallest,
+                    },
+                    f,
+                    indent=1,
+                )
+            print(
+                f"{name} differs from the reference for {player!r}, {field}:"
+                f" {expected!r} != {actual!r}\n"
+                f"{len(smallest)} records still show it, written to {path}"
+            )
+            return 1
+        print(f"seed {seed}: ok", file=sys.stderr)
+    print(f"{len(seeds)} corpora agree for {', '.join(engines)}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the stats engines with the reference on random corpora"
+    )
+    parser.add_argument("--seeds", type=int, default=100, help="corpora to try")
+    parser.add_argument("--start", type=int, default=0, help="first seed")
+    parser.add_argument(
+        "--engine",
+        action="append",
+        choices=list(ENGINES),
+        help="engine to check, may be repeated; all by default",
+    )
+    parser.add_argument("-o", "--output", default="./differential")
+    args = parser.parse_args()
+
+    seeds = list(range(args.start, args.start + args.seeds))
+    sys.exit(run(seeds, args.engine or list(ENGINES), args.output))
@@ -1,44 +1,331 @@
-
+import argparse
+import hashlib
 import json
-import sys
-import markdownify
-
-
-def load_zip_files(filenames: list[str], id: str) -> dict[str, str]:
-    import zipfile
-
-    pages = {}
-
-    for filename in filenames:
-        archive = zipfile.ZipFile(filename, "r")
-
-        file = None
-        for f in archive.filelist:
-            if f.filename.endswith("journal.db"):
-                file = f
-                break
-
-        if file is None:
-            print(f"Could not find journal.db in {filename}")
-            exit(1)
-
-        for line in archive.open(file):
-            data = json.loads(line)
-            if data['_id'] == id:
-                for page in data['pages']:
-                    title = page['name']
-                    content = page['text']['content']
-                    if title not in pages:
-                        pages[title] = content
-                    else:
-                        pages[title] += '\n' + content
+import os
+from typing import Any, Dict, Iterator, List, Tuple
+
+from core.search import SearchIndex, open_search_index
+from core.sources import ForgeArchive, parse_lines
+from core.timing import format_timings, timed
+from markup import convert, converter_version
+
+# The journal exported when no other is asked for
+DEFAULT_JOURNAL = "NfWjoESIxVhASMsp"
+JOURNAL_DB = "journal.db"
+# What was exported to an output directory, see `load_cache`
+CACHE_FILE = ".journal_cache.json"
+CACHE_VERSION = 1
+
+# Where a journal entry's line is in an archive's journal.db:
+# (archive, offset, length), offsets into the decompressed member
+Location = Tuple[str, int, int]
+
+
+class JournalIndex(object):
+    """
+    Every journal entry in a set of Forge exports, by id, built in one scan.
+    An entry is read back by seeking to its line, so exporting any number of
+    journals never parses the others again.
+
+    Within an archive the last line for an id wins, as NeDB appends updates
+    and deletions. An entry found in several archives has one location per
+    archive, in the order the archives were given.
+    """
+
+    def __init__(self, filenames: List[str]):
+        self.filenames = filenames
+        self.locations: Dict[str, List[Location]] = {}
+        self.names: Dict[str, str] = {}
+        for filename in filenames:
+            self.scan(filename)
+        # Journals deleted in every archive they were in are gone, names too
+        self.names = {
+            id: name for (id, name) in self.names.items() if id in self.locations
+        }
+
+    def scan(self, filename: str):
+        found: Dict[str, Location] = {}
+        with ForgeArchive(filename) as archive:
+            member = archive.find(JOURNAL_DB)
+            if member is None:
+                raise FileNotFoundError(f"Could not find {JOURNAL_DB} in {filename}")
+            with archive.archive.open(member) as f:
+                for batch in line_batches(f):
+                    entries = parse_lines([line for (_, line) in batch])
+                    for ((offset, line), entry) in zip(batch, entries):
+                        if entry.get("$$deleted"):
+                            found.pop(entry["_id"], None)
+                            continue
+                        found[entry["_id"]] = (filename, offset, len(line))
+                        self.names[entry["_id"]] = entry.get("name", entry["_id"])
+        for (id, location) in found.items():
+            self.locations.setdefault(id, []).append(location)
+
+    def ids(self) -> List[str]:
+        return list(self.locations)
+
+    def read(self, ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        The entries for `ids`, each with one version per archive. Each
+        archive is read once, front to back, seeking past everything else.
+        """
+        wanted: Dict[str, List[Tuple[int, int, str]]] = {}
+        for id in ids:
+            if id not in self.locations:
+                raise KeyError(f"No journal {id}")
+            for (filename, offset, length) in self.locations[id]:
+                wanted.setdefault(filename, []).append((offset, length, id))
+
+        entries: Dict[str, List[Dict[str, Any]]] = {id: [] for id in ids}
+        for filename in self.filenames:
+            if filename not in wanted:
+                continue
+            with ForgeArchive(filename) as archive:
+                member = archive.find(JOURNAL_DB)
+                with archive.archive.open(member) as f:
+                    for (offset, length, id) in sorted(wanted[filename]):
+                        f.seek(offset)
+                        entries[id].append(json.loads(f.read(length)))
+        return entries
+
+
+def line_batches(
+    f, chunk_size: int = 1 << 22
+) -> Iterator[List[Tuple[int, bytes]]]:
+    # Non-empty lines with their offsets, a decompressed chunk at a time
+    offset = 0
+    tail = b""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        batch = []
+        for line in lines:
+            if line.strip():
+                batch.append((offset, line))
+            offset += len(line) + 1
+        yield batch
+    if tail.strip():
+        yield [(offset, tail)]
+
+
+def journal_pages(versions: List[Dict[str, Any]]) -> Dict[str, Tuple[List[str], str]]:
+    # Page ids and HTML by title; a title seen again (in another page or
+    # another archive) is appended to
+    pages: Dict[str, Tuple[List[str], str]] = {}
+    for entry in versions:
+        for page in entry.get("pages", []):
+            title = page["name"]
+            content = (page.get("text") or {}).get("content") or ""
+            if title not in pages:
+                pages[title] = ([page["_id"]], content)
+            else:
+                (ids, previous) = pages[title]
+                pages[title] = (ids + [page["_id"]], previous + "\n" + content)
     return pages
 
 
-pages = load_zip_files(sys.argv[1:], 'NfWjoESIxVhASMsp')
+def slug(title: str) -> str:
+    return title.lower().replace(" ", "_").replace("/", "_")
+
+
+def cache_path(directory: str) -> str:
+    return os.path.join(directory, CACHE_FILE)
+
+
+def load_cache(directory: str) -> Dict[str, Dict[str, Any]]:
+    """
+    What was written to `directory` last time: for each Markdown file
+    (relative to `directory`), its journal, page ids and the sha256 of the
+    HTML it was converted from. A cache from another markdownify version
+    is ignored, as its output may differ.
+    """
+    path = cache_path(directory)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        cache = json.load(f)
+    if cache.get("version") != CACHE_VERSION or cache.get("markdownify") != (
+        converter_version()
+    ):
+        return {}
+    return cache["files"]
+
+
+def save_cache(directory: str, files: Dict[str, Dict[str, Any]]):
+    path = cache_path(directory)
+    cache = {
+        "version": CACHE_VERSION,
+        "markdownify": converter_version(),
+        "files": files,
+    }
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(cache, f, separators=(",", ":"))
+    os.replace(f"{path}.tmp", path)
+
+
+def export_journals(
+    index: JournalIndex,
+    ids: List[str],
+    directory: str = ".",
+    flat: bool = False,
+    jobs: int | None = None,
+    search: SearchIndex | None = None,
+) -> Dict[str, float]:
+    """
+    Writes every page of the journals `ids` to `{directory}/{journal}/` as
+    Markdown, or straight into `directory` if `flat`. The HTML to Markdown
+    conversion runs in `jobs` processes.
+
+    Only pages whose HTML changed since the last export to `directory` are
+    converted and written (see `load_cache`); a page that only moved, e.g.
+    a renamed one, is moved. Files left over from earlier exports of these
+    journals, or of journals that no longer exist, are removed.
+
+    The pages are also added to `search`, if given.
+    """
+    timings: Dict[str, float] = {}
+
+    with timed(timings, "read"):
+        entries = index.read(ids)
+        old = load_cache(directory)
+
+    files: Dict[str, Dict[str, Any]] = {}
+    contents: Dict[str, str] = {}
+    folders: Dict[str, str] = {}
+    for id in ids:
+        folder = ""
+        if not flat:
+            folder = slug(index.names[id])
+            # Journals may share a name
+            if folder in folders and folders[folder] != id:
+                folder = f"{folder}_{id}"
+            folders[folder] = id
+        for (title, (pages, content)) in journal_pages(entries[id]).items():
+            path = os.path.join(folder, slug(title) + ".md")
+            files[path] = {
+                "journal": id,
+                "pages": pages,
+                "sha256": hashlib.sha256(content.encode()).hexdigest(),
+            }
+            contents[path] = content
+
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(directory, path))
+
+    # Left over: earlier files of these journals, or of deleted journals
+    exported = set(ids)
+    orphans = [
+        path
+        for (path, entry) in old.items()
+        if path not in files
+        and (entry["journal"] in exported or entry["journal"] not in index.names)
+    ]
+    movable = {
+        (tuple(old[path]["pages"]), old[path]["sha256"]): path
+        for path in orphans
+        if exists(path)
+    }
+
+    with timed(timings, "write"):
+        stale = []
+        moved = 0
+        for (path, entry) in files.items():
+            if path in old and old[path]["sha256"] == entry["sha256"] and exists(path):
+                continue
+            os.makedirs(os.path.join(directory, os.path.dirname(path)), exist_ok=True)
+            source = movable.pop((tuple(entry["pages"]), entry["sha256"]), None)
+            if source is not None:
+                os.replace(
+                    os.path.join(directory, source), os.path.join(directory, path)
+                )
+                moved += 1
+            else:
+                stale.append(path)
+
+        removed = 0
+        for path in orphans:
+            if exists(path):
+                os.remove(os.path.join(directory, path))
+                removed += 1
+            folder = os.path.dirname(os.path.join(directory, path))
+            if folder != directory.rstrip("/") and os.path.isdir(folder):
+                if not os.listdir(folder):
+                    os.rmdir(folder)
+
+    if search is not None:
+        with timed(timings, "search_index"):
+            # The latest version of each journal
+            search.update_pages(
+                {id: entries[id][-1] for id in ids}, set(index.names)
+            )
+
+    with timed(timings, "markdownify"):
+        markdown = convert([contents[path] for path in stale], jobs)
+
+    with timed(timings, "write"):
+        for (path, md) in zip(stale, markdown):
+            with open(os.path.join(directory, path), "w") as f:
+                f.write(md)
+        # Files of journals not exported this time stay as they were
+        for (path, entry) in old.items():
+            if path not in files and path not in orphans:
+                files[path] = entry
+        save_cache(directory, files)
+
+    print(
+        f"{len(contents)} pages from {len(ids)} journals: {len(stale)} converted,"
+        f" {moved} moved, {removed} removed"
+    )
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export journals as Markdown")
+    parser.add_argument("zips", nargs="+", help="Forge exports with a journal.db")
+    parser.add_argument(
+        "--journal",
+        action="append",
+        default=[],
+        help="id of a journal to export, may be repeated",
+    )
+    parser.add_argument("--all", action="store_true", help="export every journal")
+    parser.add_argument("--list", action="store_true", help="list the journals")
+    parser.add_argument("-o", "--output", default=".", help="output directory")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes")
+    parser.add_argument(
+        "--search",
+        metavar="WORLD",
+        help="also add the pages to WORLD's search index, see core/search.py",
+    )
+    args = parser.parse_args()
+
+    timings: Dict[str, float] = {}
+    try:
+        with timed(timings, "index"):
+            index = JournalIndex(args.zips)
+    except FileNotFoundError as e:
+        print(e)
+        exit(1)
+
+    if args.list:
+        for id in index.ids():
+            print(f"{id}  {index.names[id]}")
+        exit(0)
 
-for (title, content) in pages.items():
-    filename = title.lower().replace(' ', '_') + '.md'
-    md = markdownify.markdownify(content)
-    with open(filename, 'w') as f:
-        f.write(md)
+    ids = index.ids() if args.all else args.journal or [DEFAULT_JOURNAL]
+    # A single journal asked for by id keeps the old layout: its pages go
+    # straight into the output directory
+    flat = not args.all and len(ids) == 1
+    search = None if args.search is None else open_search_index(args.search)
+    try:
+        timings |= export_journals(index, ids, args.output, flat, args.jobs, search)
+    except KeyError as e:
+        print(e.args[0])
+        exit(1)
+    finally:
+        if search is not None:
+            search.close()
+    print(format_timings(timings))
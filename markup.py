@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from importlib import metadata
+from typing import List
+from urllib.parse import urlsplit
+
+# The HTML Foundry stores in chat messages and journal pages, converted to
+# Markdown or cleaned up for publishing as HTML. markdownify, and the
+# BeautifulSoup it depends on, are only imported when first needed.
+
+# Tags kept by `sanitize_html`; others are replaced by their contents
+ALLOWED_TAGS = set(
+    "a abbr b blockquote br code dd div dl dt em h1 h2 h3 h4 h5 h6 hr i img li"
+    " ol p pre s section span strong sub sup table tbody td tfoot th thead tr u"
+    " ul".split()
+)
+# Tags dropped along with their contents
+DROPPED_TAGS = set(
+    "base button embed form frame frameset iframe input link math meta noscript"
+    " object script select style svg template textarea title".split()
+)
+ALLOWED_ATTRIBUTES = {"alt", "class", "colspan", "href", "rowspan", "src", "title"}
+URL_ATTRIBUTES = {"href", "src"}
+URL_SCHEMES = {"", "http", "https"}
+
+
+def converter_version() -> str:
+    # Output of another markdownify version may differ
+    try:
+        return metadata.version("markdownify")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+@lru_cache(maxsize=8192)
+def to_markdown(content: str) -> str:
+    # Roll cards and other templates repeat the same HTML over and over
+    import markdownify
+
+    return markdownify.markdownify(content)
+
+
+def convert(contents: List[str], jobs: int | None = None) -> List[str]:
+    """`to_markdown` of each of `contents`, in `jobs` processes."""
+    if jobs == 1 or len(contents) < 2:
+        return [to_markdown(content) for content in contents]
+    workers = jobs or os.cpu_count() or 1
+    # A few chunks per worker: pages vary a lot in size
+    chunksize = max(1, len(contents) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(to_markdown, contents, chunksize=chunksize))
+
+
+def safe_url(url: str) -> bool:
+    # No javascript: or data: URLs; relative ones have no scheme. urlsplit
+    # drops the whitespace browsers ignore, as in "java\tscript:".
+    try:
+        return urlsplit(url).scheme in URL_SCHEMES
+    except ValueError:
+        return False
+
+
+@lru_cache(maxsize=8192)
+def sanitize_html(content: str) -> str:
+    """
+    `content` with only formatting left: no scripts, styles, event handlers,
+    forms or embedded documents, and links to http(s) or relative URLs
+    only. Chat content comes from every player, so it is never published
+    as is.
+    """
+    from bs4 import BeautifulSoup, Comment
+
+    soup = BeautifulSoup(content, "html.parser")
+    for comment in soup.find_all(string=lambda s: isinstance(s, Comment)):
+        comment.extract()
+    for tag in soup.find_all(True):
+        if tag.decomposed:
+            continue
+        if tag.name in DROPPED_TAGS:
+            tag.decompose()
+        elif tag.name not in ALLOWED_TAGS:
+            tag.unwrap()
+        else:
+            tag.attrs = {
+                name: value
+                for (name, value) in tag.attrs.items()
+                if name in ALLOWED_ATTRIBUTES
+                and (name not in URL_ATTRIBUTES or safe_url(value))
+            }
+    return str(soup)
@@ -85,90 +85,88 @@ if (window.location.hash) {
   world = window.location.hash.slice(1);
 }
 
-d3.queue()
-  .defer(d3.json, `${world}_data.json`)
-  .await((error, d20_data) => {
-    const column_name_map = {
-      player: "Player",
-      d20_roll_count: "D20 Rolls",
-      d20_roll_count_prev: "D20s Last Session",
-      advantage_count: "Rolls with Advantage",
-      disadvantage_count: "Rolls with Disadvantage",
-      advantage_ratio: "% Advantage",
-      disadvantage_ratio: "% Disadvantage",
-      attack_roll_count: "Attacks",
-      attack_roll_count_prev: "Attacks Last Session",
-      attack_roll_ratio: "% Attacks",
-      saving_throw_count: "Saves",
-      saving_throw_count_prev: "Saves Last Session",
-      saving_throw_ratio: "% Saves",
-      ability_check_count: "Ability Checks",
-      ability_check_count_prev: "Ability Checks Last Session",
-      ability_check_ratio: "% Ability Checks",
-      skill_check_count: "Skill Checks",
-      skill_check_count_prev: "Skill Checks Last Session",
-      skill_check_ratio: "% Skill Checks",
-      initiative_roll_count: "Initiative Rolls",
-      initiative_roll_count_prev: "Initiative Rolls Last Session",
-      initiative_roll_ratio: "% Initiative Rolls",
-      nat_20_count: "Nat 20s",
-      nat_20_count_prev: "Nat 20s Last Session",
-      nat_20_ratio: "% Nat 20s",
-      nat_1_count: "Nat 1s",
-      nat_1_count_prev: "Nat 1s Last Session",
-      nat_1_ratio: "% Nat 1s",
-      stolen_nat_20_count: "Stolen Nat 20s",
-      super_nat_20_count: "Super Nat 20s",
-      disadvantage_nat_20_count: "Disadvantage Nat 20s",
-      dropped_nat_1_count: "Dropped Nat 1s",
-      super_nat_1_count: "Super Nat 1s",
-      advantage_nat_1_count: "Advantage Nat 1s",
-      stolen_nat_20_count_prev: "Stolen Nat 20s Last Session",
-      super_nat_20_count_prev: "Super Nat 20s Last Session",
-      disadvantage_nat_20_count_prev: "Disadvantage Nat 20s Last Session",
-      dropped_nat_1_count_prev: "Dropped Nat 1s Last Session",
-      super_nat_1_count_prev: "Super Nat 1s Last Session",
-      advantage_nat_1_count_prev: "Advantage Nat 1s Last Session",
-      average_raw_d20_roll: "Raw D20 (inc. dropped)",
-      average_final_d20_roll: "Raw D20 (after adv./disadv.)",
-      average_d20_after_modifiers: "D20 after Mods",
-      average_attack_before_modifiers: "Attacks before Mods",
-      average_initiative_before_modifiers: "Initiative before Mods",
-      average_save_before_modifiers: "Saves before Mods",
-      average_skill_before_modifiers: "Skill Checks before Mods",
-      average_ability_before_modifiers: "Ability Checks before Mods",
-      average_attack_after_modifiers: "Attacks after Mods",
-      average_initiative_after_modifiers: "Initiative after Mods",
-      average_save_after_modifiers: "Saves after Mods",
-      average_skill_after_modifiers: "Skill Checks after Mods",
-      average_ability_after_modifiers: "Ability Checks after Mods",
-    };
-    const column_pct_map = {
-      advantage_ratio: true,
-      disadvantage_ratio: true,
-      attack_roll_ratio: true,
-      initiative_roll_ratio: true,
-      saving_throw_ratio: true,
-      ability_check_ratio: true,
-      skill_check_ratio: true,
-      nat_20_ratio: true,
-      nat_1_ratio: true,
-    };
-    const column_roll_fmt_map = {
-      average_raw_d20_roll: true,
-      average_final_d20_roll: true,
-      average_d20_after_modifiers: true,
-      average_attack_before_modifiers: true,
-      average_initiative_before_modifiers: true,
-      average_save_before_modifiers: true,
-      average_skill_before_modifiers: true,
-      average_ability_before_modifiers: true,
-      average_attack_after_modifiers: true,
-      average_initiative_after_modifiers: true,
-      average_save_after_modifiers: true,
-      average_skill_after_modifiers: true,
-      average_ability_after_modifiers: true,
-    };
+loadStatsV1(world).then((d20_data) => {
+  const column_name_map = {
+    player: "Player",
+    d20_roll_count: "D20 Rolls",
+    d20_roll_count_prev: "D20s Last Session",
+    advantage_count: "Rolls with Advantage",
+    disadvantage_count: "Rolls with Disadvantage",
+    advantage_ratio: "% Advantage",
+    disadvantage_ratio: "% Disadvantage",
+    attack_roll_count: "Attacks",
+    attack_roll_count_prev: "Attacks Last Session",
+    attack_roll_ratio: "% Attacks",
+    saving_throw_count: "Saves",
+    saving_throw_count_prev: "Saves Last Session",
+    saving_throw_ratio: "% Saves",
+    ability_check_count: "Ability Checks",
+    ability_check_count_prev: "Ability Checks Last Session",
+    ability_check_ratio: "% Ability Checks",
+    skill_check_count: "Skill Checks",
+    skill_check_count_prev: "Skill Checks Last Session",
+    skill_check_ratio: "% Skill Checks",
+    initiative_roll_count: "Initiative Rolls",
+    initiative_roll_count_prev: "Initiative Rolls Last Session",
+    initiative_roll_ratio: "% Initiative Rolls",
+    nat_20_count: "Nat 20s",
+    nat_20_count_prev: "Nat 20s Last Session",
+    nat_20_ratio: "% Nat 20s",
+    nat_1_count: "Nat 1s",
+    nat_1_count_prev: "Nat 1s Last Session",
+    nat_1_ratio: "% Nat 1s",
+    stolen_nat_20_count: "Stolen Nat 20s",
+    super_nat_20_count: "Super Nat 20s",
+    disadvantage_nat_20_count: "Disadvantage Nat 20s",
+    dropped_nat_1_count: "Dropped Nat 1s",
+    super_nat_1_count: "Super Nat 1s",
+    advantage_nat_1_count: "Advantage Nat 1s",
+    stolen_nat_20_count_prev: "Stolen Nat 20s Last Session",
+    super_nat_20_count_prev: "Super Nat 20s Last Session",
+    disadvantage_nat_20_count_prev: "Disadvantage Nat 20s Last Session",
+    dropped_nat_1_count_prev: "Dropped Nat 1s Last Session",
+    super_nat_1_count_prev: "Super Nat 1s Last Session",
+    advantage_nat_1_count_prev: "Advantage Nat 1s Last Session",
+    average_raw_d20_roll: "Raw D20 (inc. dropped)",
+    average_final_d20_roll: "Raw D20 (after adv./disadv.)",
+    average_d20_after_modifiers: "D20 after Mods",
+    average_attack_before_modifiers: "Attacks before Mods",
+    average_initiative_before_modifiers: "Initiative before Mods",
+    average_save_before_modifiers: "Saves before Mods",
+    average_skill_before_modifiers: "Skill Checks before Mods",
+    average_ability_before_modifiers: "Ability Checks before Mods",
+    average_attack_after_modifiers: "Attacks after Mods",
+    average_initiative_after_modifiers: "Initiative after Mods",
+    average_save_after_modifiers: "Saves after Mods",
+    average_skill_after_modifiers: "Skill Checks after Mods",
+    average_ability_after_modifiers: "Ability Checks after Mods",
+  };
+  const column_pct_map = {
+    advantage_ratio: true,
+    disadvantage_ratio: true,
+    attack_roll_ratio: true,
+    initiative_roll_ratio: true,
+    saving_throw_ratio: true,
+    ability_check_ratio: true,
+    skill_check_ratio: true,
+    nat_20_ratio: true,
+    nat_1_ratio: true,
+  };
+  const column_roll_fmt_map = {
+    average_raw_d20_roll: true,
+    average_final_d20_roll: true,
+    average_d20_after_modifiers: true,
+    average_attack_before_modifiers: true,
+    average_initiative_before_modifiers: true,
+    average_save_before_modifiers: true,
+    average_skill_before_modifiers: true,
+    average_ability_before_modifiers: true,
+    average_attack_after_modifiers: true,
+    average_initiative_after_modifiers: true,
+    average_save_after_modifiers: true,
+    average_skill_after_modifiers: true,
+    average_ability_after_modifiers: true,
+  };
 
   tabulate(
     "#advantage",
@@ -0,0 +1,152 @@
+// Loads the published stats for a world. `${world}_index.json` lists the
+// players and which fields live in which `${world}_chunk_${name}.json`; each
+// chunk is a field-name table plus one positional value row per player.
+// `field_metadata.json` is shared by every world. Larger per-row data, such
+// as `${world}_distributions.json` and the item leaderboards in
+// `${world}_items.json`, lives in tables named in the index's "tables",
+// fetched only through `loadTable(name)`. A table whose rows share entries,
+// like `${world}_characters.json`, publishes each entry once in "entries"
+// and lists their indices in its rows.
+//
+// `${world}_manifest.json` lists every published file with its content hash.
+// It is always revalidated; the data files are requested as `name?v=hash`,
+// so the browser cache keeps serving them until their contents change.
+
+function fetchJson(url, options) {
+  return fetch(url, options).then((response) => {
+    if (!response.ok) {
+      throw new Error(`Failed to fetch ${url}: ${response.status}`);
+    }
+    return response.json();
+  });
+}
+
+function loadManifest(world) {
+  return fetchJson(`${world}_manifest.json`, { cache: "no-cache" }).catch(
+    () => ({ files: {} })
+  );
+}
+
+function versioned(manifest, name) {
+  let entry = manifest["files"][name];
+  if (entry === undefined) {
+    return name;
+  }
+  return `${name}?v=${entry["sha256"].slice(0, 16)}`;
+}
+
+function fetchVersioned(manifest, name) {
+  return fetchJson(versioned(manifest, name));
+}
+
+// Returns a loader whose `load(fields)` fetches only the chunks holding
+// `fields` (all chunks when `fields` is undefined) and resolves to the state
+// `{ index, data }`. `data` has the v2 layout: per-player dicts keyed by
+// player name, plus `world`, `players` and `field_metadata`. The dicts are
+// filled in place as chunks arrive, and each chunk is fetched at most once.
+function createStatsLoader(world) {
+  let chunkRequests = {};
+  let tableRequests = {};
+
+  let ready = loadManifest(world).then((manifest) =>
+    Promise.all([
+      fetchVersioned(manifest, `${world}_index.json`),
+      fetchVersioned(manifest, "field_metadata.json"),
+    ]).then(([index, field_metadata]) => {
+      let data = {
+        world: index["world"],
+        players: index["players"],
+        field_metadata: field_metadata,
+      };
+      index["rows"].forEach((player) => (data[player] = { player: player }));
+
+      let fieldChunks = {};
+      for (const [chunk, fields] of Object.entries(index["chunks"])) {
+        fields.forEach((field) => (fieldChunks[field] = chunk));
+      }
+
+      return {
+        manifest: manifest,
+        index: index,
+        fieldChunks: fieldChunks,
+        data: data,
+      };
+    })
+  );
+
+  function loadChunk(state, chunk) {
+    if (chunkRequests[chunk] === undefined) {
+      chunkRequests[chunk] = fetchVersioned(
+        state.manifest,
+        `${world}_chunk_${chunk}.json`
+      ).then((contents) => {
+        contents["rows"].forEach((values, i) => {
+          let row = state.data[state.index["rows"][i]];
+          contents["fields"].forEach((field, j) => (row[field] = values[j]));
+        });
+      });
+    }
+    return chunkRequests[chunk];
+  }
+
+  function load(fields) {
+    return ready.then((state) => {
+      let chunks = new Set();
+      if (fields === undefined) {
+        Object.keys(state.index["chunks"]).forEach((c) => chunks.add(c));
+      } else {
+        fields.forEach((field) => {
+          if (state.fieldChunks[field] !== undefined) {
+            chunks.add(state.fieldChunks[field]);
+          }
+        });
+      }
+      return Promise.all(
+        Array.from(chunks).map((chunk) => loadChunk(state, chunk))
+      ).then(() => state);
+    });
+  }
+
+  // Resolves to the table `name` with its "rows" keyed by player, or to
+  // `{ rows: {} }` when the world was published without it. Rows of indices
+  // into "entries" are resolved to the entries.
+  function loadTable(name) {
+    if (tableRequests[name] === undefined) {
+      tableRequests[name] = ready.then((state) => {
+        let file = (state.index["tables"] || {})[name];
+        if (file === undefined) {
+          return { rows: {} };
+        }
+        return fetchVersioned(state.manifest, file).then((contents) => {
+          let rows = {};
+          let entries = contents["entries"];
+          contents["rows"].forEach((row, i) => {
+            if (entries !== undefined) {
+              row = row.map((entry) => entries[entry]);
+            }
+            rows[state.index["rows"][i]] = row;
+          });
+          contents["rows"] = rows;
+          return contents;
+        });
+      });
+    }
+    return tableRequests[name];
+  }
+
+  return { load: load, loadTable: loadTable };
+}
+
+// v1 layout (main.js): a list of per-player dicts.
+function loadStatsV1(world) {
+  return createStatsLoader(world)
+    .load()
+    .then((state) => state.index["rows"].map((player) => state.data[player]));
+}
+
+// v2 layout: everything, in one go.
+function loadStatsV2(world) {
+  return createStatsLoader(world)
+    .load()
+    .then((state) => state.data);
+}
@@ -0,0 +1,305 @@
+import argparse
+import asyncio
+import json
+import os
+import threading
+import traceback
+from collections import OrderedDict
+from datetime import datetime
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import core.stats
+from core.query import query_from_params
+from core.search import SearchIndex, search_path, update_search_index
+from core.sources import NedbZipSource, load_messages
+
+QUERY_PARAMETERS = [
+    "player",
+    "start",
+    "end",
+    "session",
+    "category",
+    "die",
+    "alias",
+    "markers",
+]
+
+
+def iso_time(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp / 1000).isoformat(timespec="seconds")
+
+
+class LRUCache(object):
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[Any, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Requests are answered on executor threads
+        self.lock = threading.Lock()
+
+    def get(self, key: Any) -> Any | None:
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key: Any, value: Any):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class StatsService(object):
+    """
+    Answers `generate_data` queries over one world's messages, which are
+    loaded once. `engine` provides the statistics, normally `core.stats`.
+    Results are cached until `set_messages` is called with
+    newly ingested messages.
+    """
+
+    def __init__(self, engine, messages: List[Any], cache_size: int = 128):
+        self.engine = engine
+        self.cache = LRUCache(cache_size)
+        self.generation = 0
+        # The task polling for new messages, if any; the event loop itself
+        # only keeps a weak reference to it
+        self.watch_task: asyncio.Task | None = None
+        self.set_messages(messages)
+
+    def set_messages(self, messages: List[Any]):
+        # Unfiltered: each `Query` drops the April Fools messages itself,
+        # unless asked for markers=include
+        self.messages = messages
+        # As numbered by the default query, which excludes them
+        self.sessions = self.engine.group_sessions(
+            self.engine.apply_april_fools_filter(messages)
+        )
+        self.generation += 1
+        self.cache.clear()
+
+    def stats(self, params: Dict[str, str]) -> Dict[str, Any]:
+        params = {k: v for (k, v) in params.items() if k in QUERY_PARAMETERS}
+        query = query_from_params(params)
+        key = (self.generation, query)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        messages = query.apply(self.messages, self.engine)
+        data = self.engine.generate_data(messages)
+        result = {"query": params, "message_count": len(messages), "data": data}
+        self.cache.put(key, result)
+        return result
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "session": i,
+                "start": iso_time(session.min_time),
+                "end": iso_time(session.max_time),
+                "message_count": session.count,
+            }
+            for (i, session) in enumerate(self.sessions)
+        ]
+
+    def list_players(self) -> List[str]:
+        return sorted(set(m.user for m in self.messages))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "generation": self.generation,
+            "message_count": len(self.messages),
+            "session_count": len(self.sessions),
+            "cache": {
+                "size": len(self.cache.entries),
+                "hits": self.cache.hits,
+                "misses": self.cache.misses,
+            },
+        }
+
+
+class StatsServer(object):
+    def __init__(self, service: StatsService, search: str | None = None):
+        self.service = service
+        self.search_path = search
+        self.routes: Dict[str, Callable[[Dict[str, str]], Any]] = {
+            "/stats": self.service.stats,
+            "/sessions": lambda params: self.service.list_sessions(),
+            "/players": lambda params: self.service.list_players(),
+            "/status": lambda params: self.service.status(),
+            "/search": self.search,
+        }
+
+    def search(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        if self.search_path is None or not os.path.exists(self.search_path):
+            raise ValueError("No search index")
+        if "q" not in params:
+            raise ValueError("Missing q")
+        try:
+            limit = int(params.get("limit", 20))
+        except ValueError:
+            raise ValueError(f"Invalid limit {params['limit']}")
+        # Requests run on executor threads; a connection is cheap to open
+        with SearchIndex(self.search_path) as index:
+            return index.search(params["q"], limit, params.get("kind"))
+
+    def respond(self, method: str, target: str) -> Tuple[HTTPStatus, Any]:
+        if method != "GET":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"{method} not allowed"}
+        url = urlsplit(target)
+        if url.path not in self.routes:
+            return HTTPStatus.NOT_FOUND, {
+                "error": f"Unknown path {url.path}",
+                "paths": list(self.routes),
+            }
+        try:
+            return HTTPStatus.OK, self.routes[url.path](dict(parse_qsl(url.query)))
+        except ValueError as e:
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+
+    async def read_request(
+        self, reader: asyncio.StreamReader
+    ) -> Tuple[HTTPStatus, Any]:
+        request_line = (await reader.readline()).decode(errors="replace")
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass  # Headers are not needed
+
+        parts = request_line.split()
+        if len(parts) != 3:
+            return HTTPStatus.BAD_REQUEST, {"error": "Malformed request"}
+        # Cache misses run generate_data, which should not stall other
+        # connections
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.respond, parts[0], parts[1])
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                status, body = await self.read_request(reader)
+            except Exception as e:
+                # Answered all the same, rather than dropping the connection
+                traceback.print_exc()
+                status = HTTPStatus.INTERNAL_SERVER_ERROR
+                body = {"error": f"{type(e).__name__}: {e}"}
+
+            payload = json.dumps(body).encode()
+            writer.write(
+                (
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    "Connection: close\r\n\r\n"
+                ).encode()
+                + payload
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+async def watch(service: StatsService, watcher, interval: float):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        # A failed poll, e.g. a store caught mid-compaction, must not stop
+        # the polling and leave the stats stale for good
+        try:
+            changed = await loop.run_in_executor(None, watcher.sync)
+            if len(changed) == 0:
+                continue
+            updated, removed = await loop.run_in_executor(
+                None, watcher.ingest, "users" in changed
+            )
+            if updated > 0 or removed > 0:
+                print(f"{updated} new or changed, {removed} removed messages")
+                service.set_messages(watcher.sorted_messages())
+                await loop.run_in_executor(None, watcher.index)
+        except Exception:
+            print("Polling for new messages failed:")
+            traceback.print_exc()
+            # The stores may have been synced but not ingested; resync them
+            # all so the next poll sees those changes again
+            watcher.signatures = {store: {} for store in watcher.signatures}
+
+
+async def serve(
+    service: StatsService,
+    host: str,
+    port: int,
+    watcher=None,
+    interval: float = 2.0,
+    search: str | None = None,
+):
+    server = StatsServer(service, search)
+    tcp_server = await asyncio.start_server(server.handle, host, port)
+    print(f"Serving {len(service.messages)} messages on http://{host}:{port}")
+    async with tcp_server:
+        if watcher is not None:
+            service.watch_task = asyncio.create_task(
+                watch(service, watcher, interval)
+            )
+        await tcp_server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve ad-hoc stats queries")
+    parser.add_argument("world_name")
+    parser.add_argument("zips", nargs="*", help="NeDB exports; LevelDB if omitted")
+    parser.add_argument("--path", help="world directory, ./{world_name} by default")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--cache-size", type=int, default=128)
+    parser.add_argument(
+        "--watch",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="poll the LevelDB world for new messages",
+    )
+    args = parser.parse_args()
+
+    watcher = None
+    if len(args.zips) > 0:
+        messages = load_messages(NedbZipSource(args.zips))
+        update_search_index(args.world_name, messages)
+    else:
+        from watch_main import WorldWatcher
+
+        watcher = WorldWatcher(args.world_name, [], path=args.path)
+        watcher.sync()
+        watcher.ingest(reload_users=True)
+        watcher.index()
+        messages = watcher.sorted_messages()
+        if args.watch is None:
+            watcher.close()
+            watcher = None
+
+    service = StatsService(core.stats, messages, args.cache_size)
+    try:
+        asyncio.run(
+            serve(
+                service,
+                args.host,
+                args.port,
+                watcher,
+                args.watch or 2.0,
+                search_path(args.world_name),
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher is not None:
+            watcher.close()
@@ -0,0 +1,191 @@
+import json
+import random
+import zipfile
+from typing import Any, Dict, List, Tuple
+
+# Made-up worlds, for benchmarking and checking the pipeline without a real
+# export. A world is fully determined by its seed and size, and its records
+# cover what real ones do: every dnd5e roll type with the flag spellings of
+# the dnd5e versions seen so far, advantage and disadvantage, rolls stored
+# as JSON strings, the v9 single "roll", the v11 "author", deleted records,
+# April Fools markers and gaps between sessions.
+
+PLAYERS = ["threshprince", "OneRandomThing", "Igazsag", "teagold"]
+ABILITIES = ["str", "dex", "con", "wis", "int", "cha"]
+SKILLS = ["acr", "ath", "ins", "inv", "prc", "ste", "sur"]
+ITEMS = ["longsword", "shortbow", "fireball", "dagger", "eldritch_blast"]
+ROLL_TYPES = ["attack", "damage", "save", "skill", "ability", "death", "hitDie"]
+CHAT = [
+    "ok",
+    "<p>The <b>dragon</b> roars</p>",
+    "<p>I search the room for traps</p>",
+    "Does the goblin see me?",
+]
+# 2022-04-20T00:00:00Z
+START = 1650412800000
+
+
+def die(
+    rng: random.Random, faces: int, advantage: bool = False, disadvantage: bool = False
+) -> Dict[str, Any]:
+    if faces != 20 or not (advantage or disadvantage):
+        results = [{"result": rng.randint(1, faces), "active": True}]
+        return {
+            "class": "Die",
+            "options": {},
+            "evaluated": True,
+            "number": 1,
+            "faces": faces,
+            "modifiers": [],
+            "results": results,
+        }
+    (a, b) = (rng.randint(1, 20), rng.randint(1, 20))
+    (kept, dropped) = (max(a, b), min(a, b)) if advantage else (min(a, b), max(a, b))
+    return {
+        "class": "Die",
+        "options": {"advantage": True} if advantage else {"disadvantage": True},
+        "evaluated": True,
+        "number": 2,
+        "faces": 20,
+        "modifiers": ["kh" if advantage else "kl"],
+        "results": [
+            {"result": kept, "active": True},
+            {"result": dropped, "active": False, "discarded": True},
+        ],
+    }
+
+
+def roll(rng: random.Random, faces: int) -> Dict[str, Any]:
+    d = die(rng, faces, rng.random() < 0.2, rng.random() < 0.1)
+    bonus = rng.randint(0, 7)
+    total = sum(r["result"] for r in d["results"] if r["active"]) + bonus
+    return {
+        "class": "D20Roll" if faces == 20 else "DamageRoll",
+        "options": {},
+        "dice": [],
+        "formula": f"1d{faces} + {bonus}",
+        "terms": [
+            d,
+            {"class": "OperatorTerm", "evaluated": True, "operator": "+"},
+            {"class": "NumericTerm", "evaluated": True, "number": bonus},
+        ],
+        "total": total,
+        "evaluated": True,
+    }
+
+
+def dnd5e_flags(rng: random.Random, kind: str) -> Dict[str, Any]:
+    # Each older or newer spelling of the same roll
+    flags: Dict[str, Any] = {"roll": {"type": kind}}
+    if kind == "save":
+        key = rng.choice(["abilityId", "ability"])
+        flags["roll"][key] = rng.choice(ABILITIES)
+    elif kind == "ability":
+        flags["roll"]["abilityId"] = rng.choice(ABILITIES)
+    elif kind == "skill":
+        flags["roll"]["skillId"] = rng.choice(SKILLS)
+    elif kind in ("attack", "damage"):
+        item = rng.choice(ITEMS)
+        spelling = rng.randrange(4 if kind == "damage" else 3)
+        if spelling == 0:
+            flags["roll"]["itemId"] = item
+        elif spelling == 1:
+            flags["roll"]["item"] = item
+        elif spelling == 2:
+            flags["item"] = {"id": item}
+    return flags
+
+
+def record(
+    rng: random.Random, i: int, timestamp: int, user_ids: Dict[str, str]
+) -> Dict[str, Any]:
+    user = rng.choice(["Gamemaster"] + PLAYERS)
+    if user == "Gamemaster":
+        speaker: Dict[str, Any] = {"alias": f"NPC {rng.randrange(200)}"}
+        if rng.random() < 0.8:
+            speaker["actor"] = f"actor{rng.randrange(200):012d}"
+            speaker["token"] = f"token{rng.randrange(400):012d}"
+    elif rng.random() < 0.9:
+        speaker = {"alias": f"{user}'s character", "actor": f"pc_{user}"}
+    else:
+        speaker = {}
+
+    raw: Dict[str, Any] = {
+        "_id": f"{i:016x}",
+        "timestamp": timestamp,
+        "speaker": speaker,
+        "flags": {},
+    }
+    raw["author" if rng.random() < 0.5 else "user"] = user_ids[user]
+
+    kind = rng.choice(ROLL_TYPES + ["initiative", "plain", "chat", "chat"])
+    if kind == "chat":
+        raw["content"] = rng.choice(CHAT)
+        return raw
+
+    faces = rng.choice([4, 6, 8, 10, 12]) if kind in ("damage", "hitDie") else 20
+    rolls: List[Any] = [roll(rng, faces)]
+    raw["content"] = str(rolls[0]["total"])
+    if kind == "initiative":
+        raw["flags"] = {"core": {"initiativeRoll": True}}
+    elif kind != "plain":
+        raw["flags"] = {"dnd5e": dnd5e_flags(rng, kind)}
+    if kind == "damage" and rng.random() < 0.3:
+        rolls.append(roll(rng, rng.choice([4, 6, 8])))
+    if rng.random() < 0.5:
+        # As Foundry stores them since v10
+        rolls = [json.dumps(r) for r in rolls]
+    if len(rolls) == 1 and rng.random() < 0.2:
+        # v9: a single roll, always a string
+        r = rolls[0]
+        raw["roll"] = r if type(r) == str else json.dumps(r)
+    else:
+        raw["rolls"] = rolls
+    return raw
+
+
+def world(
+    seed: int, messages: int
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    The users and chat records of a made-up world, in the order a NeDB file
+    would hold them. About one record in a hundred is deleted.
+    """
+    rng = random.Random(seed)
+    user_ids = {
+        user: f"{n:016x}" for (n, user) in enumerate(["Gamemaster"] + PLAYERS)
+    }
+    users = [{"_id": id, "name": user} for (user, id) in user_ids.items()]
+
+    records = []
+    timestamp = START
+    april_fools_end: int | None = None
+    for i in range(messages):
+        if rng.random() < 0.002:
+            # The next session, a week later
+            timestamp += 7 * 24 * 3600 * 1000
+        else:
+            timestamp += rng.choice([0, 1000, 5000, 30000])
+        raw = record(rng, i, timestamp, user_ids)
+        if i == april_fools_end:
+            raw["content"] = "#End April Fools"
+            april_fools_end = None
+        elif april_fools_end is None and rng.random() < 0.001:
+            raw["content"] = "# April Fools Marker"
+            april_fools_end = i + rng.randint(10, 100)
+        if rng.random() < 0.01:
+            raw = {"_id": raw["_id"], "$$deleted": True}
+        records.append(raw)
+    return users, records
+
+
+def write_nedb_zip(
+    path: str, users: List[Dict[str, Any]], records: List[Dict[str, Any]]
+):
+    # Laid out like a Forge export of a NeDB world
+    def lines(documents: List[Dict[str, Any]]) -> str:
+        return "".join(json.dumps(d, separators=(",", ":")) + "\n" for d in documents)
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("synthetic/data/users.db", lines(users))
+        archive.writestr("synthetic/data/messages.db", lines(records))
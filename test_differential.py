@@ -0,0 +1,29 @@
+import pytest
+
+import differential
+
+# Every engine of differential.py against the standalone reference, on a
+# few fixed corpora; `differential.py` itself tries many more.
+#
+#   python -m pytest test_differential.py
+
+SEEDS = [0, 1, 2, 3]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("engine", list(differential.ENGINES))
+def test_engine_matches_reference(engine, seed):
+    (users, records) = differential.corpus(seed)
+    difference = differential.check(
+        differential.ENGINES[engine], users, records, seed
+    )
+    assert difference is None
+
+
+def test_reference_reads_every_live_record(tmp_path):
+    (users, records) = differential.corpus(0)
+    case = differential.Case(users, records, str(tmp_path), 0)
+    messages = differential.reference_messages([case.archive()])
+    live = [raw for raw in records if not raw.get("$$deleted")]
+    assert len(messages) == len(live)
+    assert [m.timestamp for m in messages] == sorted(r["timestamp"] for r in live)
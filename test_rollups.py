@@ -0,0 +1,134 @@
+import copy
+import json
+import random
+from datetime import timedelta
+from typing import Any, Dict, List
+
+import pytest
+
+import synthetic
+from core.rollups import Rollups, load_rollups, local_date, update_rollups
+from core.sources import NedbZipSource, load_messages
+from core.stats import apply_april_fools_filter, generate_data, group_sessions
+
+# Rollups against `generate_data` over the same messages, for every session,
+# random date ranges and each kind of player row, before and after the
+# history they were counted from changes.
+#
+#   python -m pytest test_rollups.py
+
+MESSAGES = 3000
+RANGES = 200
+
+
+def users(messages: List[Any]) -> List[str | None]:
+    return [None, "All Players"] + sorted({m.user for m in messages})
+
+
+def same(report: Dict[str, Any], expected: Dict[str, Any]) -> bool:
+    # 0 and 0.0 are equal, but not the same output
+    return json.dumps(report, sort_keys=True) == json.dumps(expected, sort_keys=True)
+
+
+def load(tmp_path, name: str, records: List[Dict[str, Any]]) -> List[Any]:
+    (users, _) = synthetic.world(1, 0)
+    path = str(tmp_path / f"{name}.zip")
+    synthetic.write_nedb_zip(path, users, records)
+    return apply_april_fools_filter(load_messages(NedbZipSource([path])))
+
+
+def assert_matches(rollups: Rollups, messages: List[Any]):
+    for user in users(messages):
+        assert same(rollups.report(user), generate_data(messages, user))
+        for (i, session) in enumerate(group_sessions(messages)):
+            expected = generate_data(session.messages, user)
+            assert same(rollups.session_report(i, user), expected), (user, i)
+
+    rng = random.Random(0)
+    first = local_date(messages[0].timestamp)
+    days = (local_date(messages[-1].timestamp) - first).days + 1
+    for _ in range(RANGES):
+        start = first + timedelta(days=rng.randrange(days))
+        end = start + timedelta(days=rng.randint(1, days))
+        selected = [m for m in messages if start <= local_date(m.timestamp) < end]
+        user = rng.choice(users(messages))
+        expected = generate_data(selected, user)
+        assert same(rollups.report(user, start, end), expected), (user, start, end)
+
+
+@pytest.fixture
+def records() -> List[Dict[str, Any]]:
+    (_, records) = synthetic.world(1, MESSAGES)
+    return records
+
+
+def test_matches_generate_data(tmp_path, records):
+    messages = load(tmp_path, "world", records)
+    rollups = Rollups()
+    assert rollups.update(messages) == len(messages)
+    assert_matches(rollups, messages)
+    saved = json.loads(json.dumps(rollups.to_json()))
+    assert_matches(Rollups.from_json(saved), messages)
+
+
+def test_new_messages_recount_from_their_day(tmp_path, records):
+    rollups = Rollups()
+    rollups.update(load(tmp_path, "first", records[:2000]))
+    messages = load(tmp_path, "world", records)
+    assert 0 < rollups.update(messages) < len(messages)
+    assert_matches(rollups, messages)
+    assert rollups.update(messages) == 0
+
+
+def test_changed_history_is_rebuilt(tmp_path, records):
+    rollups = Rollups()
+    rollups.update(load(tmp_path, "world", records))
+
+    # As many messages as before, but not the same ones: an early roll
+    # edited, one deleted and another added in its place
+    changed = copy.deepcopy(records)
+    rolls = [i for (i, raw) in enumerate(changed) if "rolls" in raw]
+    (edited, donor, deleted) = (rolls[10], rolls[500], rolls[20])
+    changed[edited] = dict(
+        changed[donor],
+        _id=changed[edited]["_id"],
+        timestamp=changed[edited]["timestamp"],
+    )
+    changed[deleted] = dict(
+        changed[donor], _id="added", timestamp=changed[deleted]["timestamp"]
+    )
+    messages = load(tmp_path, "changed", changed)
+
+    assert rollups.update(messages) == len(messages)
+    assert_matches(rollups, messages)
+
+
+def test_no_messages_empties_the_file(tmp_path, records):
+    directory = str(tmp_path / "rollups")
+    update_rollups("world", load(tmp_path, "world", records), directory)
+    assert load_rollups("world", directory).message_count > 0
+
+    update_rollups("world", [], directory)
+    rollups = load_rollups("world", directory)
+    assert rollups.message_count == 0
+    assert rollups.days == {}
+
+
+def test_changed_die_result_is_rebuilt(tmp_path, records):
+    rollups = Rollups()
+    rollups.update(load(tmp_path, "world", records))
+
+    # Only the roll changes: same id, time, author and content
+    changed = copy.deepcopy(records)
+    d20 = next(
+        term
+        for raw in changed[100:]
+        if type(raw.get("rolls")) == list and type(raw["rolls"][0]) == dict
+        for term in raw["rolls"][0]["terms"]
+        if term.get("faces") == 20 and term["number"] == 1
+    )
+    d20["results"][0]["result"] = 21 - d20["results"][0]["result"]
+    messages = load(tmp_path, "changed", changed)
+
+    assert rollups.update(messages) == len(messages)
+    assert_matches(rollups, messages)
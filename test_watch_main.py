@@ -0,0 +1,135 @@
+import json
+import os
+import random
+from typing import Any, Dict, List
+
+import plyvel
+import pytest
+
+import synthetic
+from core import pipeline
+from core.query import is_marker
+from core.sources import LevelDBSource
+from watch_main import WorldWatcher
+
+# WorldWatcher against a LevelDB world written here with plyvel: after
+# every poll, what it published must match a full build of the same world.
+#
+#   python -m pytest test_watch_main.py
+
+WORLD = "watched"
+MESSAGES = 2000
+
+
+class LevelDBWorld(object):
+    """A Foundry v11+ world directory whose stores a test can write to."""
+
+    def __init__(self, path: str, users: List[Dict[str, Any]]):
+        self.path = path
+        os.makedirs(f"{path}/data")
+        with self.open("users") as db:
+            for user in users:
+                db.put(f"!users!{user['_id']}".encode(), json.dumps(user).encode())
+
+    def open(self, store: str) -> plyvel.DB:
+        return plyvel.DB(f"{self.path}/data/{store}", create_if_missing=True)
+
+    def put(self, records: List[Dict[str, Any]]):
+        # Closed again right away, as the watcher only sees what is on disk
+        with self.open("messages") as db:
+            for raw in records:
+                db.put(f"!messages!{raw['_id']}".encode(), json.dumps(raw).encode())
+
+    def delete(self, records: List[Dict[str, Any]]):
+        with self.open("messages") as db:
+            for raw in records:
+                db.delete(f"!messages!{raw['_id']}".encode())
+
+
+@pytest.fixture
+def world(tmp_path):
+    (users, records) = synthetic.world(1, MESSAGES)
+    # LevelDB drops deleted documents instead of marking them
+    records = [raw for raw in records if not raw.get("$$deleted")]
+    leveldb = LevelDBWorld(str(tmp_path / WORLD), users)
+    return leveldb, records
+
+
+@pytest.fixture
+def watcher(world, tmp_path, monkeypatch):
+    # The search index is written under the working directory
+    os.makedirs(tmp_path / "watch" / "public")
+    monkeypatch.chdir(tmp_path / "watch")
+    (leveldb, _) = world
+    watcher = WorldWatcher(WORLD, synthetic.PLAYERS, path=leveldb.path)
+    yield watcher
+    watcher.close()
+
+
+def published(directory: str) -> Dict[str, Any]:
+    files = {}
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name)) as f:
+            files[name] = json.load(f)
+    return files
+
+
+def assert_matches_build(leveldb: LevelDBWorld, directory: str):
+    cwd = os.getcwd()
+    os.makedirs(f"{directory}/public")
+    os.chdir(directory)
+    try:
+        pipeline.run(LevelDBSource(leveldb.path), WORLD, synthetic.PLAYERS)
+    finally:
+        os.chdir(cwd)
+    assert published("./public") == published(f"{directory}/public")
+
+
+def test_poll_matches_build(world, watcher, tmp_path):
+    (leveldb, records) = world
+    leveldb.put(records[:1500])
+    assert watcher.poll()
+    assert_matches_build(leveldb, str(tmp_path / "build1"))
+
+    # Nothing written since
+    assert not watcher.poll()
+
+    # New messages, an edited one and a removed one
+    leveldb.put(records[1500:])
+    edited = dict(records[700], content="<p>Edited</p>", rolls=[])
+    edited.pop("roll", None)
+    leveldb.put([edited])
+    leveldb.delete([records[300]])
+    assert watcher.poll()
+    assert_matches_build(leveldb, str(tmp_path / "build2"))
+
+    # An April Fools range opened and closed in the middle of the log
+    leveldb.put(
+        [
+            dict(records[100], content="# April Fools Marker"),
+            dict(records[160], content="#End April Fools"),
+        ]
+    )
+    assert watcher.poll()
+    assert_matches_build(leveldb, str(tmp_path / "build3"))
+
+
+def test_appended_messages_match_build(world, watcher, tmp_path):
+    (leveldb, records) = world
+    leveldb.put(records[:1000])
+    assert watcher.poll()
+
+    # Ids no longer in time order, so LevelDB hands the new messages over
+    # out of order; no markers, so they are counted in place
+    rng = random.Random(0)
+    appended = [
+        dict(raw, _id=f"{rng.getrandbits(64):016x}")
+        for raw in records[1000:]
+        if not is_marker(raw.get("content", ""))
+    ]
+    leveldb.put(appended)
+    watcher.sync()
+    assert watcher.ingest() == (len(appended), 0)
+    assert watcher.aggregates is not None
+    watcher.publish()
+    assert_matches_build(leveldb, str(tmp_path / "build"))
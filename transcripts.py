@@ -0,0 +1,219 @@
+import argparse
+import hashlib
+import html
+import json
+import os
+from typing import Any, Dict, Iterator, List, TextIO, Tuple
+
+from core.models import Message
+from core.stats import session_ranges
+from core.timing import format_timings, timed
+from markup import converter_version, sanitize_html, to_markdown
+
+# Readable per-session transcripts of a world's chat, as Markdown or HTML.
+# Each session is rendered straight to its file one message at a time, and
+# only sessions whose messages changed since the last export are rendered.
+
+CACHE_FILE = ".transcripts.json"
+# 2: chat content in HTML transcripts is sanitized
+CACHE_VERSION = 2
+FORMATS = ["md", "html"]
+
+
+def speaker(message: Message) -> str:
+    if message.alias and message.alias != message.user:
+        return f"{message.alias} ({message.user})"
+    return str(message.user)
+
+
+def rolls(message: Message) -> List[str]:
+    return [f"{roll.formula} = {roll.total}" for roll in message.rolls]
+
+
+def session_hash(messages: List[Message]) -> str:
+    # Everything a transcript shows of each message
+    digest = hashlib.sha1()
+    for message in messages:
+        digest.update(
+            repr(
+                (
+                    message.raw.get("_id"),
+                    message.timestamp,
+                    message.user,
+                    message.alias,
+                    message.content,
+                    rolls(message),
+                )
+            ).encode()
+        )
+    return digest.hexdigest()
+
+
+def write_markdown(f: TextIO, title: str, messages: List[Message]):
+    f.write(f"# {title}\n")
+    for message in messages:
+        f.write(f"\n**{speaker(message)}** · {message.time:%H:%M:%S}\n\n")
+        content = to_markdown(message.content).strip() if message.content else ""
+        if content:
+            f.write(content + "\n")
+        for roll in rolls(message):
+            f.write(f"\n> Rolled `{roll}`\n")
+
+
+def write_html(f: TextIO, title: str, messages: List[Message]):
+    f.write(
+        "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+        f"<title>{html.escape(title)}</title>\n</head>\n<body>\n"
+        f"<h1>{html.escape(title)}</h1>\n"
+    )
+    for message in messages:
+        f.write(
+            '<div class="message">'
+            f'<span class="speaker">{html.escape(speaker(message))}</span> '
+            f'<time datetime="{message.time.isoformat()}">'
+            f"{message.time:%H:%M:%S}</time>"
+            # Foundry stores chat content as HTML already, written by anyone
+            f'<div class="content">{sanitize_html(message.content or "")}</div>'
+        )
+        for roll in rolls(message):
+            f.write(f'<div class="roll">{html.escape(roll)}</div>')
+        f.write("</div>\n")
+    f.write("</body>\n</html>\n")
+
+
+WRITERS = {"md": write_markdown, "html": write_html}
+
+
+def sessions(messages: List[Message]) -> Iterator[Tuple[str, List[Message]]]:
+    # (name, messages) per session, named after the day it started
+    for (start, end) in session_ranges(messages):
+        yield f"{messages[start].time:%Y-%m-%d}", messages[start:end]
+
+
+def load_cache(directory: str, format: str) -> Dict[str, str]:
+    """
+    The hash of each transcript's messages, by file name, as of the last
+    export to `directory`. A cache for another format or markdownify
+    version is ignored.
+    """
+    path = os.path.join(directory, CACHE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        cache = json.load(f)
+    header = {"version": CACHE_VERSION, "format": format}
+    if format == "md":
+        header["markdownify"] = converter_version()
+    if any(cache.get(key) != value for (key, value) in header.items()):
+        return {}
+    return cache["sessions"]
+
+
+def save_cache(directory: str, format: str, hashes: Dict[str, str]):
+    cache: Dict[str, Any] = {"version": CACHE_VERSION, "format": format}
+    if format == "md":
+        cache["markdownify"] = converter_version()
+    cache["sessions"] = hashes
+    path = os.path.join(directory, CACHE_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(cache, f, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+
+def export_transcripts(
+    world_name: str,
+    messages: List[Message],
+    directory: str = "./transcripts",
+    format: str = "md",
+) -> Dict[str, float]:
+    """
+    Writes one transcript per session of `messages` (sorted, as loaded) to
+    `{directory}/{world_name}_{start date}.{format}`, plus an index of them.
+    Sessions are split as `core.stats.group_sessions` splits them. Sessions
+    that did not change since the last export are left alone and
+    transcripts of sessions that no longer exist are removed.
+    """
+    timings: Dict[str, float] = {}
+    os.makedirs(directory, exist_ok=True)
+    old = load_cache(directory, format)
+    hashes: Dict[str, str] = {}
+    written = 0
+    index = []
+    reused = to_markdown.cache_info().hits
+
+    for (name, session) in sessions(messages):
+        filename = f"{world_name}_{name}.{format}"
+        with timed(timings, "hash"):
+            hashes[filename] = session_hash(session)
+        index.append((filename, name, len(session)))
+        path = os.path.join(directory, filename)
+        if old.get(filename) == hashes[filename] and os.path.exists(path):
+            continue
+        with timed(timings, "render"):
+            with open(f"{path}.tmp", "w") as f:
+                WRITERS[format](f, f"{world_name} {name}", session)
+            os.replace(f"{path}.tmp", path)
+        written += 1
+
+    with timed(timings, "write"):
+        removed = 0
+        for filename in old:
+            if filename not in hashes:
+                path = os.path.join(directory, filename)
+                if os.path.exists(path):
+                    os.remove(path)
+                    removed += 1
+        write_index(directory, world_name, format, index)
+        save_cache(directory, format, hashes)
+
+    print(
+        f"{len(hashes)} sessions: {written} written, {removed} removed"
+        f" ({to_markdown.cache_info().hits - reused} conversions reused)"
+    )
+    return timings
+
+
+def write_index(
+    directory: str, world_name: str, format: str, index: List[Tuple[str, str, int]]
+):
+    path = os.path.join(directory, f"{world_name}_index.{format}")
+    with open(path, "w") as f:
+        if format == "md":
+            f.write(f"# {world_name}\n\n")
+            for (filename, name, count) in index:
+                f.write(f"- [{name}]({filename}) ({count} messages)\n")
+        else:
+            f.write(
+                f"<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+                f"<title>{html.escape(world_name)}</title>\n</head>\n<body>\n"
+                f"<h1>{html.escape(world_name)}</h1>\n<ul>\n"
+            )
+            for (filename, name, count) in index:
+                f.write(
+                    f'<li><a href="{html.escape(filename)}">{html.escape(name)}</a>'
+                    f" ({count} messages)</li>\n"
+                )
+            f.write("</ul>\n</body>\n</html>\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a transcript of each session")
+    parser.add_argument("world_name")
+    parser.add_argument(
+        "location", help="a world export, world directory or snapshot"
+    )
+    parser.add_argument("--format", choices=FORMATS, default="md")
+    parser.add_argument("-o", "--output", default="./transcripts")
+    args = parser.parse_args()
+
+    from core.sources import load_messages, open_source
+
+    timings: Dict[str, float] = {}
+    try:
+        with timed(timings, "load"):
+            messages = load_messages(open_source(args.location, args.world_name))
+    except FileNotFoundError as e:
+        print(e)
+        exit(1)
+    timings |= export_transcripts(args.world_name, messages, args.output, args.format)
+    print(format_timings(timings))
@@ -0,0 +1,320 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Set, Tuple
+
+import plyvel
+
+from core.aggregates import Aggregates
+from core.models import Message
+from core.output import write_stats
+from core.query import APRIL_FOOLS_MARKERS, is_marker
+from core.rollups import save_report
+from core.search import open_search_index
+from core.sources import leveldb_user_map, parse_message
+from core.stats import apply_april_fools_filter, build_d20_data
+from core.timing import format_timings, timed
+
+Signature = Dict[str, Tuple[int, int]]
+
+
+def directory_signature(path: str) -> Signature:
+    signature = {}
+    for entry in os.scandir(path):
+        if entry.is_file() and entry.name != "LOCK":
+            stat = entry.stat()
+            signature[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return signature
+
+
+def sync_mirror(src: str, dst: str, previous: Signature) -> Signature:
+    # Table files (.ldb) never change once written, so after the first sync
+    # only the log, MANIFEST and CURRENT get copied again
+    os.makedirs(dst, exist_ok=True)
+    signature = directory_signature(src)
+    for (name, sig) in list(signature.items()):
+        if previous.get(name) == sig:
+            continue
+        try:
+            shutil.copy2(os.path.join(src, name), os.path.join(dst, name))
+        except FileNotFoundError:
+            # Compacted away mid-sync; the next poll sees the new layout
+            del signature[name]
+    for name in previous:
+        if name not in signature and os.path.exists(os.path.join(dst, name)):
+            os.remove(os.path.join(dst, name))
+    return signature
+
+
+@contextmanager
+def open_mirror(mirror: str) -> Iterator[plyvel.DB]:
+    # Opening a LevelDB replays its log into new files, so never open the
+    # mirror itself. Open a throwaway copy instead, with the immutable table
+    # files hard linked rather than copied.
+    scratch = tempfile.mkdtemp(prefix="leveldb_")
+    try:
+        for name in os.listdir(mirror):
+            src = os.path.join(mirror, name)
+            if name.endswith(".ldb") or name.endswith(".sst"):
+                os.link(src, os.path.join(scratch, name))
+            else:
+                shutil.copy2(src, os.path.join(scratch, name))
+        db = plyvel.DB(scratch, create_if_missing=False)
+        try:
+            yield db
+        finally:
+            db.close()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+class WorldWatcher(object):
+    """
+    Keeps a world's parsed messages in memory and republishes its stats
+    whenever Foundry writes to the world's LevelDB stores.
+
+    Foundry holds the LevelDB lock while the world is running, so the stores
+    are read through private mirrors. Every record is checksummed and only
+    new or changed records are decoded into `Message`s; removed records are
+    dropped.
+
+    The published `Aggregates` are kept in step with those changes, so
+    publishing does not count every message again. A change that could
+    move an April Fools range (a marker, or anything at or before the last
+    one) makes the next `publish` recount from scratch instead, as does
+    changing or removing a counted message, since the distribution sketches
+    cannot forget a value. Streaks, sketches and the order of characters
+    depend on the order messages are counted in, so new messages are only
+    added after the last one counted, in `sort_key` order, and anything
+    sorting before it also forces a recount. The search index is likewise
+    only told about the messages that changed.
+    """
+
+    def __init__(
+        self,
+        world_name: str,
+        players: List[str],
+        path: str | None = None,
+        directory: str = "./public",
+        compress: bool = False,
+    ):
+        self.world_name = world_name
+        self.players = players
+        self.path = f"./{world_name}" if path is None else path
+        self.directory = directory
+        self.compress = compress
+
+        self.mirror = tempfile.mkdtemp(prefix=f"{world_name}_")
+        self.signatures: Dict[str, Signature] = {"users": {}, "messages": {}}
+        self.user_map: Dict[str | None, str] = {}
+        self.checksums: Dict[bytes, int] = {}
+        self.messages: Dict[bytes, Message] = {}
+
+        # Accumulated over the filtered messages, None when stale
+        self.aggregates: Aggregates | None = None
+        # The `sort_key` of the last message accumulated
+        self.last_counted: Tuple[int, bytes] | None = None
+        self.last_marker: int | None = None
+        self.in_april_fools = False
+        # Keys of messages changed since the search index was last updated,
+        # None to check every message against it
+        self.unindexed: Set[bytes] | None = None
+
+    def sync(self) -> List[str]:
+        changed = []
+        for (store, previous) in self.signatures.items():
+            signature = sync_mirror(
+                f"{self.path}/data/{store}", f"{self.mirror}/{store}", previous
+            )
+            if signature != previous:
+                changed.append(store)
+            self.signatures[store] = signature
+        return changed
+
+    def ingest(self, reload_users: bool = False) -> Tuple[int, int]:
+        if reload_users:
+            with open_mirror(f"{self.mirror}/users") as db:
+                user_map = leveldb_user_map(db)
+            if user_map != self.user_map:
+                # Names are baked into each Message, so decode everything again
+                self.user_map = user_map
+                self.checksums.clear()
+                self.aggregates = None
+
+        updated = 0
+        seen = set()
+        added: List[Tuple[Tuple[int, bytes], Message]] = []
+        with open_mirror(f"{self.mirror}/messages") as db:
+            for (key, value) in db:
+                seen.add(key)
+                checksum = zlib.crc32(value)
+                if self.checksums.get(key) == checksum:
+                    continue
+                self.checksums[key] = checksum
+                message = parse_message(value.decode(), self.user_map)
+                self.account(self.messages.pop(key, None), -1)
+                if message is not None:
+                    self.messages[key] = message
+                    if self.account(message, 1):
+                        added.append((self.sort_key(key), message))
+                if self.unindexed is not None:
+                    self.unindexed.add(key)
+                updated += 1
+
+        removed = [key for key in self.checksums if key not in seen]
+        for key in removed:
+            del self.checksums[key]
+            self.account(self.messages.pop(key, None), -1)
+            if self.unindexed is not None:
+                self.unindexed.add(key)
+
+        # LevelDB returns records by key, not by time
+        added.sort(key=lambda item: item[0])
+        if self.aggregates is not None and len(added) > 0:
+            if self.last_counted is not None and added[0][0] < self.last_counted:
+                self.aggregates = None
+            else:
+                for (_, message) in added:
+                    self.aggregates.add(message)
+                self.last_counted = added[-1][0]
+
+        return updated, len(removed)
+
+    def sort_key(self, key: bytes) -> Tuple[int, bytes]:
+        # By time, ties in LevelDB key order, as a build reads them: which
+        # of them an April Fools marker covers depends on it
+        return (self.messages[key].timestamp, key)
+
+    def sorted_keys(self) -> List[bytes]:
+        return sorted(self.messages, key=self.sort_key)
+
+    def sorted_messages(self) -> List[Message]:
+        return [self.messages[key] for key in self.sorted_keys()]
+
+    def account(self, message: Message | None, sign: int) -> bool:
+        """
+        Marks the aggregates stale if counting or uncounting `message`
+        cannot be done in place. True if `message` is to be added to them.
+        """
+        if message is None or self.aggregates is None:
+            return False
+        if is_marker(message.content) or (
+            self.last_marker is not None and message.timestamp <= self.last_marker
+        ):
+            self.aggregates = None
+            return False
+        if self.in_april_fools:
+            # Filtered out, as is everything after an unclosed marker
+            return False
+        if sign < 0:
+            self.aggregates = None
+            return False
+        return True
+
+    def recount(self, messages: List[Message]):
+        # `messages` sorted but not yet filtered
+        self.last_marker = None
+        self.in_april_fools = False
+        for message in messages:
+            if is_marker(message.content):
+                self.last_marker = message.timestamp
+                self.in_april_fools = (
+                    APRIL_FOOLS_MARKERS[0] in message.content
+                    and APRIL_FOOLS_MARKERS[1] not in message.content
+                )
+        self.aggregates = Aggregates.from_messages(apply_april_fools_filter(messages))
+
+    def index(self):
+        with open_search_index(self.world_name) as index:
+            if self.unindexed is None:
+                index.update_messages(self.messages.values())
+            else:
+                changed = [key for key in self.unindexed if key in self.messages]
+                index.update_messages(
+                    [self.messages[key] for key in changed], complete=False
+                )
+                # Message keys are "!messages!{id}"
+                index.remove_messages(
+                    key.decode().rsplit("!", 1)[-1]
+                    for key in self.unindexed
+                    if key not in self.messages
+                )
+        self.unindexed = set()
+
+    def publish(self) -> Dict[str, float]:
+        timings: Dict[str, float] = {}
+        with timed(timings, "search_index"):
+            self.index()
+        messages = self.sorted_messages()
+        if self.aggregates is None:
+            with timed(timings, "generate_data"):
+                self.recount(messages)
+                self.last_counted = max(map(self.sort_key, self.messages), default=None)
+        messages = apply_april_fools_filter(messages)
+        (d20_data, tables) = build_d20_data(
+            messages, self.players, timings, self.aggregates
+        )
+        with timed(timings, "write_stats"):
+            write_stats(
+                self.world_name,
+                self.players,
+                d20_data,
+                tables,
+                directory=self.directory,
+                compress=self.compress,
+            )
+            save_report(self.world_name, d20_data)
+        return timings
+
+    def poll(self) -> bool:
+        timings: Dict[str, float] = {}
+        with timed(timings, "sync"):
+            changed = self.sync()
+        if len(changed) == 0:
+            return False
+
+        with timed(timings, "ingest"):
+            updated, removed = self.ingest(reload_users="users" in changed)
+        if updated == 0 and removed == 0:
+            return False
+
+        print(f"{updated} new or changed, {removed} removed messages")
+        timings |= self.publish()
+        print(format_timings(timings))
+        return True
+
+    def run_forever(self, interval: float = 2.0):
+        while True:
+            self.poll()
+            time.sleep(interval)
+
+    def close(self):
+        shutil.rmtree(self.mirror, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Republish a world's stats whenever its chat log changes"
+    )
+    parser.add_argument("world_name")
+    parser.add_argument("players", nargs="*")
+    parser.add_argument("--path", help="world directory, ./{world_name} by default")
+    parser.add_argument(
+        "--interval", type=float, default=2.0, help="seconds between polls"
+    )
+    parser.add_argument("--compress", action="store_true")
+    args = parser.parse_args()
+
+    watcher = WorldWatcher(
+        args.world_name, args.players, path=args.path, compress=args.compress
+    )
+    try:
+        watcher.run_forever(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()